@@ -0,0 +1,208 @@
+'''
+Accelerated functions
+
+Optional numba versions of the loops at the core of
+* sampling arrivals by thinning (`nspp_arrival_times` in queueing_functions)
+* first-come-first-served multi-server stages (`fifo_multi_server`)
+* the running count of patients in each state (`state_occupancy_changes` in
+  output_animation_functions)
+
+numba is not installed in the browser (pyodide), so it is not a
+requirement of the app. When it isn't installed, `numba_enabled()` is False
+and the callers use their numpy versions instead. Both give identical
+results; the kernels here just do the same arithmetic in the same order in
+compiled loops.
+
+The kernels are plain python functions until compiled by `jit`, and are
+only called when numba is enabled.
+'''
+
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+# Whether the callers should use the kernels (see use_numba)
+_settings = {'use_numba': NUMBA_AVAILABLE}
+
+
+def jit(function):
+    '''
+    Compile a kernel with numba (caching the compiled version on disk),
+    or return it unchanged if numba isn't installed.
+    '''
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+def numba_enabled():
+    '''
+    Whether the numba kernels should be used
+
+    Returns:
+    --------
+    bool
+    '''
+    return _settings['use_numba']
+
+
+@contextmanager
+def use_numba(enabled=True):
+    '''
+    Use (or don't use) the numba kernels inside the `with` block,
+    e.g. to compare the time taken with and without them.
+
+    Params:
+    -------
+    enabled: bool, optional (default=True)
+        Ignored (treated as False) if numba isn't installed
+    '''
+    previous = _settings['use_numba']
+    _settings['use_numba'] = enabled and NUMBA_AVAILABLE
+    try:
+        yield
+    finally:
+        _settings['use_numba'] = previous
+
+
+@jit
+def thinning_kernel(gaps, uniforms, thresholds, now, rc_period, arrivals, n_arrivals):
+    '''
+    Arrival times of one replication, sampled by thinning as the arrivals
+    generators of the models do.
+
+    The gap to each arrival is the sum of candidate gaps up to and including
+    the first whose uniform sample is below the threshold for the hour of
+    the previous arrival. For arrivals that aren't thinned, pass uniforms of
+    zero and a threshold of one.
+
+    Stops when the next arrival would be at or after rc_period, or when
+    it runs out of candidates or room in `arrivals` (so it can be called
+    again, with more candidates, to carry on).
+
+    Params:
+    -------
+    gaps, uniforms: numpy.ndarray
+        Candidate gaps and their uniform samples
+
+    thresholds: numpy.ndarray
+        lambda_t / lambda_max for each hour
+
+    now: float
+        Time of the previous arrival
+
+    rc_period: float
+
+    arrivals: numpy.ndarray
+        Filled in with the arrival times from index n_arrivals
+
+    n_arrivals: int
+        Number of arrivals already in `arrivals`
+
+    Returns:
+    --------
+    tuple
+        (time of the last arrival, number of arrivals, number of candidates
+        used by those arrivals, whether rc_period was reached)
+    '''
+    used = 0
+
+    while n_arrivals < len(arrivals):
+        threshold = thresholds[int(now // 60) % len(thresholds)]
+        interarrival_time = 0.0
+        candidate = used
+
+        while True:
+            if candidate == len(gaps):
+                return now, n_arrivals, used, False
+            interarrival_time += gaps[candidate]
+            candidate += 1
+            if uniforms[candidate - 1] < threshold:
+                break
+
+        used = candidate
+        now = now + interarrival_time
+
+        if now >= rc_period:
+            return now, n_arrivals, used, True
+
+        arrivals[n_arrivals] = now
+        n_arrivals += 1
+
+    return now, n_arrivals, used, False
+
+
+@jit
+def fifo_kernel(arrival_times, durations, n_servers, start, end, server):
+    '''
+    Start and end times of a first-come-first-served stage with `n_servers`
+    servers, as `fifo_multi_server` works them out.
+
+    Params:
+    -------
+    arrival_times, durations: numpy.ndarray
+        One row per replication, in order of arrival
+
+    n_servers: int
+
+    start, end, server: numpy.ndarray
+        Filled in with the start and end times and server ids (from 1)
+    '''
+    for rep in range(arrival_times.shape[0]):
+        free_at = np.zeros(n_servers)
+
+        for patient in range(arrival_times.shape[1]):
+            soonest = 0
+            for candidate in range(1, n_servers):
+                if free_at[candidate] < free_at[soonest]:
+                    soonest = candidate
+
+            begins = arrival_times[rep, patient]
+            if free_at[soonest] > begins:
+                begins = free_at[soonest]
+
+            start[rep, patient] = begins
+            end[rep, patient] = begins + durations[rep, patient]
+            free_at[soonest] = end[rep, patient]
+            server[rep, patient] = soonest + 1
+
+
+@jit
+def running_totals_kernel(new_group, new_time, deltas):
+    '''
+    The running total of the changes in each group at each distinct time.
+
+    Params:
+    -------
+    new_group, new_time: numpy.ndarray of bool
+        Whether each change starts a new group, and whether it is at a
+        different time to the change before (or starts a new group)
+
+    deltas: numpy.ndarray
+        Changes, sorted by group then time
+
+    Returns:
+    --------
+    numpy.ndarray
+        One total per distinct time in each group
+    '''
+    totals = np.empty(new_time.sum(), dtype=np.int64)
+    total = 0
+    position = -1
+
+    for change in range(len(deltas)):
+        if new_group[change]:
+            total = 0
+        if new_time[change]:
+            position += 1
+        total += deltas[change]
+        totals[position] = total
+
+    return totals
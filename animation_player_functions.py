@@ -0,0 +1,568 @@
+'''
+A lightweight player for the animated patient log.
+
+A plotly animation sends the position of every patient in every frame.
+The player instead sends a compact JSON of the points at which each
+patient's position changes, and a small HTML/JS page (shown with
+streamlit.components.v1.html) moves the patients between these points
+in the browser.
+
+It uses the same event_position_df layout, queue wrapping and background
+images as `animate_activity_log`.
+
+`check_animation_player` checks a generated page without a browser, by
+reading the JSON back out of it.
+'''
+
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from output_animation_functions import (animate_activity_log, axis_ranges, clock_labels,
+                                        queue_position)
+
+# Height (pixels) of the play button, slider and clock below the player
+PLAYER_CONTROLS_HEIGHT = 110
+
+
+def animation_player_data(
+        full_patient_df,
+        event_position_df,
+        scenario,
+        rep=1,
+        wrap_queues_at=None,
+        max_queue_icons=None,
+        display_stage_labels=True,
+        override_x_max=None,
+        override_y_max=None,
+        time_display_units=None,
+        start_datetime=None
+        ):
+    """
+    The data played by the animation player.
+
+    Patients are positioned exactly as in `animate_activity_log`. Rather
+    than a position for every patient in every snapshot, only the points
+    at which a patient appears, moves or leaves the screen are kept.
+
+    Args:
+        full_patient_df, event_position_df, scenario, rep, wrap_queues_at,
+        max_queue_icons, display_stage_labels, override_x_max, override_y_max,
+        time_display_units, start_datetime:
+            As for animate_activity_log
+
+    Returns:
+        dict that can be converted to JSON, with columns of values as lists:
+        - 'x_max', 'y_max': the axis ranges
+        - 'step': minutes between snapshots
+        - 'minutes', 'labels': each snapshot, and the label shown for it
+        - 'icons': the distinct icons used
+        - 'patients': 'id' and 'icon' (index into 'icons') of each patient
+        - 'changes': 'patient' (index into 'patients'), 'minute', 'x' and 'y'
+          of each change, sorted by patient and minute. x and y are None
+          when the patient leaves the screen.
+        - 'queues': 'x' and 'y' of the "+K more" label of each capped queue
+        - 'queue_counts': 'queue' (index into 'queues'), 'minute' and
+          'count' of each change in the number of people not drawn
+        - 'resources': 'x' and 'y' of each resource
+        - 'stage_labels': 'x', 'y' and 'text' of each stage label
+          (with any <br> replaced by a new line)
+    """
+    df = animate_activity_log(full_patient_df,
+                              event_position_df,
+                              scenario,
+                              rep=rep,
+                              wrap_queues_at=wrap_queues_at,
+                              max_queue_icons=max_queue_icons,
+                              return_df_only=True)
+
+    df = df[df['x_final'].notna() & df['y_final'].notna()].sort_values(
+        ['patient', 'minute'], kind='stable')
+
+    x_max, y_max = axis_ranges(event_position_df, override_x_max, override_y_max)
+
+    minutes = np.unique(df['minute'].to_numpy())
+    step = int(np.diff(minutes).min()) if len(minutes) > 1 else 1
+
+    if time_display_units == "dhm":
+        labels = clock_labels(pd.Series(minutes), start_datetime)[0].astype(str).tolist()
+    else:
+        labels = [str(minute) for minute in minutes]
+
+    # patients and their icons
+    patients, patient_index = np.unique(df['patient'].to_numpy(), return_inverse=True)
+    icons, icon_index = np.unique(
+        df.groupby('patient')['icon'].first().reindex(patients).to_numpy(),
+        return_inverse=True)
+
+    # A row continues the previous one if it's the same patient at the next snapshot.
+    # Keep the rows that don't continue the previous row or that move the patient,
+    # and add a change that takes the patient off screen after any row that isn't
+    # continued by the next one.
+    minute = df['minute'].to_numpy()
+    x = np.round(df['x_final'].to_numpy(dtype=float)).astype(int)
+    y = np.round(df['y_final'].to_numpy(dtype=float)).astype(int)
+
+    continues = np.r_[False, (patient_index[1:] == patient_index[:-1]) &
+                             (np.diff(minute) == step)]
+    moved = ~continues | np.r_[False, (x[1:] != x[:-1]) | (y[1:] != y[:-1])]
+    leaves = ~np.r_[continues[1:], False]
+
+    changes = pd.concat([
+        pd.DataFrame({'patient': patient_index[moved], 'minute': minute[moved],
+                      'x': x[moved], 'y': y[moved]}),
+        pd.DataFrame({'patient': patient_index[leaves], 'minute': minute[leaves] + step,
+                      'x': None, 'y': None})
+    ]).sort_values(['patient', 'minute'], kind='stable')
+
+    # labels of people not drawn in capped queues, in the same form
+    if 'queue_overflow' in df.columns:
+        overflow = df[df['queue_overflow'] > 0]
+    else:
+        overflow = df.iloc[0:0].assign(queue_overflow=0, overflow_x=0, overflow_y=0)
+
+    queues = overflow.groupby('event', observed=True)[['overflow_x', 'overflow_y']] \
+                     .first().round().astype(int)
+    counts = overflow.pivot_table(values='queue_overflow', index='minute', columns='event',
+                                  aggfunc='sum', observed=True) \
+                     .reindex(index=minutes, columns=queues.index).fillna(0).astype(int)
+    counts_changed = counts.diff().fillna(counts).ne(0)
+    queue_counts = counts.where(counts_changed).reset_index(drop=True) \
+                         .set_axis(range(len(queues)), axis=1) \
+                         .melt(ignore_index=False, var_name='queue', value_name='count') \
+                         .dropna()
+    queue_counts['minute'] = minutes[queue_counts.index]
+    queue_counts = queue_counts.sort_values(['queue', 'minute'])
+
+    # resources, drawn as in animate_activity_log
+    resources = [(row['x'] - 10 * (i + 1), row['y'] - 10)
+                 for _, row in event_position_df[event_position_df['resource'].notnull()].iterrows()
+                 for i in range(getattr(scenario, row['resource']))]
+
+    if display_stage_labels and 'label' in event_position_df.columns:
+        stage_labels = event_position_df[event_position_df['label'].notnull()]
+    else:
+        stage_labels = event_position_df.iloc[0:0].assign(label=None)
+
+    return {
+        'x_max': float(x_max),
+        'y_max': float(y_max),
+        'step': step,
+        'minutes': minutes.tolist(),
+        'labels': labels,
+        'icons': icons.tolist(),
+        'patients': {'id': patients.tolist(),
+                     'icon': icon_index.tolist()},
+        'changes': {'patient': changes['patient'].tolist(),
+                    'minute': changes['minute'].tolist(),
+                    'x': changes['x'].tolist(),
+                    'y': changes['y'].tolist()},
+        'queues': {'x': queues['overflow_x'].tolist(),
+                   'y': queues['overflow_y'].tolist()},
+        'queue_counts': {'queue': queue_counts['queue'].tolist(),
+                         'minute': queue_counts['minute'].tolist(),
+                         'count': queue_counts['count'].astype(int).tolist()},
+        'resources': {'x': [float(r[0]) for r in resources],
+                      'y': [float(r[1]) for r in resources]},
+        'stage_labels': {'x': [float(pos + 10) for pos in stage_labels['x']],
+                         'y': [float(pos) for pos in stage_labels['y']],
+                         'text': stage_labels['label'].astype(str)
+                                                      .str.replace('<br>', '\n').tolist()}
+    }
+
+
+def animation_player_html(
+        full_patient_df,
+        event_position_df,
+        scenario,
+        player_width=1200,
+        player_height=700,
+        add_background_image=None,
+        icon_and_text_size=24,
+        frame_duration=400, #milliseconds
+        **data_options
+        ):
+    """
+    The animation player as an HTML page, to show with
+    streamlit.components.v1.html(html, height=player_height + PLAYER_CONTROLS_HEIGHT)
+
+    Args:
+        full_patient_df, event_position_df, scenario:
+            As for animate_activity_log
+
+        player_width, player_height (int, optional): Defaults to 1200 and 700.
+            Size of the animation in pixels (excluding the controls)
+
+        add_background_image (str, optional): Defaults to None.
+            URL of an image stretched to fill the animation,
+            as for animate_activity_log
+
+        icon_and_text_size (int, optional): Defaults to 24.
+
+        frame_duration (int, optional): Defaults to 400 (milliseconds).
+            Time taken to play each snapshot
+
+        **data_options:
+            Any other arguments for animation_player_data
+
+    Returns:
+        str
+    """
+    player_data = animation_player_data(full_patient_df, event_position_df, scenario,
+                                        **data_options)
+
+    player_options = {'width': player_width,
+                      'height': player_height,
+                      'background_image': add_background_image,
+                      'icon_and_text_size': icon_and_text_size,
+                      'frame_duration': frame_duration}
+
+    # "</" would end the script tag early if it appeared in a label
+    def to_script(value):
+        return json.dumps(value, separators=(',', ':')).replace('</', '<\\/')
+
+    return ANIMATION_PLAYER_TEMPLATE \
+        .replace('__PLAYER_DATA__', to_script(player_data)) \
+        .replace('__PLAYER_OPTIONS__', to_script(player_options))
+
+
+def player_json(html, name):
+    """
+    Read back one of the JSON values written into the player's script.
+
+    Args:
+        html (str): As returned by animation_player_html
+        name (str): 'data' or 'options'
+
+    Returns:
+        dict
+    """
+    match = re.search(rf'^const {name} = (.*);$', html, flags=re.MULTILINE)
+    if match is None:
+        raise ValueError(f'The animation player has no {name}')
+    return json.loads(match.group(1))
+
+
+# The columns of each table in the player data (see animation_player_data)
+PLAYER_DATA_TABLES = {'patients': ['id', 'icon'],
+                      'changes': ['patient', 'minute', 'x', 'y'],
+                      'queues': ['x', 'y'],
+                      'queue_counts': ['queue', 'minute', 'count'],
+                      'resources': ['x', 'y'],
+                      'stage_labels': ['x', 'y', 'text']}
+
+
+def player_data_problems(player_data, event_position_df, scenario, wrap_queues_at=None,
+                         max_queue_icons=None):
+    """
+    Check the data played by the animation player.
+
+    Checks that every value is present with the right length, that the
+    indexes between the tables are in range, that the changes are sorted
+    by patient and minute and happen at snapshots, and that every
+    position a patient moves to is one of the positions
+    `animate_activity_log` gives to the events in event_position_df
+    (a place in the queue, or one of the resources).
+
+    Args:
+        player_data (dict): As returned by animation_player_data (or read
+            back from the page with player_json)
+        event_position_df, scenario, wrap_queues_at, max_queue_icons:
+            As passed to animation_player_data
+
+    Returns:
+        list of str: A description of each problem found (empty if none)
+    """
+    expected_keys = {'x_max', 'y_max', 'step', 'minutes', 'labels', 'icons',
+                     *PLAYER_DATA_TABLES}
+    missing = expected_keys - set(player_data)
+    if missing:
+        return [f'missing {sorted(missing)}']
+
+    problems = []
+
+    for table, columns in PLAYER_DATA_TABLES.items():
+        if set(player_data[table]) != set(columns):
+            problems.append(f'{table} has the columns {sorted(player_data[table])}, '
+                            f'not {sorted(columns)}')
+        elif len({len(player_data[table][column]) for column in columns}) > 1:
+            problems.append(f'the columns of {table} have different lengths')
+    if problems:
+        return problems
+
+    minutes = np.array(player_data['minutes'])
+    step = player_data['step']
+    if len(player_data['labels']) != len(minutes):
+        problems.append('there is not one label per snapshot')
+    if np.any(np.diff(minutes) <= 0) or np.any(np.diff(minutes) % step != 0):
+        problems.append('the snapshots are not in order, a multiple of step apart')
+
+    patients = player_data['patients']
+    if not all(0 <= icon < len(player_data['icons']) for icon in patients['icon']):
+        problems.append('a patient has an icon that is out of range')
+
+    changes = pd.DataFrame(player_data['changes'])
+    if not changes['patient'].between(0, len(patients['id']) - 1).all():
+        problems.append('a change is for a patient that is out of range')
+    if not changes.equals(changes.sort_values(['patient', 'minute'], kind='stable')):
+        problems.append('the changes are not sorted by patient and minute')
+    if not changes['minute'].isin(np.r_[minutes, minutes + step]).all():
+        problems.append('a change is not at a snapshot')
+
+    # every position of each event (patients are placed at whole numbers)
+    positions = set()
+    resources = event_position_df['resource'] if 'resource' in event_position_df.columns \
+        else pd.Series(None, index=event_position_df.index)
+    longest_queue = max_queue_icons if max_queue_icons is not None \
+        else len(patients['id'])
+    for (_, row), resource in zip(event_position_df.iterrows(), resources):
+        if pd.notnull(resource):
+            places = (row['x'] - 10 * (1 + np.arange(getattr(scenario, resource))),
+                      np.full(getattr(scenario, resource), row['y']))
+        else:
+            places = queue_position(row['x'], row['y'],
+                                    1 + np.arange(longest_queue), wrap_queues_at)
+        positions.update(zip(np.round(np.asarray(places[0], dtype=float)).astype(int),
+                             np.round(np.asarray(places[1], dtype=float)).astype(int)))
+
+    shown = changes.dropna(subset=['x', 'y'])
+    unknown = [position for position in zip(shown['x'].astype(int), shown['y'].astype(int))
+               if position not in positions]
+    if unknown:
+        problems.append(f'{len(unknown)} changes move a patient to a position that is not '
+                        f'in event_position_df, e.g. {unknown[0]}')
+
+    queue_counts = player_data['queue_counts']
+    if not all(0 <= queue < len(player_data['queues']['x']) for queue in queue_counts['queue']):
+        problems.append('a queue count is for a queue that is out of range')
+    if not all(minute in set(player_data['minutes']) for minute in queue_counts['minute']):
+        problems.append('a queue count is not at a snapshot')
+
+    n_resources = sum(getattr(scenario, resource) for resource in resources.dropna())
+    if len(player_data['resources']['x']) != n_resources:
+        problems.append(f"there are {len(player_data['resources']['x'])} resources, "
+                        f"not {n_resources}")
+
+    return problems
+
+
+def check_animation_player(html, event_position_df, scenario, wrap_queues_at=None,
+                           max_queue_icons=None, add_background_image=None):
+    """
+    Check the animation player page offline (without a browser).
+
+    Checks that the page is self contained (every placeholder in the
+    template filled in, and nothing loaded from elsewhere apart from the
+    background image), then reads the data back out of the page and
+    checks it with player_data_problems.
+
+    Args:
+        html (str): As returned by animation_player_html
+        event_position_df, scenario, wrap_queues_at, max_queue_icons,
+        add_background_image:
+            As passed to animation_player_html
+
+    Raises:
+        ValueError: listing every problem found
+
+    Returns:
+        dict: The player data read back from the page
+    """
+    problems = []
+
+    placeholders = set(re.findall(r'__[A-Z_]+__', html))
+    if placeholders:
+        problems.append(f'unfilled placeholders {sorted(placeholders)}')
+    if html.count('<script') != 1 or html.count('</script>') != 1:
+        problems.append('the page should have exactly one inline script')
+    if re.search(r'<(?:script|img|link|iframe)[^>]*\b(?:src|href)=', html):
+        problems.append('the page loads a script, image or style from elsewhere')
+
+    urls = set(re.findall(r'https?://[^"\'\s)]+', html)) - {add_background_image}
+    if urls:
+        problems.append(f'the page refers to {sorted(urls)}')
+
+    # (json.JSONDecodeError is a ValueError)
+    try:
+        player_data = player_json(html, 'data')
+        options = player_json(html, 'options')
+    except ValueError as error:
+        player_data = None
+        problems.append(f'the data or options could not be read: {error}')
+
+    if player_data is not None:
+        if options.get('background_image') != add_background_image:
+            problems.append('the background image is not the one given')
+
+        problems += player_data_problems(player_data, event_position_df, scenario,
+                                         wrap_queues_at, max_queue_icons)
+
+    if problems:
+        raise ValueError('The animation player is not valid:\n' + '\n'.join(problems))
+
+    return player_data
+
+
+ANIMATION_PLAYER_TEMPLATE = """
+<div style="font-family: sans-serif;">
+    <canvas id="player"></canvas>
+    <div style="display: flex; align-items: center; gap: 10px;">
+        <button id="play" style="font-size: 20px; width: 50px;">&#9654;</button>
+        <input id="slider" type="range" style="flex: 1;">
+    </div>
+    <div id="clock" style="font-size: 35px; white-space: pre; line-height: 1.1;"></div>
+</div>
+
+<script>
+const data = __PLAYER_DATA__;
+const options = __PLAYER_OPTIONS__;
+
+const canvas = document.getElementById("player");
+const playButton = document.getElementById("play");
+const slider = document.getElementById("slider");
+const clock = document.getElementById("clock");
+const context = canvas.getContext("2d");
+
+canvas.width = options.width;
+canvas.height = options.height;
+
+const firstMinute = data.minutes[0];
+const lastMinute = data.minutes[data.minutes.length - 1] + data.step;
+
+slider.min = firstMinute;
+slider.max = lastMinute;
+slider.step = data.step;
+
+// Index of the last value in values[start:end] that is <= target (or start - 1)
+function lastAtOrBefore(values, target, start, end) {
+    let low = start, high = end;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (values[middle] <= target) { low = middle + 1; } else { high = middle; }
+    }
+    return low - 1;
+}
+
+// Where each patient's / queue's changes start (the changes are sorted by patient / queue)
+function groupStarts(groups, nGroups) {
+    const starts = new Int32Array(nGroups + 1);
+    for (const group of groups) { starts[group + 1]++; }
+    for (let i = 0; i < nGroups; i++) { starts[i + 1] += starts[i]; }
+    return starts;
+}
+
+const patientStarts = groupStarts(data.changes.patient, data.patients.icon.length);
+const queueStarts = groupStarts(data.queue_counts.queue, data.queues.x.length);
+
+function screenX(x) { return x / data.x_max * canvas.width; }
+function screenY(y) { return canvas.height - y / data.y_max * canvas.height; }
+
+let background = null;
+if (options.background_image) {
+    background = new Image();
+    background.onload = () => draw(minute);
+    background.src = options.background_image;
+}
+
+function draw(minute) {
+    const changes = data.changes;
+
+    context.clearRect(0, 0, canvas.width, canvas.height);
+
+    if (background && background.complete) {
+        context.globalAlpha = 0.5;
+        context.drawImage(background, 0, 0, canvas.width, canvas.height);
+    }
+
+    context.globalAlpha = 0.8;
+    context.fillStyle = "LightSkyBlue";
+    for (let i = 0; i < data.resources.x.length; i++) {
+        context.beginPath();
+        context.arc(screenX(data.resources.x[i]), screenY(data.resources.y[i]), 7.5, 0, 2 * Math.PI);
+        context.fill();
+    }
+
+    context.globalAlpha = 1;
+    context.fillStyle = "black";
+    context.font = options.icon_and_text_size + "px sans-serif";
+    context.textBaseline = "middle";
+
+    context.textAlign = "left";
+    for (let i = 0; i < data.stage_labels.x.length; i++) {
+        const lines = data.stage_labels.text[i].split("\\n");
+        lines.forEach((line, number) => context.fillText(
+            line,
+            screenX(data.stage_labels.x[i]),
+            screenY(data.stage_labels.y[i]) + (number - (lines.length - 1) / 2) * options.icon_and_text_size
+        ));
+    }
+
+    // Each patient stays where they are until the snapshot before their next change,
+    // and then moves in a straight line to reach the new position at the change
+    context.textAlign = "center";
+    for (let patient = 0; patient < data.patients.icon.length; patient++) {
+        const start = patientStarts[patient], end = patientStarts[patient + 1];
+        const i = lastAtOrBefore(changes.minute, minute, start, end);
+        if (i < start || changes.x[i] === null) { continue; }
+
+        let x = changes.x[i], y = changes.y[i];
+        const next = i + 1;
+        if (next < end && changes.x[next] !== null && minute > changes.minute[next] - data.step) {
+            const progress = (minute - (changes.minute[next] - data.step)) / data.step;
+            x += (changes.x[next] - x) * progress;
+            y += (changes.y[next] - y) * progress;
+        }
+
+        context.fillText(data.icons[data.patients.icon[patient]], screenX(x), screenY(y));
+    }
+
+    context.textAlign = "right";
+    for (let queue = 0; queue < data.queues.x.length; queue++) {
+        const i = lastAtOrBefore(data.queue_counts.minute, minute, queueStarts[queue], queueStarts[queue + 1]);
+        if (i < queueStarts[queue] || data.queue_counts.count[i] === 0) { continue; }
+        context.fillText("+" + data.queue_counts.count[i] + " more",
+                         screenX(data.queues.x[queue]), screenY(data.queues.y[queue]));
+    }
+
+    const snapshot = Math.max(lastAtOrBefore(data.minutes, minute, 0, data.minutes.length), 0);
+    clock.textContent = data.labels[snapshot];
+    slider.value = minute;
+}
+
+let minute = firstMinute;
+let playing = false;
+let previousTime = null;
+
+function tick(time) {
+    if (!playing) { return; }
+    if (previousTime !== null) {
+        minute = Math.min(minute + (time - previousTime) / options.frame_duration * data.step, lastMinute);
+    }
+    previousTime = time;
+    draw(minute);
+    if (minute >= lastMinute) { setPlaying(false); return; }
+    requestAnimationFrame(tick);
+}
+
+function setPlaying(play) {
+    playing = play;
+    previousTime = null;
+    playButton.innerHTML = play ? "&#9724;" : "&#9654;";
+    if (play) {
+        if (minute >= lastMinute) { minute = firstMinute; }
+        requestAnimationFrame(tick);
+    }
+}
+
+playButton.addEventListener("click", () => setPlaying(!playing));
+slider.addEventListener("input", () => {
+    setPlaying(false);
+    minute = Number(slider.value);
+    draw(minute);
+});
+
+draw(minute);
+</script>
+"""
@@ -0,0 +1,9 @@
+'''
+Scripts for measuring the speed and memory use of the model and
+the output functions, and for checking that changes made for speed
+don't change the results of the model.
+
+Each module can be run from the root of the repository, e.g.
+
+    python -m benchmarks.event_log_memory
+'''
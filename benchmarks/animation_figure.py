@@ -0,0 +1,193 @@
+'''
+Size and build time of the animated patient log.
+
+Runs the full model for 5 days, reshapes the first replication with a
+snapshot every 5 minutes (as on the Full Model page) and builds the
+animated figure both with plotly express and with the hand built frames
+used by `animate_activity_log` (with and without the frame budget
+options). Reports the time taken to build each figure and the size of its
+JSON (the payload sent to the browser), and the same for the lightweight
+animation player, after checking the player's page offline (see
+`check_animation_player`, which raises an error if it isn't valid).
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.animation_figure
+'''
+
+import argparse
+import time
+
+import pandas as pd
+
+from model_classes import Scenario, multiple_replications
+from output_animation_functions import reshape_for_animations, animate_activity_log
+from animation_player_functions import animation_player_html, check_animation_player
+
+RUN_DAYS = 5
+EVERY_X_MINUTES = 5
+
+# Layout used on the Full Model page
+EVENT_POSITIONS = pd.DataFrame([
+    {'event': 'triage_wait_begins', 'x': 160, 'y': 400},
+    {'event': 'triage_begins', 'x': 160, 'y': 315, 'resource': 'n_triage'},
+    {'event': 'MINORS_registration_wait_begins', 'x': 300, 'y': 145},
+    {'event': 'MINORS_registration_begins', 'x': 300, 'y': 85, 'resource': 'n_reg'},
+    {'event': 'MINORS_examination_wait_begins', 'x': 465, 'y': 145},
+    {'event': 'MINORS_examination_begins', 'x': 465, 'y': 85, 'resource': 'n_exam'},
+    {'event': 'MINORS_treatment_wait_begins', 'x': 630, 'y': 145},
+    {'event': 'MINORS_treatment_begins', 'x': 630, 'y': 85, 'resource': 'n_cubicles_1'},
+    {'event': 'TRAUMA_stabilisation_wait_begins', 'x': 300, 'y': 560},
+    {'event': 'TRAUMA_stabilisation_begins', 'x': 300, 'y': 500, 'resource': 'n_trauma'},
+    {'event': 'TRAUMA_treatment_wait_begins', 'x': 630, 'y': 560},
+    {'event': 'TRAUMA_treatment_begins', 'x': 630, 'y': 500, 'resource': 'n_cubicles_2'},
+    {'event': 'exit', 'x': 670, 'y': 330}
+])
+
+# Display options used on the Full Model page
+DISPLAY_OPTIONS = dict(
+    include_play_button=True,
+    plotly_height=900,
+    plotly_width=1600,
+    override_x_max=700,
+    override_y_max=675,
+    icon_and_text_size=24,
+    display_stage_labels=False,
+    wrap_queues_at=10,
+    time_display_units="dhm"
+)
+
+
+def animation_input(n_days=RUN_DAYS, every_x_minutes=EVERY_X_MINUTES, target_frames=None):
+    '''
+    Run the full model once and reshape the log for the animation.
+
+    target_frames is passed to `reshape_for_animations` (and overrides
+    every_x_minutes if given).
+
+    Returns:
+    --------
+    tuple
+        (Scenario, full_patient_df)
+    '''
+    scenario = Scenario(model="full")
+
+    event_log = multiple_replications(scenario,
+                                      rc_period=60 * 24 * n_days,
+                                      n_reps=1,
+                                      return_detailed_logs=True,
+                                      long_format=True)['full_event_log']
+
+    full_patient_df = reshape_for_animations(
+        event_log[event_log['event_type'].isin(['queue', 'resource_use', 'arrival_departure']) &
+                  (event_log['time'] <= 60 * 24 * n_days)],
+        every_x_minutes=every_x_minutes,
+        limit_duration=60 * 24 * n_days,
+        target_frames=target_frames
+    )['full_patient_df']
+
+    return scenario, full_patient_df[full_patient_df['minute'] <= 60 * 24 * n_days]
+
+
+def figure_report(scenario, full_patient_df, builders):
+    '''
+    Build the figure with each set of extra arguments to `animate_activity_log`
+    and measure it.
+
+    Params:
+    ------
+    builders: dict
+        {name: dictionary of extra arguments for animate_activity_log}
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Build time, number of frames, total points and JSON size per builder
+    '''
+    rows = []
+
+    for name, extra_options in builders.items():
+        start = time.perf_counter()
+        fig = animate_activity_log(full_patient_df,
+                                   EVENT_POSITIONS,
+                                   scenario,
+                                   **DISPLAY_OPTIONS,
+                                   **extra_options)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        payload = fig.to_json()
+        json_time = time.perf_counter() - start
+
+        rows.append({'builder': name,
+                     'build (s)': build_time,
+                     'to_json (s)': json_time,
+                     'frames': len(fig.frames),
+                     'points': sum(len(frame.data[0].x) for frame in fig.frames),
+                     'JSON (MB)': len(payload.encode('utf-8')) / 1024 ** 2})
+
+    return pd.DataFrame(rows).set_index('builder')
+
+
+def player_report(scenario, full_patient_df):
+    '''
+    Build the lightweight animation player, check it and measure it.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Build time, HTML size and number of changes, with and without
+        queues capped at 50 people
+    '''
+    rows = []
+
+    for max_queue_icons in [None, 50]:
+        start = time.perf_counter()
+        html = animation_player_html(full_patient_df,
+                                     EVENT_POSITIONS,
+                                     scenario,
+                                     wrap_queues_at=DISPLAY_OPTIONS['wrap_queues_at'],
+                                     time_display_units=DISPLAY_OPTIONS['time_display_units'],
+                                     max_queue_icons=max_queue_icons)
+        build_time = time.perf_counter() - start
+
+        player_data = check_animation_player(html,
+                                             EVENT_POSITIONS,
+                                             scenario,
+                                             wrap_queues_at=DISPLAY_OPTIONS['wrap_queues_at'],
+                                             max_queue_icons=max_queue_icons)
+
+        rows.append({'player': f'max_queue_icons={max_queue_icons}',
+                     'build (s)': build_time,
+                     'HTML (MB)': len(html.encode('utf-8')) / 1024 ** 2,
+                     'changes': len(player_data['changes']['patient'])})
+
+    return pd.DataFrame(rows).set_index('player')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    parser.add_argument('--every-x-minutes', type=int, default=EVERY_X_MINUTES)
+    args = parser.parse_args()
+
+    scenario, full_patient_df = animation_input(args.days, args.every_x_minutes)
+
+    print(f"Full model, {args.days} days, snapshot every {args.every_x_minutes} minutes")
+    print(figure_report(scenario, full_patient_df, {
+        'plotly express': {'use_plotly_express': True},
+        'go.Frame (all frames)': {'drop_unchanged_frames': False},
+        'go.Frame (unchanged frames dropped)': {},
+        'go.Frame (max_frames=300)': {'max_frames': 300},
+        'go.Frame (max_payload_mb=5)': {'max_payload_mb': 5}
+    }).round(2).to_string())
+
+    print("\nAnimation player")
+    print(player_report(scenario, full_patient_df).round(2).to_string())
+
+    scenario, full_patient_df = animation_input(args.days, target_frames=300)
+
+    print(f"\nFull model, {args.days} days, reshaped with target_frames=300")
+    print(figure_report(scenario, full_patient_df, {
+        'go.Frame (unchanged frames dropped)': {}
+    }).round(2).to_string())
@@ -0,0 +1,140 @@
+'''
+Time taken to position the patients of the animated log.
+
+Runs the full model, reshapes the first replication with a snapshot every
+minute and takes the first 50,000 rows as the patient frame. Compares
+`animate_activity_log(return_df_only=True)`, which assigns ranks,
+positions and icons in one pass over numpy arrays, against the
+groupby/merge/concat version it replaced (kept below as
+`merge_positions`), and checks they put everyone in the same place.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.animation_positioning
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_classes import Scenario, multiple_replications
+from output_animation_functions import animate_activity_log, queue_position, ICON_ARRAY
+from timeline_classes import StateTimeline
+from benchmarks.animation_figure import EVENT_POSITIONS
+
+RUN_DAYS = 5
+N_ROWS = 50000
+N_REPEATS = 5
+
+
+def merge_positions(full_patient_df, event_position_df, wrap_queues_at=None,
+                    max_queue_icons=None, rep=1):
+    '''
+    Positions and icons as worked out by `animate_activity_log` before
+    they were assigned in a single pass, for comparison.
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    full_patient_df = full_patient_df[full_patient_df['rep'] == rep].sort_values([
+        'event', 'minute', 'time'
+        ])
+
+    full_patient_df['rank'] = full_patient_df.groupby(['event', 'minute', 'rep'])['minute'] \
+                              .rank(method='first')
+
+    full_patient_df_plus_pos = full_patient_df.merge(event_position_df, on="event", how='left') \
+                             .sort_values(["rep", "event", "minute", "time"])
+
+    resource_use = full_patient_df_plus_pos[full_patient_df_plus_pos['event_type'] == "resource_use"].copy()
+    resource_use['y_final'] = resource_use['y']
+    resource_use['x_final'] = resource_use['x'] - resource_use['resource_id']*10
+
+    queues = full_patient_df_plus_pos[full_patient_df_plus_pos['event_type'] == 'queue'].copy()
+    queues['x_final'], queues['y_final'] = queue_position(queues['x'], queues['y'],
+                                                          queues['rank'], wrap_queues_at)
+
+    if max_queue_icons is not None:
+        queue_length = queues.groupby(['event', 'minute', 'rep'], observed=True)['rank'] \
+                             .transform('max')
+        queues['queue_overflow'] = np.where(queues['rank'] == max_queue_icons,
+                                            queue_length - max_queue_icons, 0)
+        queues['overflow_x'], queues['overflow_y'] = queue_position(
+            queues['x'], queues['y'], queues['rank'] + 1, wrap_queues_at)
+        queues = queues[queues['rank'] <= max_queue_icons]
+
+    full_patient_df_plus_pos = pd.concat([queues, resource_use])
+
+    individual_patients = full_patient_df['patient'].drop_duplicates().sort_values()
+    full_icon_list = list(ICON_ARRAY) * int(np.ceil(len(individual_patients)/len(ICON_ARRAY)))
+
+    return full_patient_df_plus_pos.merge(
+        pd.DataFrame({'patient': list(individual_patients),
+                      'icon': full_icon_list[0:len(individual_patients)]}),
+        on="patient")
+
+
+def best_time(function, repeats=N_REPEATS):
+    '''
+    Call function() `repeats` times
+
+    Returns:
+    --------
+    tuple
+        (result of the last call, quickest time in seconds)
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def same_positions(old, new):
+    '''
+    Whether two positioned logs put every patient in the same place
+    at every minute (icons aside).
+    '''
+    columns = ['patient', 'minute', 'x_final', 'y_final']
+    old = old[columns].sort_values(['patient', 'minute']).reset_index(drop=True)
+    new = new[columns].sort_values(['patient', 'minute']).reset_index(drop=True)
+    return old.astype(float).equals(new.astype(float))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    parser.add_argument('--rows', type=int, default=N_ROWS)
+    args = parser.parse_args()
+
+    duration = 60 * 24 * args.days
+
+    scenario = Scenario(model="full")
+    event_log = multiple_replications(scenario,
+                                      rc_period=duration,
+                                      n_reps=1,
+                                      return_detailed_logs=True,
+                                      long_format=True)['full_event_log']
+
+    full_patient_df = StateTimeline(event_log).states_between(0, duration, 1).head(args.rows)
+
+    rows = []
+    for options in [{}, {'wrap_queues_at': 10}, {'wrap_queues_at': 10, 'max_queue_icons': 50}]:
+        old, old_time = best_time(
+            lambda: merge_positions(full_patient_df, EVENT_POSITIONS, **options))
+        new, new_time = best_time(
+            lambda: animate_activity_log(full_patient_df, EVENT_POSITIONS, scenario,
+                                         return_df_only=True, **options))
+        rows.append({'options': str(options),
+                     'merges (s)': old_time,
+                     'single pass (s)': new_time,
+                     'speed up': old_time / new_time,
+                     'same positions': same_positions(old, new)})
+
+    print(f"Full model, first {len(full_patient_df)} rows of the patient log "
+          f"(best of {N_REPEATS})")
+    print(pd.DataFrame(rows).set_index('options').round(3).to_string())
@@ -0,0 +1,83 @@
+'''
+Batch means against independent replications.
+
+Estimates the steady state results of a scenario of the full model with
+enough resources to settle down, in two ways:
+
+* `batch_means`: one run of the warm-up plus RUN_DAYS, split into N_BATCHES
+* `multiple_replications`: N_BATCHES replications, each of one batch
+  after the same warm-up (which every replication has to simulate)
+
+and compares the precision of each (the half width of the confidence
+interval as a proportion of the mean), the estimates and the number of
+days simulated.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.batch_means
+    python -m benchmarks.batch_means --days 80 --batches 10
+'''
+
+import argparse
+import time
+
+import pandas as pd
+
+from model_classes import Scenario, multiple_replications
+from output_analysis_functions import (batch_means, batch_length, confidence_intervals,
+                                       DEFAULT_WARMUP_DAYS)
+
+RUN_DAYS = 40
+N_BATCHES = 20
+
+# The full model with enough resources to reach a steady state
+# (with the default resources the queues keep growing)
+STEADY_STATE_SCENARIO = {'n_triage': 3,
+                         'n_reg': 3,
+                         'n_exam': 4,
+                         'n_trauma': 6,
+                         'n_cubicles_1': 4,
+                         'n_cubicles_2': 4}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=float, default=RUN_DAYS)
+    parser.add_argument('--batches', type=int, default=N_BATCHES)
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP_DAYS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batch_df = batch_means(Scenario(**STEADY_STATE_SCENARIO),
+                           run_days=args.days,
+                           n_batches=args.batches,
+                           warmup_days=args.warmup)
+    batch_time = time.perf_counter() - start
+
+    # (batches are rounded to whole cycles of the arrival rate)
+    batch_days = batch_length(Scenario(**STEADY_STATE_SCENARIO),
+                              args.days, args.batches) / (60 * 24)
+    replication_days = args.warmup + batch_days
+
+    start = time.perf_counter()
+    replications = multiple_replications(Scenario(**STEADY_STATE_SCENARIO),
+                                         rc_period=60 * 24 * batch_days,
+                                         warm_up=60 * 24 * args.warmup,
+                                         n_reps=args.batches)
+    replication_df = confidence_intervals(replications)
+    replication_time = time.perf_counter() - start
+
+    print(pd.DataFrame({
+        'batch means': batch_df['mean'],
+        'replications': replication_df['mean'],
+        'batch half width': batch_df['half_width'],
+        'replication half width': replication_df['half_width'],
+        'lag 1 autocorrelation': batch_df['lag1_autocorrelation'],
+    }).drop(index=['00_arrivals', '09_throughput']).round(3).to_string())
+
+    print()
+    print(pd.DataFrame({
+        'days simulated': [args.warmup + args.batches * batch_days,
+                           args.batches * replication_days],
+        'seconds': [batch_time, replication_time]
+    }, index=['batch means', 'replications']).round(2).to_string())
@@ -0,0 +1,46 @@
+'''
+Where the SimPy events of a model run come from.
+
+Runs each model for 5 days in an `InstrumentedEnvironment` and reports
+the events scheduled and processed (and per second), the longest the
+event queue got and the most processes alive at once, then the events
+processed by each type of process. This shows how much of the event load
+is the utilisation audit polling the resources, compared with the patients
+themselves, and how many candidate arrival times the thinning algorithm
+samples for each patient who arrives.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.event_load
+'''
+
+import argparse
+
+import pandas as pd
+
+from model_classes import Scenario, single_run
+
+RUN_DAYS = 5
+MODELS = ['full', 'simplest', 'simple_with_branch']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    args = parser.parse_args()
+
+    for model in MODELS:
+        _, event_stats = single_run(Scenario(model=model),
+                                    rc_period=60 * 24 * args.days,
+                                    return_event_stats=True)
+
+        processes = event_stats.pop('processes')
+        arrivals = processes.loc[processes.index.str.endswith('.execute'),
+                                 'processes_started'].sum()
+        event_stats['thinning_samples_per_arrival'] = event_stats['thinning_samples'] / arrivals
+
+        print(f"{model} model, {args.days} days")
+        print(pd.Series(event_stats).round(2).to_string())
+        print()
+        print(processes.round(3).to_string())
+        print()
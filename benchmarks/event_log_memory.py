@@ -0,0 +1,130 @@
+'''
+Memory report for the detailed logs returned by the model.
+
+Runs the full model for 60 days and 10 replications and compares the
+memory used by the event log and utilisation audit when they are converted
+with a plain `pd.DataFrame(...)` (object columns for all text, float64 for
+resource ids) against the compact conversion used by `single_run`
+(categoricals, int32 patient ids, nullable Int8 resource ids and,
+optionally, float32 times).
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.event_log_memory
+'''
+
+import argparse
+
+import pandas as pd
+
+from model_classes import (Scenario, create_model, replication_seeds,
+                           event_log_to_frame, utilisation_audit_to_frame)
+
+RUN_DAYS = 60
+N_REPS = 10
+
+
+def run_replications(n_days=RUN_DAYS, n_reps=N_REPS):
+    '''
+    Run the full model and keep the raw logs recorded by each replication.
+
+    Params:
+    ------
+    n_days: int, optional (default=RUN_DAYS)
+        Length of each run in days
+
+    n_reps: int, optional (default=N_REPS)
+        Number of replications
+
+    Returns:
+    --------
+    list of tuples
+        (event log, utilisation audit) for each replication
+    '''
+    scenario = Scenario(model="full")
+    raw_logs = []
+
+    for seed in replication_seeds(scenario.random_number_set, n_reps):
+        scenario.set_random_no_set(seed)
+        model = create_model(scenario)
+        model.run(results_collection_period=60 * 24 * n_days)
+        raw_logs.append((model.full_event_log, model.utilisation_audit))
+
+    return raw_logs
+
+
+def combined_frames(raw_logs, convert_event_log, convert_audit):
+    '''
+    Convert the logs of each replication and combine them into long frames,
+    in the same way as `collate_replications`.
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (event log, utilisation audit)
+    '''
+    event_logs = []
+    audits = []
+
+    for rep, (event_log, audit) in enumerate(raw_logs, start=1):
+        event_logs.append(convert_event_log(event_log).assign(rep=rep))
+        audits.append(convert_audit(audit).assign(rep=rep))
+
+    return (pd.concat(event_logs, ignore_index=True),
+            pd.concat(audits, ignore_index=True))
+
+
+def memory_mb(df):
+    '''
+    Deep memory use of a DataFrame in megabytes
+    '''
+    return df.memory_usage(deep=True, index=True).sum() / 1024 ** 2
+
+
+def memory_report(n_days=RUN_DAYS, n_reps=N_REPS):
+    '''
+    Compare the memory used by each way of converting the logs.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Memory use in MB of the event log and utilisation audit for each
+        conversion, and the reduction relative to plain DataFrames
+    '''
+    raw_logs = run_replications(n_days, n_reps)
+
+    conversions = {
+        'pd.DataFrame (object columns)': (pd.DataFrame, pd.DataFrame),
+        'compact': (
+            lambda log: event_log_to_frame(log, "full"),
+            utilisation_audit_to_frame
+        ),
+        'compact + float32 times': (
+            lambda log: event_log_to_frame(log, "full", float32_times=True),
+            lambda audit: utilisation_audit_to_frame(audit, float32_times=True)
+        )
+    }
+
+    rows = []
+    for name, (convert_event_log, convert_audit) in conversions.items():
+        event_log, audit = combined_frames(raw_logs, convert_event_log, convert_audit)
+        rows.append({'conversion': name,
+                     'rows': len(event_log),
+                     'full_event_log (MB)': memory_mb(event_log),
+                     'utilisation_audit (MB)': memory_mb(audit)})
+
+    report = pd.DataFrame(rows).set_index('conversion')
+    report['total (MB)'] = report['full_event_log (MB)'] + report['utilisation_audit (MB)']
+    report['reduction'] = 1 - report['total (MB)'] / report['total (MB)'].iloc[0]
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    parser.add_argument('--reps', type=int, default=N_REPS)
+    args = parser.parse_args()
+
+    print(f"Full model, {args.days} days, {args.reps} replications")
+    print(memory_report(args.days, args.reps).round(2).to_string())
@@ -0,0 +1,280 @@
+'''
+Golden output check for changes to the model.
+
+Runs every model for a matrix of scenarios and random number sets and
+compares a compact fingerprint of each run against the fingerprints saved
+in golden_fingerprints.json:
+
+* the value of every metric in the summary frame
+* a hash of the whole event log, plus the count and a hash of the rows
+  of each event (so a difference can be traced to the events that changed)
+
+By default runs must match exactly (bit for bit), which is what a change
+that is only meant to make the model faster should give. For a change
+that deliberately gives different random numbers (e.g. sampling in a
+different order), use --statistical to instead check that the mean of each
+metric over the random number sets is consistent with the golden runs.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.golden_fingerprints
+    python -m benchmarks.golden_fingerprints --statistical
+    python -m benchmarks.golden_fingerprints --update   (after an intended change)
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from model_classes import Scenario, single_run
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden_fingerprints.json')
+
+MODELS = ['full', 'simplest', 'simple_with_branch']
+
+# Scenario parameters (beyond the defaults) for each scenario in the matrix
+SCENARIOS = {
+    'default': {},
+    'more_resources': {'n_triage': 2, 'n_reg': 2, 'n_exam': 4, 'n_trauma': 3,
+                       'n_cubicles_1': 2, 'n_cubicles_2': 2},
+    'fixed_arrival_rate': {'override_arrival_rate': True, 'manual_arrival_rate': 4}
+}
+
+RANDOM_NUMBER_SETS = list(range(1, 11))
+RUN_DAYS = 3
+
+# Number of standard errors the mean of a metric can move by in a
+# --statistical check
+STATISTICAL_TOLERANCE = 4
+
+
+def case_name(model, scenario_name, random_number_set):
+    '''
+    Key of a run in the golden fingerprints
+    '''
+    return f'{model}/{scenario_name}/{random_number_set}'
+
+
+def hash_rows(event_log):
+    '''
+    Hash of the rows of an event log. Times are hashed by their exact
+    (repr) value, so any change in the floating point result is caught.
+
+    Returns:
+    --------
+    str
+    '''
+    digest = hashlib.sha256()
+    for row in event_log.itertuples(index=False):
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()[:16]
+
+
+def run_fingerprint(model, scenario_name, random_number_set, n_days=RUN_DAYS):
+    '''
+    Run a model and fingerprint the results.
+
+    Params:
+    -------
+    model: str
+        'full', 'simplest' or 'simple_with_branch'
+
+    scenario_name: str
+        A key of SCENARIOS
+
+    random_number_set: int
+
+    n_days: int, optional (default=RUN_DAYS)
+
+    Returns:
+    --------
+    dict
+        'summary': {metric: value}, 'event_log': hash of the event log,
+        'events': {event: [count, hash of the event's rows]}
+    '''
+    results = single_run(Scenario(model=model, **SCENARIOS[scenario_name]),
+                         rc_period=60 * 24 * n_days,
+                         random_no_set=random_number_set,
+                         return_detailed_logs=True)
+
+    event_log = results['full_event_log'].astype({'pathway': object,
+                                                  'event_type': object,
+                                                  'event': object,
+                                                  'resource_id': object})
+
+    return {
+        'summary': {metric: float(value)
+                    for metric, value in results['summary_df'].iloc[0].items()},
+        'event_log': hash_rows(event_log),
+        'events': {event: [len(rows), hash_rows(rows)]
+                   for event, rows in event_log.groupby('event', sort=True)}
+    }
+
+
+def run_all(models=MODELS, n_days=RUN_DAYS):
+    '''
+    Fingerprint every model, scenario and random number set in the matrix.
+
+    Returns:
+    --------
+    dict
+        {case name: fingerprint}
+    '''
+    return {case_name(model, scenario_name, random_number_set):
+                run_fingerprint(model, scenario_name, random_number_set, n_days)
+            for model in models
+            for scenario_name in SCENARIOS
+            for random_number_set in RANDOM_NUMBER_SETS}
+
+
+def same_value(a, b):
+    '''
+    Exact equality, with NaN equal to NaN
+    '''
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+def exact_differences(golden, current):
+    '''
+    Every difference between the current and golden fingerprint of each run.
+
+    Params:
+    -------
+    golden, current: dict
+        {case name: fingerprint}, as returned by run_all
+
+    Returns:
+    --------
+    list of str
+        One line per metric or event that diverged
+    '''
+    differences = []
+
+    for case, fingerprint in current.items():
+        if case not in golden:
+            differences.append(f'{case}: no golden fingerprint')
+            continue
+
+        golden_fingerprint = golden[case]
+
+        for metric, value in fingerprint['summary'].items():
+            golden_value = golden_fingerprint['summary'].get(metric)
+            if golden_value is None:
+                differences.append(f'{case}: metric {metric} is new')
+            elif not same_value(value, golden_value):
+                differences.append(f'{case}: metric {metric} {golden_value!r} -> {value!r}')
+
+        for metric in golden_fingerprint['summary'].keys() - fingerprint['summary'].keys():
+            differences.append(f'{case}: metric {metric} is missing')
+
+        if fingerprint['event_log'] != golden_fingerprint['event_log']:
+            events = sorted(fingerprint['events'].keys() | golden_fingerprint['events'].keys())
+            changed = [event for event in events
+                       if fingerprint['events'].get(event) != golden_fingerprint['events'].get(event)]
+
+            if not changed:
+                differences.append(f'{case}: event log rows are in a different order')
+
+            for event in changed:
+                golden_count = golden_fingerprint['events'].get(event, [0])[0]
+                count = fingerprint['events'].get(event, [0])[0]
+                differences.append(f'{case}: event {event} differs '
+                                   f'({golden_count} -> {count} rows)')
+
+    return differences
+
+
+def summary_frame(fingerprints):
+    '''
+    Summary metrics of every run as a frame indexed by
+    model, scenario and random number set
+    '''
+    df = pd.DataFrame({case: fingerprint['summary']
+                       for case, fingerprint in fingerprints.items()}).T
+    df.index = pd.MultiIndex.from_tuples([tuple(case.split('/')) for case in df.index],
+                                         names=['model', 'scenario', 'random_number_set'])
+    return df
+
+
+def statistical_differences(golden, current, tolerance=STATISTICAL_TOLERANCE):
+    '''
+    The metrics whose mean over the random number sets has moved further
+    from the golden mean than would be expected by chance.
+
+    For each model and scenario, the difference in the means of each metric
+    is compared with its standard error (from the spread of both sets of
+    runs). Metrics that don't vary between runs must match exactly.
+
+    Params:
+    -------
+    golden, current: dict
+        {case name: fingerprint}, as returned by run_all
+
+    tolerance: float, optional (default=STATISTICAL_TOLERANCE)
+        Number of standard errors allowed
+
+    Returns:
+    --------
+    list of str
+    '''
+    golden_df = summary_frame(golden)
+    current_df = summary_frame(current)
+    differences = []
+
+    for (model, scenario_name), current_runs in current_df.groupby(level=['model', 'scenario']):
+        golden_runs = golden_df.xs((model, scenario_name), level=['model', 'scenario'])
+
+        for metric in current_runs.columns:
+            new = current_runs[metric].dropna()
+            old = golden_runs[metric].dropna() if metric in golden_runs else pd.Series(dtype=float)
+
+            if len(new) < 2 or len(old) < 2:
+                continue
+
+            standard_error = np.sqrt(new.var() / len(new) + old.var() / len(old))
+            difference = new.mean() - old.mean()
+
+            if (standard_error == 0 and difference != 0) or \
+               abs(difference) > tolerance * standard_error:
+                differences.append(f'{model}/{scenario_name}: metric {metric} mean '
+                                   f'{old.mean():.4f} -> {new.mean():.4f} '
+                                   f'(standard error {standard_error:.4f})')
+
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--update', action='store_true',
+                        help='save the current fingerprints as the golden ones')
+    parser.add_argument('--statistical', action='store_true',
+                        help='compare the mean of each metric rather than every value')
+    parser.add_argument('--models', nargs='+', default=MODELS, choices=MODELS)
+    args = parser.parse_args()
+
+    current = run_all(args.models)
+
+    if args.update:
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump(current, f, indent=1, sort_keys=True)
+        print(f'Saved {len(current)} fingerprints to {GOLDEN_PATH}')
+        sys.exit(0)
+
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+
+    if args.statistical:
+        differences = statistical_differences(golden, current)
+    else:
+        differences = exact_differences(golden, current)
+
+    for difference in differences:
+        print(difference)
+
+    print(f'{len(current)} runs checked, {len(differences)} differences')
+    sys.exit(1 if differences else 0)
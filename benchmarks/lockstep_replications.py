@@ -0,0 +1,116 @@
+'''
+Lockstep engine against the SimPy model.
+
+Runs replications of each model in LOCKSTEP_MODELS with
+`multiple_replications` (SimPy, one replication after another) and with
+`lockstep_replications` (numpy, every replication at once), for the
+default scenario and the scenario of the model's page, and checks the
+summary results and event logs are identical, with and without a warm-up.
+(With the default scenarios the queues are so long after the warm-up that
+no patient who arrives after it is seen, so some results can't be worked
+out.) Then times each for a range of numbers of replications.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.lockstep_replications
+    python -m benchmarks.lockstep_replications --days 10 --reps 1 10 100
+'''
+
+import argparse
+import time
+
+import pandas as pd
+
+from model_classes import Scenario, multiple_replications
+from queueing_functions import lockstep_replications, LOCKSTEP_MODELS
+
+RUN_DAYS = 5
+N_REPS = [1, 10, 100]
+CHECK_REPS = 10
+CHECK_WARM_UP_DAYS = [0, 1]
+
+# The defaults of the Simple Resource page
+SIMPLE_RESOURCE_PAGE_SCENARIO = {'random_number_set': 42,
+                                 'n_cubicles_1': 4,
+                                 'override_arrival_rate': True,
+                                 'manual_arrival_rate': 60 / (120 / 24),
+                                 'trauma_treat_mean': 50,
+                                 'trauma_treat_var': 10}
+
+# The defaults of the Optional Step page
+OPTIONAL_STEP_PAGE_SCENARIO = {'random_number_set': 42,
+                               'n_exam': 3,
+                               'n_cubicles_1': 2,
+                               'override_arrival_rate': True,
+                               'manual_arrival_rate': 60 / (140 / 24),
+                               'exam_mean': 30,
+                               'exam_var': 10,
+                               'non_trauma_treat_mean': 50,
+                               'non_trauma_treat_var': 30,
+                               'non_trauma_treat_p': 0.5}
+
+SCENARIOS = {'simplest': {'default': {},
+                          'simple_resource_page': SIMPLE_RESOURCE_PAGE_SCENARIO},
+             'simple_with_branch': {'default': {},
+                                    'optional_step_page': OPTIONAL_STEP_PAGE_SCENARIO}}
+
+
+def run(function, model, scenario_parameters, n_days, n_reps, warm_up_days=0):
+    '''
+    Run replications of a model, as the pages do (plus any warm-up)
+
+    Returns:
+    --------
+    tuple
+        (results, seconds taken)
+    '''
+    start = time.perf_counter()
+    results = function(Scenario(model=model, **scenario_parameters),
+                       rc_period=60 * 24 * n_days,
+                       warm_up=60 * 24 * warm_up_days,
+                       n_reps=n_reps,
+                       return_detailed_logs=True,
+                       long_format=True)
+    return results, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    parser.add_argument('--reps', type=int, nargs='+', default=N_REPS)
+    args = parser.parse_args()
+
+    for model in LOCKSTEP_MODELS:
+        for scenario_name, parameters in SCENARIOS[model].items():
+            for warm_up_days in CHECK_WARM_UP_DAYS:
+                simpy_results, _ = run(multiple_replications, model, parameters,
+                                       args.days, CHECK_REPS, warm_up_days)
+                lockstep_results, _ = run(lockstep_replications, model, parameters,
+                                          args.days, CHECK_REPS, warm_up_days)
+                different = [log_type for log_type in simpy_results
+                             if not simpy_results[log_type].equals(lockstep_results[log_type])]
+                missing = simpy_results['summary_df'].isna().any().sum()
+                print(f"{model}, {scenario_name}, {warm_up_days} day warm-up: "
+                      f"{CHECK_REPS} replications "
+                      f"{'differ in ' + ', '.join(different) if different else 'identical'}"
+                      f"{f' ({missing} results not worked out)' if missing else ''}")
+
+    rows = []
+    for model in LOCKSTEP_MODELS:
+        for scenario_name, parameters in SCENARIOS[model].items():
+            for n_reps in args.reps:
+                _, simpy_time = run(multiple_replications, model, parameters,
+                                    args.days, n_reps)
+                _, lockstep_time = run(lockstep_replications, model, parameters,
+                                       args.days, n_reps)
+                rows.append({'model': model,
+                             'scenario': scenario_name,
+                             'replications': n_reps,
+                             'simpy (s)': simpy_time,
+                             'lockstep (s)': lockstep_time,
+                             'speed up': simpy_time / lockstep_time})
+
+    print()
+    print(f"{args.days} days")
+    print(pd.DataFrame(rows).set_index(['model', 'scenario', 'replications'])
+          .round(3).to_string())
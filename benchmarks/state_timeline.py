@@ -0,0 +1,80 @@
+'''
+Time taken to work out where everyone is for the animated log.
+
+Runs the full model for 5 days and compares working out the position of
+every patient every 5 minutes with `reshape_for_animations` against
+building a `StateTimeline` and asking it for the same snapshots, and the
+time taken by the timeline to look up the state at random times
+(as when moving a slider).
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.state_timeline
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_classes import Scenario, multiple_replications
+from output_animation_functions import reshape_for_animations, STATE_EVENT_TYPES
+from timeline_classes import StateTimeline
+
+RUN_DAYS = 5
+EVERY_X_MINUTES = 5
+N_LOOKUPS = 1000
+
+
+def timed(function, *args, **kwargs):
+    '''
+    Call function(*args, **kwargs)
+
+    Returns:
+    --------
+    tuple
+        (result, seconds taken)
+    '''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=RUN_DAYS)
+    parser.add_argument('--every-x-minutes', type=int, default=EVERY_X_MINUTES)
+    args = parser.parse_args()
+
+    duration = 60 * 24 * args.days
+
+    event_log = multiple_replications(Scenario(model="full"),
+                                      rc_period=duration,
+                                      n_reps=1,
+                                      return_detailed_logs=True,
+                                      long_format=True)['full_event_log']
+
+    reshaped, reshape_time = timed(
+        reshape_for_animations,
+        event_log[event_log['event_type'].isin(STATE_EVENT_TYPES)],
+        every_x_minutes=args.every_x_minutes,
+        limit_duration=duration)
+
+    timeline, index_time = timed(StateTimeline, event_log)
+    states, states_time = timed(timeline.states_between, 0, duration - 1, args.every_x_minutes)
+
+    lookup_times = np.random.default_rng(42).uniform(0, duration, N_LOOKUPS)
+    lookups, lookups_time = timed(lambda: [timeline.state_at(t) for t in lookup_times])
+
+    print(f"Full model, {args.days} days, snapshot every {args.every_x_minutes} minutes")
+    print(pd.DataFrame([
+        {'method': 'reshape_for_animations',
+         'seconds': reshape_time, 'rows': len(reshaped['full_patient_df'])},
+        {'method': 'StateTimeline (build index)',
+         'seconds': index_time, 'rows': len(timeline)},
+        {'method': 'StateTimeline.states_between',
+         'seconds': states_time, 'rows': len(states)},
+        {'method': f'StateTimeline.state_at x {N_LOOKUPS} random times',
+         'seconds': lookups_time, 'rows': sum(len(state) for state in lookups)},
+    ]).set_index('method').round(3).to_string())
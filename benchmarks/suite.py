@@ -0,0 +1,430 @@
+'''
+Benchmark suite for the simulation, summary and animation hot paths.
+
+Runs a fixed set of workloads, each with fixed random number sets so that
+every run of the suite does the same work:
+
+* `single_run` of each model for 1, 5, 30 and 60 days
+* `multiple_replications` of each model (10 replications of 5 days)
+* `lockstep_replications` of the simplest model and the model with an
+  optional step (1, 10 and 100 replications of 5 days)
+* `SimulationSummary.process_run_results` for a 60 day run of the full model
+* `reshape_for_animations` of 5 days of the full model (snapshot every 5 minutes)
+* `animate_activity_log` of the same (as on the Full Model page)
+* `state_occupancy` of 10 replications of 5 days of the full model
+
+If numba is installed, the lockstep and occupancy workloads are run both
+with and without the kernels of accelerated_functions (marked [numpy] and
+[numba] in their names) to show the difference they make.
+
+and records for each the wall time (the quickest of a number of repeats),
+the peak memory allocated while it runs (measured by tracemalloc, in a
+separate run as tracing slows everything down) and the number of rows of
+event log involved (the log produced for the model runs, the log of the
+summarised run, the log passed in for the animation functions). These are
+log rows, not SimPy events: the lockstep engine processes no SimPy events
+at all (see benchmarks.event_load for those).
+
+The results can be saved as JSON, and a saved set of results compared
+against, to see whether a change makes things faster or slower.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.suite --save before.json
+    (make a change)
+    python -m benchmarks.suite --compare before.json
+
+    python -m benchmarks.suite --only single_run --repeats 1
+'''
+
+import argparse
+import datetime as dt
+import json
+import platform
+import re
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import simpy
+
+from model_classes import (Scenario, create_model, single_run, multiple_replications,
+                           SimulationSummary)
+from queueing_functions import lockstep_replications, LOCKSTEP_MODELS
+from output_animation_functions import (reshape_for_animations, animate_activity_log,
+                                        state_occupancy, STATE_EVENT_TYPES)
+from accelerated_functions import NUMBA_AVAILABLE, use_numba
+from benchmarks.animation_figure import EVENT_POSITIONS, DISPLAY_OPTIONS
+
+MODELS = ['full', 'simplest', 'simple_with_branch']
+RUN_DAYS = [1, 5, 30, 60]
+N_REPS = 10
+LOCKSTEP_N_REPS = [1, 10, 100]
+REPLICATION_DAYS = 5
+SUMMARY_DAYS = 60
+ANIMATION_DAYS = 5
+EVERY_X_MINUTES = 5
+RANDOM_NUMBER_SET = 42
+N_REPEATS = 3
+
+
+class Workload:
+    '''
+    A piece of work to be timed.
+
+    `setup` is called once, and its result passed to `run` every time
+    the workload is measured, so that only `run` is timed.
+    '''
+    def __init__(self, name, run, setup=None):
+        '''
+        Constructor
+
+        Params:
+        -------
+        name: str
+            Name of the workload in the results
+
+        run: callable
+            Takes the result of setup (or nothing, if there is no setup)
+            and returns the number of event log rows it produced or used
+
+        setup: callable, optional (default=None)
+            Prepares the input to run
+        '''
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+    def measure(self, repeats=N_REPEATS):
+        '''
+        Time the workload and measure its peak memory use.
+
+        Params:
+        -------
+        repeats: int, optional (default=N_REPEATS)
+            Number of timed runs. The quickest is recorded.
+
+        Returns:
+        --------
+        dict
+            'seconds', 'peak_mb' and 'event_log_rows'
+        '''
+        args = () if self.setup is None else (self.setup(),)
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            event_log_rows = self.run(*args)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        self.run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {'seconds': min(times),
+                'peak_mb': peak / 1024 ** 2,
+                'event_log_rows': int(event_log_rows)}
+
+
+def numba_variants(workload):
+    '''
+    The workload run without and with the numba kernels, if numba is
+    installed (otherwise just the workload itself).
+
+    The kernels are compiled (or loaded from numba's cache) by running the
+    workload once in setup, so compilation isn't timed.
+
+    Params:
+    -------
+    workload: Workload
+
+    Returns:
+    --------
+    list of Workload
+    '''
+    if not NUMBA_AVAILABLE:
+        return [workload]
+
+    def variant(enabled):
+        def setup():
+            with use_numba(enabled):
+                args = () if workload.setup is None else (workload.setup(),)
+                workload.run(*args)
+            return args
+
+        def run(args):
+            with use_numba(enabled):
+                return workload.run(*args)
+
+        return Workload(f"{workload.name}[{'numba' if enabled else 'numpy'}]", run, setup)
+
+    return [variant(False), variant(True)]
+
+
+def single_run_workload(model, n_days):
+    '''
+    `single_run` of a model, returning the detailed logs (as the app does)
+    '''
+    def run():
+        results = single_run(Scenario(model=model),
+                             rc_period=60 * 24 * n_days,
+                             random_no_set=RANDOM_NUMBER_SET,
+                             return_detailed_logs=True)
+        return len(results['full_event_log'])
+
+    return Workload(f'single_run[{model}, {n_days}d]', run)
+
+
+def multiple_replications_workload(model, n_reps=N_REPS, n_days=REPLICATION_DAYS):
+    '''
+    `multiple_replications` of a model, collated into long format (as the app does)
+    '''
+    def run():
+        results = multiple_replications(Scenario(model=model,
+                                                 random_number_set=RANDOM_NUMBER_SET),
+                                        rc_period=60 * 24 * n_days,
+                                        n_reps=n_reps,
+                                        return_detailed_logs=True,
+                                        long_format=True)
+        return len(results['full_event_log'])
+
+    return Workload(f'multiple_replications[{model}, {n_reps}x{n_days}d]', run)
+
+
+def lockstep_replications_workload(model, n_reps=N_REPS, n_days=REPLICATION_DAYS):
+    '''
+    `lockstep_replications` of a model, collated into long format
+    (as the Simple Resource and Optional Step pages do)
+    '''
+    def run():
+        results = lockstep_replications(Scenario(model=model,
+                                                 random_number_set=RANDOM_NUMBER_SET),
+                                        rc_period=60 * 24 * n_days,
+                                        n_reps=n_reps,
+                                        return_detailed_logs=True,
+                                        long_format=True)
+        return len(results['full_event_log'])
+
+    return Workload(f'lockstep_replications[{model}, {n_reps}x{n_days}d]', run)
+
+
+def process_run_results_workload(model='full', n_days=SUMMARY_DAYS):
+    '''
+    `SimulationSummary.process_run_results` of a model that has already been run
+    '''
+    def setup():
+        scenario = Scenario(model=model)
+        scenario.set_random_no_set(RANDOM_NUMBER_SET)
+        finished_model = create_model(scenario)
+        finished_model.run(results_collection_period=60 * 24 * n_days)
+        return finished_model
+
+    def run(finished_model):
+        SimulationSummary(finished_model).process_run_results()
+        return len(finished_model.full_event_log)
+
+    return Workload(f'process_run_results[{model}, {n_days}d]', run, setup)
+
+
+def animation_event_log(n_days=ANIMATION_DAYS):
+    '''
+    Event log of one replication of the full model, limited to the events
+    shown in the animated log.
+    '''
+    event_log = multiple_replications(Scenario(model='full',
+                                               random_number_set=RANDOM_NUMBER_SET),
+                                      rc_period=60 * 24 * n_days,
+                                      n_reps=1,
+                                      return_detailed_logs=True,
+                                      long_format=True)['full_event_log']
+
+    return event_log[event_log['event_type'].isin(STATE_EVENT_TYPES)]
+
+
+def reshape_for_animations_workload(n_days=ANIMATION_DAYS, every_x_minutes=EVERY_X_MINUTES):
+    '''
+    `reshape_for_animations` of a run of the full model
+    '''
+    def run(event_log):
+        reshape_for_animations(event_log,
+                               every_x_minutes=every_x_minutes,
+                               limit_duration=60 * 24 * n_days)
+        return len(event_log)
+
+    return Workload(f'reshape_for_animations[full, {n_days}d, {every_x_minutes}min]',
+                    run, lambda: animation_event_log(n_days))
+
+
+def animate_activity_log_workload(n_days=ANIMATION_DAYS, every_x_minutes=EVERY_X_MINUTES):
+    '''
+    `animate_activity_log` of a run of the full model, with the display
+    options of the Full Model page
+    '''
+    def setup():
+        full_patient_df = reshape_for_animations(animation_event_log(n_days),
+                                                 every_x_minutes=every_x_minutes,
+                                                 limit_duration=60 * 24 * n_days)['full_patient_df']
+        return full_patient_df[full_patient_df['minute'] <= 60 * 24 * n_days]
+
+    def run(full_patient_df):
+        animate_activity_log(full_patient_df,
+                             EVENT_POSITIONS,
+                             Scenario(model='full'),
+                             **DISPLAY_OPTIONS)
+        return len(full_patient_df)
+
+    return Workload(f'animate_activity_log[full, {n_days}d, {every_x_minutes}min]',
+                    run, setup)
+
+
+def state_occupancy_workload(n_reps=N_REPS, n_days=REPLICATION_DAYS,
+                             every_x_minutes=EVERY_X_MINUTES):
+    '''
+    `state_occupancy` of replications of the full model (as on the Full Model page)
+    '''
+    def setup():
+        return multiple_replications(Scenario(model='full',
+                                              random_number_set=RANDOM_NUMBER_SET),
+                                     rc_period=60 * 24 * n_days,
+                                     n_reps=n_reps,
+                                     return_detailed_logs=True,
+                                     long_format=True)['full_event_log']
+
+    def run(event_log):
+        state_occupancy(event_log, every_x_minutes=every_x_minutes)
+        return len(event_log)
+
+    return Workload(f'state_occupancy[full, {n_reps}x{n_days}d, {every_x_minutes}min]',
+                    run, setup)
+
+
+def workloads():
+    '''
+    All the workloads of the suite, in the order they are run.
+
+    Returns:
+    --------
+    list of Workload
+    '''
+    return [
+        *[single_run_workload(model, n_days) for model in MODELS for n_days in RUN_DAYS],
+        *[multiple_replications_workload(model) for model in MODELS],
+        *[variant for model in LOCKSTEP_MODELS for n_reps in LOCKSTEP_N_REPS
+          for variant in numba_variants(lockstep_replications_workload(model, n_reps))],
+        process_run_results_workload(),
+        reshape_for_animations_workload(),
+        animate_activity_log_workload(),
+        *numba_variants(state_occupancy_workload())
+    ]
+
+
+def environment():
+    '''
+    Versions of python and the packages used, saved alongside the results
+    '''
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'simpy': simpy.__version__,
+            'numba': numba_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor()}
+
+
+def numba_version():
+    '''
+    Version of numba, or None if it isn't installed
+    '''
+    if not NUMBA_AVAILABLE:
+        return None
+    import numba
+    return numba.__version__
+
+
+def run_suite(only=None, repeats=N_REPEATS):
+    '''
+    Measure every workload (or those whose name matches `only`).
+
+    Params:
+    -------
+    only: str, optional (default=None)
+        Regular expression. Only workloads whose names contain a match are run.
+
+    repeats: int, optional (default=N_REPEATS)
+        Number of timed runs of each workload
+
+    Returns:
+    --------
+    dict
+        {'created': ..., 'environment': ..., 'repeats': ...,
+         'results': {workload name: measurements}}
+    '''
+    results = {}
+
+    for workload in workloads():
+        if only is not None and not re.search(only, workload.name):
+            continue
+        results[workload.name] = workload.measure(repeats)
+        print(f"{workload.name}: {results[workload.name]['seconds']:.3f}s", flush=True)
+
+    return {'created': dt.datetime.now().isoformat(timespec='seconds'),
+            'environment': environment(),
+            'repeats': repeats,
+            'results': results}
+
+
+def results_frame(suite_results, baseline=None):
+    '''
+    Table of the results of a run of the suite, with the ratio of each
+    measurement to that of the baseline if given (below 1 is an improvement).
+
+    Params:
+    -------
+    suite_results: dict
+        As returned by run_suite
+
+    baseline: dict, optional (default=None)
+        The results of an earlier run of the suite, as returned by run_suite
+        (or loaded from JSON)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    df = pd.DataFrame(suite_results['results']).T.astype({'event_log_rows': int})
+    df.index.name = 'workload'
+
+    if baseline is not None:
+        # results saved before the column was renamed from 'events'
+        baseline_df = (pd.DataFrame(baseline['results']).T.reindex(df.index)
+                       .rename(columns={'events': 'event_log_rows'}))
+        df['seconds vs baseline'] = df['seconds'] / baseline_df['seconds']
+        df['peak_mb vs baseline'] = df['peak_mb'] / baseline_df['peak_mb']
+        df['event_log_rows vs baseline'] = df['event_log_rows'] / baseline_df['event_log_rows']
+
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--only', help='regular expression to select workloads by name')
+    parser.add_argument('--repeats', type=int, default=N_REPEATS)
+    parser.add_argument('--save', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of earlier results to compare against')
+    args = parser.parse_args()
+
+    suite_results = run_suite(args.only, args.repeats)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print()
+    print(results_frame(suite_results, baseline).round(3).to_string())
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(suite_results, f, indent=2)
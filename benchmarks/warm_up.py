@@ -0,0 +1,148 @@
+'''
+Automatic choice of warm-up.
+
+Runs `find_warm_up` (the MSER-5 rule applied to the waiting times of trial
+replications) for a scenario of each model that settles down, and for the
+default scenarios, which are busier than the resources can keep up with.
+Prints the warm-up chosen, whether the trial showed the waits settling
+(a warm-up close to half the trial means they didn't) and the time taken.
+
+Then runs replications of each scenario after the warm-up chosen (or
+CHECK_WARM_UP_DAYS if none was), and checks that
+* the summary results can be worked out, even when the queues are so long
+  that no patient who arrives after the warm-up is seen
+* the utilisation of each resource is the time it was in use after the
+  warm-up, including by patients who arrived during it (worked out from
+  the event log of the same replication run without a warm-up, and for
+  longer, as use that carries on past the end of the run counts in full)
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.warm_up
+    python -m benchmarks.warm_up --days 40 --reps 10
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_classes import Scenario, single_run
+from output_analysis_functions import find_warm_up, BATCH_RESULTS, DEFAULT_WARM_UP_TRIAL_DAYS
+from benchmarks.batch_means import STEADY_STATE_SCENARIO
+
+N_REPS = 5
+
+# Results collection period of the replications run after the warm-up
+CHECK_DAYS = 5
+CHECK_WARM_UP_DAYS = 1
+
+# The full model and the model with an optional step, with enough
+# resources to settle down and with their defaults
+SCENARIOS = {'full, steady state': {'model': 'full', **STEADY_STATE_SCENARIO},
+             'full, default': {'model': 'full'},
+             'simple_with_branch, steady state': {'model': 'simple_with_branch',
+                                                  'n_exam': 4,
+                                                  'n_cubicles_1': 3},
+             'simple_with_branch, default': {'model': 'simple_with_branch'},
+             'simplest, default': {'model': 'simplest'}}
+
+
+def utilisation_from_log(full_event_log, scenario, warm_up, rc_period):
+    '''
+    Utilisation of each resource after a warm-up, from the event log of a
+    run without one that carries on for long enough after warm_up + rc_period
+    for every use of a resource that started before then to have ended.
+
+    Returns:
+    --------
+    dict
+        {result: utilisation}, for the 'util' results of BATCH_RESULTS
+    '''
+    times = full_event_log.set_index(['patient', 'event'])['time'].unstack()
+    times.columns = times.columns.astype(str)
+
+    def column(event):
+        if event not in times.columns:
+            return np.full(len(times), np.nan)
+        return times[event].to_numpy(dtype=np.float64)
+
+    utilisation = {}
+    for result, (kind, *details) in BATCH_RESULTS[scenario.model].items():
+        if kind != 'util':
+            continue
+        stage, n_resources = details
+        begins = column(f'{stage}_begins')
+        ends = np.fmax(column(f'{stage}_complete'), column(f'{stage}_ends'))
+        in_use = begins < warm_up + rc_period
+        utilisation[result] = (np.clip(ends[in_use] - np.maximum(begins[in_use], warm_up),
+                                       0, None).sum()
+                               / (rc_period * getattr(scenario, n_resources)))
+
+    return utilisation
+
+
+def check_warm_up(parameters, warm_up, n_days, n_reps):
+    '''
+    Run replications of a scenario after a warm-up, and check their
+    utilisation against the event log of the same replications run
+    without one.
+
+    Returns:
+    --------
+    dict
+        'utilisation' (the mean of each replication's mean utilisation),
+        'no wait results' (the number of replications where no
+        patient who arrived after the warm-up was seen) and 'utilisation
+        checked' (whether every utilisation matched)
+    '''
+    rc_period = 60 * 24 * n_days
+    utilisation = [result for result, (kind, *_) in BATCH_RESULTS[parameters['model']].items()
+                   if kind == 'util']
+
+    means, no_wait, matched = [], 0, True
+    for seed in range(n_reps):
+        summary = single_run(Scenario(**parameters), rc_period=rc_period, warm_up=warm_up,
+                             random_no_set=seed)
+        full_event_log = single_run(Scenario(**parameters), rc_period=warm_up + 2 * rc_period,
+                                    random_no_set=seed,
+                                    return_detailed_logs=True)['full_event_log']
+        from_log = utilisation_from_log(full_event_log, Scenario(**parameters),
+                                        warm_up, rc_period)
+
+        means.append(summary[utilisation].iloc[0].mean())
+        no_wait += int(summary.filter(like='wait').iloc[0].isna().any())
+        matched &= np.allclose(summary[utilisation].iloc[0].to_numpy(dtype=float),
+                               [from_log[result] for result in utilisation])
+
+    return {'utilisation': np.mean(means),
+            'no wait results': no_wait,
+            'utilisation checked': matched}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=float, default=DEFAULT_WARM_UP_TRIAL_DAYS)
+    parser.add_argument('--reps', type=int, default=N_REPS)
+    parser.add_argument('--check-days', type=float, default=CHECK_DAYS)
+    args = parser.parse_args()
+
+    # the MSER rule considers truncation points up to half way through the
+    # trial, so a warm-up close to that means the waits hadn't settled
+    limit = 0.9 * 60 * 24 * args.days / 2
+
+    rows = []
+    for name, parameters in SCENARIOS.items():
+        start = time.perf_counter()
+        warm_up = find_warm_up(Scenario(**parameters), run_days=args.days, n_reps=args.reps)
+        rows.append({'scenario': name,
+                     'warm-up (days)': warm_up / (60 * 24),
+                     'settled': warm_up < limit,
+                     'seconds': time.perf_counter() - start,
+                     **check_warm_up(parameters, warm_up or 60 * 24 * CHECK_WARM_UP_DAYS,
+                                     args.check_days, args.reps)})
+
+    print(f"{args.reps} trial replications of {args.days} days, "
+          f"then {args.reps} replications of {args.check_days} days after the warm-up")
+    print(pd.DataFrame(rows).set_index('scenario').round(2).to_string())
@@ -0,0 +1,322 @@
+'''
+Caching of the slow stages of the pages:
+* running the simulation
+* working out where everyone is at each snapshot of the animated log
+* counting the number of patients in each state over time
+* building the animated log figure (or the lightweight animation player)
+
+Each stage is cached separately and keyed by the fingerprint of the
+scenario plus the options for that stage, so a rerun of a page (switching
+tabs, moving an unrelated widget) reuses the previous results instead of
+recomputing them.
+
+The app runs in the browser (stlite), where memory is limited, so each
+cache only holds a couple of entries and entries expire after
+CACHE_TTL_SECONDS.
+'''
+
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from model_classes import multiple_replications_async
+from queueing_functions import lockstep_replications, LOCKSTEP_MODELS
+from output_animation_functions import animate_activity_log, state_occupancy
+from timeline_classes import StateTimeline
+from animation_player_functions import animation_player_html
+
+# Number of results kept by each cache
+SIMULATION_CACHE_MAX_ENTRIES = 2
+ANIMATION_CACHE_MAX_ENTRIES = 2
+
+# Seconds before a cached result is discarded
+CACHE_TTL_SECONDS = 30 * 60
+
+
+@st.cache_resource
+def simulation_cache():
+    '''
+    The store of simulation results shared by all pages.
+
+    st.cache_data can't wrap the simulation itself as it is run
+    asynchronously, so results are kept in an OrderedDict
+    (least recently used first) of {key: (time added, results)}.
+
+    Returns:
+    --------
+    collections.OrderedDict
+    '''
+    return OrderedDict()
+
+
+def simulation_key(scenario, n_reps, rc_period):
+    '''
+    The cache key for a set of model replications.
+
+    Take the key before the model is run, as running the model with
+    `multiple_replications_async` updates the scenario's random number
+    set (see `iter_replications`).
+
+    Params:
+    ------
+    scenario: Scenario
+        The scenario to run
+
+    n_reps: int
+        Number of replications
+
+    rc_period: float
+        Results collection period in minutes
+
+    Returns:
+    --------
+    tuple
+    '''
+    return (scenario.fingerprint(), n_reps, rc_period)
+
+
+async def run_simulation(scenario, n_reps, rc_period, progress_callback=None, profiler=None,
+                         cancel_event=None):
+    '''
+    Cached version of
+    `multiple_replications_async(..., return_detailed_logs=True, long_format=True)`
+
+    Models in LOCKSTEP_MODELS are run with `lockstep_replications` instead,
+    which gives identical results far more quickly (so quickly that there is
+    no need to hand control back to the browser while it runs).
+
+    Params:
+    ------
+    scenario: Scenario
+        The scenario to run
+
+    n_reps: int
+        Number of replications
+
+    rc_period: float
+        Results collection period in minutes
+
+    progress_callback: callable, optional (default=None)
+        Passed to `multiple_replications_async`. Not called
+        if cached results are returned, or by the lockstep engine.
+
+    profiler: RunProfiler, optional (default=None)
+        Passed to `multiple_replications_async`. Nothing is recorded
+        if cached results are returned.
+
+    cancel_event: asyncio.Event, optional (default=None)
+        Passed to `multiple_replications_async`. A cancelled run is not
+        cached. Not checked by the lockstep engine, which runs without
+        handing control back.
+
+    Returns:
+    --------
+    dict
+        As returned by `collate_replications`
+    '''
+    cache = simulation_cache()
+    key = simulation_key(scenario, n_reps, rc_period)
+
+    now = time.monotonic()
+    for expired_key in [k for k, (added, _) in cache.items()
+                        if now - added > CACHE_TTL_SECONDS]:
+        del cache[expired_key]
+
+    if key in cache:
+        cache.move_to_end(key)
+    elif scenario.model in LOCKSTEP_MODELS:
+        cache[key] = (now, lockstep_replications(
+            scenario,
+            n_reps=n_reps,
+            rc_period=rc_period,
+            return_detailed_logs=True,
+            long_format=True,
+            profiler=profiler
+        ))
+    else:
+        cache[key] = (now, await multiple_replications_async(
+            scenario,
+            n_reps=n_reps,
+            rc_period=rc_period,
+            return_detailed_logs=True,
+            long_format=True,
+            progress_callback=progress_callback,
+            cancel_event=cancel_event,
+            profiler=profiler
+        ))
+
+    while len(cache) > SIMULATION_CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+
+    detailed_outputs = cache[key][1]
+
+    # The pages add columns to the (small) summary frame, so each caller gets
+    # its own copy. The logs are shared and must not be modified.
+    return dict(detailed_outputs, summary_df=detailed_outputs['summary_df'].copy())
+
+
+@st.cache_data(max_entries=ANIMATION_CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+               show_spinner=False)
+def animation_log(_full_event_log, run_key, rep=1, limit_days=5, every_x_minutes=5):
+    '''
+    Cached snapshots of where everyone is during one replication,
+    for the animated log.
+
+    Params:
+    ------
+    _full_event_log: pandas.DataFrame
+        Long format event log of all replications. Not hashed -
+        the cache is keyed by `run_key` instead.
+
+    run_key: tuple
+        The `simulation_key` of the run that produced the event log
+
+    rep: int, optional (default=1)
+        The replication to animate
+
+    limit_days: int, optional (default=5)
+        Snapshots are taken for the first `limit_days` days
+
+    every_x_minutes: int, optional (default=5)
+        Time between snapshots
+
+    Returns:
+    --------
+    pandas.DataFrame
+        In the same form as the 'full_patient_df' returned by
+        `reshape_for_animations` (see `StateTimeline.states_between`)
+    '''
+    return StateTimeline(_full_event_log, rep=rep).states_between(
+        0, 60 * 24 * limit_days, every_x_minutes)
+
+
+@st.cache_data(max_entries=ANIMATION_CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+               show_spinner=False)
+def occupancy_log(_full_event_log, run_key, every_x_minutes=10):
+    '''
+    Cached number of patients in each state over time for every replication.
+
+    Params:
+    ------
+    _full_event_log: pandas.DataFrame
+        Long format event log of all replications. Not hashed -
+        the cache is keyed by `run_key` instead.
+
+    run_key: tuple
+        The `simulation_key` of the run that produced the event log
+
+    every_x_minutes: int, optional (default=10)
+        Passed to `state_occupancy`
+
+    Returns:
+    --------
+    pandas.DataFrame
+        As returned by `state_occupancy`
+    '''
+    return state_occupancy(_full_event_log, every_x_minutes=every_x_minutes)
+
+
+@st.cache_resource(max_entries=ANIMATION_CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+                   show_spinner=False)
+def animated_log_figure(_full_patient_df, _scenario, run_key, event_position_df,
+                        **display_options):
+    '''
+    Cached version of `animate_activity_log`.
+
+    The figure is shared between reruns, so it must not be modified
+    after it is returned.
+
+    Params:
+    ------
+    _full_patient_df: pandas.DataFrame
+        As for `animate_activity_log`. Not hashed - the cache is keyed by
+        `run_key` instead, so pass the same subset of the log for a given key.
+
+    _scenario: Scenario
+        As for `animate_activity_log`. Not hashed.
+
+    run_key: tuple
+        The `simulation_key` of the run that produced the log
+
+    event_position_df: pandas.DataFrame
+        As for `animate_activity_log`
+
+    **display_options:
+        Any other arguments for `animate_activity_log`
+
+    Returns:
+    --------
+    plotly.graph_objects.Figure
+    '''
+    return animate_activity_log(
+        full_patient_df=_full_patient_df,
+        event_position_df=event_position_df,
+        scenario=_scenario,
+        **display_options
+    )
+
+
+@st.cache_data(max_entries=ANIMATION_CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+               show_spinner=False)
+def animated_log_player(_full_patient_df, _scenario, run_key, event_position_df,
+                        **player_options):
+    '''
+    Cached version of `animation_player_html`.
+
+    Params:
+    ------
+    _full_patient_df: pandas.DataFrame
+        As for `animated_log_figure`. Not hashed.
+
+    _scenario: Scenario
+        As for `animated_log_figure`. Not hashed.
+
+    run_key: tuple
+        The `simulation_key` of the run that produced the log
+
+    event_position_df: pandas.DataFrame
+        As for `animation_player_html`
+
+    **player_options:
+        Any other arguments for `animation_player_html`
+
+    Returns:
+    --------
+    str
+    '''
+    return animation_player_html(
+        full_patient_df=_full_patient_df,
+        event_position_df=event_position_df,
+        scenario=_scenario,
+        **player_options
+    )
+
+
+def show_results(page_key, run_key, button_pressed):
+    '''
+    Whether a page should display results, and remember the run if so.
+
+    Results are shown when the run button has just been pressed, or on
+    any later rerun while the page's inputs still match the last run.
+    Changing an input hides the results until the model is run again.
+
+    Params:
+    ------
+    page_key: str
+        The st.session_state key used to store the page's last run
+
+    run_key: tuple
+        The `simulation_key` for the page's current inputs
+
+    button_pressed: bool
+        Whether the run button was pressed on this run of the page
+
+    Returns:
+    --------
+    bool
+    '''
+    if button_pressed:
+        st.session_state[page_key] = run_key
+
+    return st.session_state.get(page_key) == run_key
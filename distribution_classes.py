@@ -128,11 +128,17 @@ class Lognormal:
         sigma = math.sqrt(math.log(phi**2/m**2))
         return mu, sigma
         
-    def sample(self):
+    def sample(self, size=None):
         """
         Sample from the normal distribution
+
+        Params:
+        -------
+        size: int, optional (default=None)
+            the number of samples to return.  If size=None then a single
+            sample is returned.
         """
-        return self.rng.lognormal(self.mu, self.sigma)
+        return self.rng.lognormal(self.mu, self.sigma, size=size)
 
 
 class Normal:
@@ -27,13 +27,18 @@ in a cubicle before being dicharged.
 In this model treatment of trauma and non-trauma patients is modelled seperately 
 '''
 
+import asyncio
+import hashlib
+import inspect
 import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import simpy
 
 from distribution_classes import (
     Exponential, Normal, Uniform, Bernoulli, Lognormal)
+from profiling_classes import profile_stage, InstrumentedEnvironment
 
 # Constants and defaults for modelling **as-is**
 
@@ -101,6 +106,62 @@ DEFAULT_RESULTS_COLLECTION_PERIOD = 60 * 19
 # number of replications.
 DEFAULT_N_REPS = 5
 
+# simulated minutes to run between handing control back to the event loop
+# when running asynchronously (one simulated day)
+DEFAULT_SLICE_LENGTH = 60 * 24
+
+# resource stores that the model classes attach to the scenario
+MODEL_RESOURCE_ATTRIBUTES = ['triage', 'registration', 'exam', 'trauma',
+                             'cubicle_1', 'cubicle_2', 'treatment']
+
+# Event log columns, and the values each text column can take.
+# The logs are returned as categoricals using these fixed vocabularies so
+# that every replication shares the same category codes and the logs of
+# several replications can be concatenated without reverting to strings.
+EVENT_LOG_COLUMNS = ['patient', 'pathway', 'event_type', 'event',
+                     'time', 'resource_id']
+
+EVENT_TYPE_CATEGORIES = ['arrival_departure', 'queue', 'resource_use',
+                         'resource_use_end', 'attribute_assigned']
+
+PATHWAY_CATEGORIES = {
+    'full': ['Shared', 'Trauma', 'Non-Trauma'],
+    'simplest': ['Simplest'],
+    'simple_with_branch': ['simple_with_branch']
+}
+
+EVENT_CATEGORIES = {
+    'full': ['arrival',
+             'triage_wait_begins', 'triage_begins', 'triage_complete',
+             'TRAUMA_stabilisation_wait_begins', 'TRAUMA_stabilisation_begins',
+             'TRAUMA_stabilisation_complete',
+             'TRAUMA_treatment_wait_begins', 'TRAUMA_treatment_begins',
+             'TRAUMA_treatment_complete',
+             'MINORS_registration_wait_begins', 'MINORS_registration_begins',
+             'MINORS_registration_complete',
+             'MINORS_examination_wait_begins', 'MINORS_examination_begins',
+             'MINORS_examination_complete',
+             'requires_treatment',
+             'MINORS_treatment_wait_begins', 'MINORS_treatment_begins',
+             'MINORS_treatment_ends',
+             'depart'],
+    'simplest': ['arrival',
+                 'treatment_wait_begins', 'treatment_begins', 'treatment_complete',
+                 'depart'],
+    'simple_with_branch': ['arrival',
+                           'examination_wait_begins', 'examination_begins',
+                           'examination_complete',
+                           'requires_treatment', 'does_not_require_treatment',
+                           'treatment_wait_begins', 'treatment_begins',
+                           'treatment_ends',
+                           'depart']
+}
+
+UTILISATION_AUDIT_CATEGORIES = ['registration_clerks', 'triage_bays',
+                                'examination_bays',
+                                'non_trauma_treatment_cubicle_type_1',
+                                'trauma_bays', 'trauma_treatmentcubicle_type_2']
+
 # Show the a trace of simulated events
 # not recommended when running multiple replications
 TRACE = False
@@ -344,6 +405,38 @@ class Scenario:
         self.init_resource_counts(n_triage, n_reg, n_exam, n_trauma,
                                   n_cubicles_1, n_cubicles_2)
 
+    def __getstate__(self):
+        '''
+        Drop the resource stores that a model attaches to the scenario
+        when pickling. They belong to a single simpy environment and are
+        recreated by the next model that uses the scenario, so leaving
+        them out allows a scenario to be sent to worker processes.
+        '''
+        state = self.__dict__.copy()
+        for attribute in MODEL_RESOURCE_ATTRIBUTES:
+            state.pop(attribute, None)
+        return state
+
+    def fingerprint(self):
+        '''
+        A short hash of the parameters the scenario was created with.
+
+        Two scenarios with the same parameters (including the random
+        number set) have the same fingerprint, so it can be used as a key
+        when caching model results.
+        The random number set is read as it is now, so take the fingerprint
+        before running the model (`single_run` updates the random number set).
+
+        Returns:
+        --------
+        str
+        '''
+        parameters = [(name, getattr(self, name, None))
+                      for name in inspect.signature(type(self).__init__).parameters
+                      if name != 'self']
+
+        return hashlib.sha256(repr(parameters).encode()).hexdigest()[:16]
+
     def set_random_no_set(self, random_number_set):
         '''
         Controls the random sampling 
@@ -446,222 +539,184 @@ class Scenario:
 # ## Patient Pathways Process Logic
 
 
-class TraumaPathway:
+class PathwayStage:
     '''
-    Encapsulates the process a patient with severe injuries or illness.
-
-    These patients are signed into the ED and triaged as having severe injuries
-    or illness.
-
-    Patients are stabilised in resus (trauma) and then sent to Treatment.  
-    Following treatment they are discharged.
+    A step of a patient pathway where the patient queues for a resource,
+    uses it for a sampled length of time and then releases it.
+
+    Logs the events '<event>_wait_begins' (queue), '<event>_begins'
+    (resource_use) and '<event>_<end>' (resource_use_end), and records
+    the patient's waiting time, the time they start using the resource
+    and the time spent using it as the attributes 'wait_<metric>',
+    '<metric>_start' and '<metric>_duration'.
     '''
-
-    def __init__(self, identifier, env, args, full_event_log):
+    def __init__(self, event, resource, duration, metric, end='complete'):
         '''
-        Constructor method
+        Constructor
 
         Params:
-        -----
-        identifier: int
-            a numeric identifier for the patient.
+        -------
+        event: str
+            Start of the names of the events logged for the stage
 
-        env: simpy.Environment
-            the simulation environment
+        resource: str
+            Name of the Scenario attribute holding the simpy.Store
+            of resources used by the stage
 
-        args: Scenario
-            Container class for the simulation parameters
+        duration: str
+            Name of the Scenario attribute holding the distribution
+            the time using the resource is sampled from
+
+        metric: str
+            Name of the stage in the patient's metrics
 
+        end: str, optional (default='complete')
+            End of the name of the event logged when the stage is complete
         '''
-        self.identifier = identifier
-        self.env = env
-        self.args = args
-        self.full_event_log = full_event_log
+        self.resource = resource
+        self.duration = duration
 
-        # metrics
-        self.arrival = -np.inf
-        self.wait_triage = -np.inf
-        self.wait_trauma = -np.inf
-        self.wait_treat = -np.inf
-        self.total_time = -np.inf
+        self.wait_event = f'{event}_wait_begins'
+        self.begin_event = f'{event}_begins'
+        self.end_event = f'{event}_{end}'
 
-        self.triage_duration = -np.inf
-        self.trauma_duration = -np.inf
-        self.treat_duration = -np.inf
+        self.wait_attribute = f'wait_{metric}'
+        self.start_attribute = f'{metric}_start'
+        self.duration_attribute = f'{metric}_duration'
 
-    def execute(self):
-        '''
-        simulates the major treatment process for a patient
 
-        1. request and wait for sign-in/triage
-        2. trauma
-        3. treatment
+class PathwayBranch:
+    '''
+    A point where a patient pathway splits.
+
+    A sample from a Bernoulli distribution decides whether the patient
+    goes through the stages of the branch. The result is stored as a patient
+    attribute, and an 'attribute_assigned' event is logged for either outcome
+    if one is given.
+    '''
+    def __init__(self, attribute, distribution, stages,
+                 taken_event=None, not_taken_event=None):
         '''
-        # record the time of arrival and entered the triage queue
-        self.arrival = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'queue',
-             'event': 'triage_wait_begins',
-             'time': self.env.now}
-        )
+        Constructor
 
-        ###################################################
-        # request sign-in/triage
-        triage_resource = yield self.args.triage.get()
-
-        # record the waiting time for triage
-        self.wait_triage = self.env.now - self.arrival
-
-        trace(f'patient {self.identifier} triaged to trauma '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'resource_use',
-             'event': 'triage_begins',
-             'time': self.env.now,
-             'resource_id': triage_resource.id_attribute
-            }
-        )
+        Params:
+        -------
+        attribute: str
+            Name of the patient attribute the sample is stored in
 
-        # sample triage duration.
-        self.triage_duration = self.args.triage_dist.sample()
-        yield self.env.timeout(self.triage_duration)
-        
-        trace(f'triage {self.identifier} complete {self.env.now:.3f}; '
-              f'waiting time was {self.wait_triage:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'resource_use_end',
-             'event': 'triage_complete',
-             'time': self.env.now,
-             'resource_id': triage_resource.id_attribute}
-        )
+        distribution: str
+            Name of the Scenario attribute holding the Bernoulli distribution
 
-        # Resource is no longer in use, so put it back in the store 
-        self.args.triage.put(triage_resource) 
-        ###################################################
-
-        # record the time that entered the trauma queue
-        start_wait = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'queue',
-             'event': 'TRAUMA_stabilisation_wait_begins',
-             'time': self.env.now}
-        )
+        stages: list of PathwayStage
+            The stages for patients who go down the branch
 
-        ###################################################
-        # request trauma room
-        trauma_resource = yield self.args.trauma.get()
-
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Trauma',
-                'event_type': 'resource_use',
-                'event': 'TRAUMA_stabilisation_begins',
-                'time': self.env.now,
-                'resource_id': trauma_resource.id_attribute
-                }
-        )
+        taken_event: str, optional (default=None)
+            Event logged for patients who go down the branch
 
-        # record the waiting time for trauma
-        self.wait_trauma = self.env.now - start_wait
-
-        # sample stablisation duration.
-        self.trauma_duration = self.args.trauma_dist.sample()
-        yield self.env.timeout(self.trauma_duration)
-
-        trace(f'stabilisation of patient {self.identifier} at '
-              f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'resource_use_end',
-             'event': 'TRAUMA_stabilisation_complete',
-             'time': self.env.now,
-             'resource_id': trauma_resource.id_attribute
-            }
-        )
-        # Resource is no longer in use, so put it back in the store
-        self.args.trauma.put(trauma_resource)
-        
-        #######################################################
-
-        # record the time that entered the treatment queue
-        start_wait = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'queue',
-             'event': 'TRAUMA_treatment_wait_begins',
-             'time': self.env.now}
-        )
+        not_taken_event: str, optional (default=None)
+            Event logged for patients who don't
+        '''
+        self.attribute = attribute
+        self.distribution = distribution
+        self.stages = stages
+        self.taken_event = taken_event
+        self.not_taken_event = not_taken_event
 
-        ########################################################
-        # request treatment cubicle
-        trauma_treatment_resource = yield self.args.cubicle_2.get()
-
-        # record the waiting time for trauma
-        self.wait_treat = self.env.now - start_wait
-        trace(f'treatment of patient {self.identifier} at '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Trauma',
-                'event_type': 'resource_use',
-                'event': 'TRAUMA_treatment_begins',
-                'time': self.env.now,
-                'resource_id': trauma_treatment_resource.id_attribute
-                }
-        )
 
-        # sample treatment duration.
-        self.treat_duration = self.args.trauma_dist.sample()
-        yield self.env.timeout(self.treat_duration)
-
-        trace(f'patient {self.identifier} treatment complete {self.env.now:.3f}; '
-              f'waiting time was {self.wait_treat:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Trauma',
-             'event_type': 'resource_use_end',
-             'event': 'TRAUMA_treatment_complete',
-             'time': self.env.now,
-             'resource_id': trauma_treatment_resource.id_attribute}
-        )
-        self.full_event_log.append(
-            {'patient': self.identifier,
-            'pathway': 'Shared',
-            'event': 'depart',
-            'event_type': 'arrival_departure',
-            'time': self.env.now}
-        )
+class PathwaySpec:
+    '''
+    Declarative description of a patient pathway, run by `PatientPathway`.
 
-        # Resource is no longer in use, so put it back in the store
-        self.args.cubicle_2.put(trauma_treatment_resource) 
+    Patients go through the steps in order, then depart.
+    '''
+    def __init__(self, name, steps, log_arrival=False, depart_pathway='Shared'):
+        '''
+        Constructor
 
-        #########################################################
+        Params:
+        -------
+        name: str
+            The pathway recorded in the event log
 
-        # total time in system
-        self.total_time = self.env.now - self.arrival
+        steps: list of PathwayStage and PathwayBranch
 
-class NonTraumaPathway(object):
-    '''
-    Encapsulates the process a patient with minor injuries and illness.
+        log_arrival: bool, optional (default=False)
+            Log the patient's arrival at the start of the pathway.
+            The full model logs arrivals in its arrivals generator instead.
+
+        depart_pathway: str, optional (default='Shared')
+            The pathway recorded for the depart event
+        '''
+        self.name = name
+        self.steps = steps
+        self.log_arrival = log_arrival
+        self.depart_pathway = depart_pathway
+
+    def stages(self):
+        '''
+        Every stage of the pathway, including those in branches
 
-    These patients are signed into the ED and triaged as having minor 
-    complaints and streamed to registration and then examination. 
+        Returns:
+        --------
+        list of PathwayStage
+        '''
+        stages = []
+        for step in self.steps:
+            stages.extend(step.stages if isinstance(step, PathwayBranch) else [step])
+        return stages
+
+
+# Patients with severe injuries or illness are triaged, stabilised in
+# resus (trauma) and then sent to treatment, after which they are discharged.
+# (Trauma treatment times are sampled from the stabilisation distribution.)
+TRAUMA_PATHWAY = PathwaySpec('Trauma', [
+    PathwayStage('triage', 'triage', 'triage_dist', 'triage'),
+    PathwayStage('TRAUMA_stabilisation', 'trauma', 'trauma_dist', 'trauma'),
+    PathwayStage('TRAUMA_treatment', 'cubicle_2', 'trauma_dist', 'treat')
+])
+
+# Patients with minor injuries and illness are triaged, registered and
+# examined. Some then require treatment before they are discharged.
+NON_TRAUMA_PATHWAY = PathwaySpec('Non-Trauma', [
+    PathwayStage('triage', 'triage', 'triage_dist', 'triage'),
+    PathwayStage('MINORS_registration', 'registration', 'reg_dist', 'reg'),
+    PathwayStage('MINORS_examination', 'exam', 'exam_dist', 'exam'),
+    PathwayBranch('require_treat', 'nt_p_treat_dist',
+                  [PathwayStage('MINORS_treatment', 'cubicle_1', 'nt_treat_dist', 'treat',
+                                end='ends')],
+                  taken_event='requires_treatment')
+])
+
+# Patients are seen and treated by a nurse as soon as one is available,
+# then discharged.
+SIMPLEST_PATHWAY = PathwaySpec('Simplest', [
+    PathwayStage('treatment', 'treatment', 'treat_dist', 'treat')
+], log_arrival=True, depart_pathway='Simplest')
+
+# Patients are examined by a nurse. Some then require treatment before
+# they are discharged.
+SIMPLE_BRANCHED_PATHWAY = PathwaySpec('simple_with_branch', [
+    PathwayStage('examination', 'exam', 'exam_dist', 'exam'),
+    PathwayBranch('require_treat', 'nt_p_treat_dist',
+                  [PathwayStage('treatment', 'treatment', 'nt_treat_dist', 'treat',
+                                end='ends')],
+                  taken_event='requires_treatment',
+                  not_taken_event='does_not_require_treatment')
+], log_arrival=True, depart_pathway='simple_with_branch')
+
+
+class PatientPathway:
+    '''
+    The process a patient goes through, as described by a PathwaySpec.
 
-    Post examination 40% are discharged while 60% proceed to treatment.  
-    Following treatment they are discharged.
+    Each model starts one of these processes for every patient who
+    arrives. The metrics of each stage (waiting time and duration) are
+    kept as attributes of the patient for SimulationSummary, and are
+    -np.inf for stages the patient didn't reach.
     '''
+    spec = None
 
-    def __init__(self, identifier, env, args, full_event_log):
+    def __init__(self, identifier, env, args, full_event_log, spec=None):
         '''
         Constructor method
 
@@ -676,252 +731,154 @@ class NonTraumaPathway(object):
         args: Scenario
             Container class for the simulation parameters
 
+        full_event_log: list
+            The model's event log, which the patient's events are added to
+
+        spec: PathwaySpec, optional (default=None)
+            The pathway to follow. Defaults to the `spec` of the class.
         '''
         self.identifier = identifier
         self.env = env
         self.args = args
         self.full_event_log = full_event_log
 
-        # triage resource
-        self.triage = args.triage
+        if spec is not None:
+            self.spec = spec
 
         # metrics
         self.arrival = -np.inf
-        self.wait_triage = -np.inf
-        self.wait_reg = -np.inf
-        self.wait_exam = -np.inf
-        self.wait_treat = -np.inf
         self.total_time = -np.inf
 
-        self.triage_duration = -np.inf
-        self.reg_duration = -np.inf
-        self.exam_duration = -np.inf
-        self.treat_duration = -np.inf
+        for stage in self.spec.stages():
+            setattr(self, stage.wait_attribute, -np.inf)
+            setattr(self, stage.start_attribute, -np.inf)
+            setattr(self, stage.duration_attribute, -np.inf)
 
     def execute(self):
         '''
-        simulates the non-trauma/minor treatment process for a patient
-
-        1. request and wait for sign-in/triage
-        2. patient registration
-        3. examination
-        4.1 40% discharged
-        4.2 60% treatment then discharge
-        '''
-        # record the time of arrival and entered the triage queue
-        self.arrival = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Non-Trauma',
-             'event_type': 'queue',
-             'event': 'triage_wait_begins',
-             'time': self.env.now}
-        )
-
-        ###################################################
-        # request sign-in/triage
-        triage_resource = yield self.args.triage.get()
-
-        # record the waiting time for triage
-        self.wait_triage = self.env.now - self.arrival
-        trace(f'patient {self.identifier} triaged to minors '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event_type': 'resource_use',
-                'event': 'triage_begins',
-                'time': self.env.now,
-                'resource_id': triage_resource.id_attribute
-                }
-        )
-
-        # sample triage duration.
-        self.triage_duration = self.args.triage_dist.sample()
-        yield self.env.timeout(self.triage_duration)
-
-        trace(f'triage {self.identifier} complete {self.env.now:.3f}; '
-                f'waiting time was {self.wait_triage:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event_type': 'resource_use_end',
-                'event': 'triage_complete',
-                'time': self.env.now,
-                'resource_id': triage_resource.id_attribute}
-        )
+        simulates the patient's pathway from arrival to departure
 
-        # Resource is no longer in use, so put it back in the store 
-        self.args.triage.put(triage_resource) 
-        #########################################################
-
-        # record the time that entered the registration queue
-        start_wait = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Non-Trauma',
-             'event_type': 'queue',
-             'event': 'MINORS_registration_wait_begins',
-             'time': self.env.now}
-        )
+        All the steps are run by this one generator (with the steps still
+        to do kept on a stack, so a branch adds its stages to the top).
+        The event log, environment and patient details are looked up once
+        rather than for every event, and trace messages are only formatted
+        when tracing is on.
+        '''
+        env = self.env
+        args = self.args
+        log = self.full_event_log.append
+        patient = self.identifier
+        pathway = self.spec.name
 
-        #########################################################
-        # request registration clerk
-        registration_resource = yield self.args.registration.get()
-            
-        # record the waiting time for registration
-        self.wait_reg = self.env.now - start_wait
-        trace(f'registration of patient {self.identifier} at '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event_type': 'resource_use',
-                'event': 'MINORS_registration_begins',
-                'time': self.env.now,
-                'resource_id': registration_resource.id_attribute
-                }
-        )
+        self.arrival = env.now
 
-        # sample registration duration.
-        self.reg_duration = self.args.reg_dist.sample()
-        yield self.env.timeout(self.reg_duration)
-
-        trace(f'patient {self.identifier} registered at'
-                f'{self.env.now:.3f}; '
-                f'waiting time was {self.wait_reg:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event': 'MINORS_registration_complete',
-                'event_type': 'resource_use_end',
-                'time': self.env.now,
-                'resource_id': registration_resource.id_attribute}
-        )
-        # Resource is no longer in use, so put it back in the store
-        self.args.registration.put(registration_resource)
-        ########################################################
-
-        # record the time that entered the evaluation queue
-        start_wait = self.env.now
-
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Non-Trauma',
-             'event': 'MINORS_examination_wait_begins',
-             'event_type': 'queue',
-             'time': self.env.now}
-        )
+        if self.spec.log_arrival:
+            log({'patient': patient,
+                 'pathway': pathway,
+                 'event_type': 'arrival_departure',
+                 'event': 'arrival',
+                 'time': env.now})
 
-        #########################################################
-        # request examination resource
-        examination_resource = yield self.args.exam.get()
-
-        # record the waiting time for examination to begin
-        self.wait_exam = self.env.now - start_wait
-        trace(f'examination of patient {self.identifier} begins '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event': 'MINORS_examination_begins',
-                'event_type': 'resource_use',
-                'time': self.env.now,
-                'resource_id': examination_resource.id_attribute
-                }
-        )
+        steps = self.spec.steps[::-1]
 
-        # sample examination duration.
-        self.exam_duration = self.args.exam_dist.sample()
-        yield self.env.timeout(self.exam_duration)
-
-        trace(f'patient {self.identifier} examination complete '
-                f'at {self.env.now:.3f};'
-                f'waiting time was {self.wait_exam:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Non-Trauma',
-                'event': 'MINORS_examination_complete',
-                'event_type': 'resource_use_end',
-                'time': self.env.now,
-                'resource_id': examination_resource.id_attribute}
-        )
-        # Resource is no longer in use, so put it back in
-        self.args.exam.put(examination_resource) 
-        ############################################################################
+        while steps:
+            step = steps.pop()
 
-        # sample if patient requires treatment?
-        self.require_treat = self.args.nt_p_treat_dist.sample()  #pylint: disable=attribute-defined-outside-init
+            if isinstance(step, PathwayBranch):
+                taken = getattr(args, step.distribution).sample()
+                setattr(self, step.attribute, taken)
 
-        if self.require_treat:
+                event = step.taken_event if taken else step.not_taken_event
+                if event is not None:
+                    log({'patient': patient,
+                         'pathway': pathway,
+                         'event': event,
+                         'event_type': 'attribute_assigned',
+                         'time': env.now})
 
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                 'pathway': 'Non-Trauma',
-                 'event': 'requires_treatment',
-                 'event_type': 'attribute_assigned',
-                 'time': self.env.now}
-            )
+                if taken:
+                    steps.extend(step.stages[::-1])
+                continue
 
-            # record the time that entered the treatment queue
-            start_wait = self.env.now
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                 'pathway': 'Non-Trauma',
-                 'event': 'MINORS_treatment_wait_begins',
+            # queue for the resource
+            start_wait = env.now
+            log({'patient': patient,
+                 'pathway': pathway,
                  'event_type': 'queue',
-                 'time': self.env.now}
-            )
-            ###################################################
-            # request treatment cubicle
-
-            non_trauma_treatment_resource = yield self.args.cubicle_1.get()
-
-            # record the waiting time for treatment
-            self.wait_treat = self.env.now - start_wait
-            trace(f'treatment of patient {self.identifier} begins '
-                    f'{self.env.now:.3f}')
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                    'pathway': 'Non-Trauma',
-                    'event': 'MINORS_treatment_begins',
-                    'event_type': 'resource_use',
-                    'time': self.env.now,
-                    'resource_id': non_trauma_treatment_resource.id_attribute
-                }
-            )
-
-            # sample treatment duration.
-            self.treat_duration = self.args.nt_treat_dist.sample()
-            yield self.env.timeout(self.treat_duration)
-
-            trace(f'patient {self.identifier} treatment complete '
-                    f'at {self.env.now:.3f};'
-                    f'waiting time was {self.wait_treat:.3f}')
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                    'pathway': 'Non-Trauma',
-                    'event': 'MINORS_treatment_ends',
-                    'event_type': 'resource_use_end',
-                    'time': self.env.now,
-                    'resource_id': non_trauma_treatment_resource.id_attribute}
-            )
+                 'event': step.wait_event,
+                 'time': start_wait})
+
+            store = getattr(args, step.resource)
+            resource = yield store.get()
+
+            wait = env.now - start_wait
+            setattr(self, step.wait_attribute, wait)
+            setattr(self, step.start_attribute, env.now)
+            if TRACE:
+                trace(f'{step.begin_event} for patient {patient} at {env.now:.3f}; '
+                      f'waiting time was {wait:.3f}')
+            log({'patient': patient,
+                 'pathway': pathway,
+                 'event_type': 'resource_use',
+                 'event': step.begin_event,
+                 'time': env.now,
+                 'resource_id': resource.id_attribute})
+
+            # use the resource for a sampled length of time
+            duration = getattr(args, step.duration).sample()
+            setattr(self, step.duration_attribute, duration)
+            yield env.timeout(duration)
+
+            log({'patient': patient,
+                 'pathway': pathway,
+                 'event_type': 'resource_use_end',
+                 'event': step.end_event,
+                 'time': env.now,
+                 'resource_id': resource.id_attribute})
 
             # Resource is no longer in use, so put it back in the store
-            self.args.cubicle_1.put(non_trauma_treatment_resource)
-        ##########################################################################
-
-        # Return to what happens to all patients, regardless of whether they were sampled as needing treatment
-        self.full_event_log.append(
-            {'patient': self.identifier,
-            'pathway': 'Shared',
-            'event': 'depart',
-            'event_type': 'arrival_departure',
-            'time': self.env.now}
-        )
+            store.put(resource)
+
+        log({'patient': patient,
+             'pathway': self.spec.depart_pathway,
+             'event': 'depart',
+             'event_type': 'arrival_departure',
+             'time': env.now})
 
         # total time in system
-        self.total_time = self.env.now - self.arrival
+        self.total_time = env.now - self.arrival
+
+
+class TraumaPathway(PatientPathway):
+    '''
+    Encapsulates the process a patient with severe injuries or illness
+    (see TRAUMA_PATHWAY).
+    '''
+    spec = TRAUMA_PATHWAY
+
+
+class NonTraumaPathway(PatientPathway):
+    '''
+    Encapsulates the process a patient with minor injuries and illness
+    (see NON_TRAUMA_PATHWAY).
+    '''
+    spec = NON_TRAUMA_PATHWAY
+
+
+class SimplePathway(PatientPathway):
+    '''
+    Encapsulates the process for a patient who is seen and treated by a
+    nurse (see SIMPLEST_PATHWAY).
+    '''
+    spec = SIMPLEST_PATHWAY
+
+
+class SimpleBranchedPathway(PatientPathway):
+    '''
+    Encapsulates the process for a patient who is examined by a nurse and
+    may then require treatment (see SIMPLE_BRANCHED_PATHWAY).
+    '''
+    spec = SIMPLE_BRANCHED_PATHWAY
 
 
 class TreatmentCentreModel:
@@ -939,8 +896,8 @@ class TreatmentCentreModel:
 
     '''
 
-    def __init__(self, args):
-        self.env = simpy.Environment()
+    def __init__(self, args, env=None):
+        self.env = simpy.Environment() if env is None else env
         self.args = args
         self.init_resources()
 
@@ -948,12 +905,21 @@ class TreatmentCentreModel:
         self.trauma_patients = []
         self.non_trauma_patients = []
 
+        # patients who arrived during the warm-up (only used to count
+        # the time they use the resources after it)
+        self.warm_up_trauma_patients = []
+        self.warm_up_non_trauma_patients = []
+
         self.rc_period = None
+        self.warm_up = 0
         self.results = None
 
         self.full_event_log = []
         self.utilisation_audit = []
 
+        # number of candidate arrival times sampled by the thinning algorithm
+        self.thinning_samples = 0
+
     def init_resources(self):
         '''
         Init the number of resources
@@ -1053,9 +1019,10 @@ class TreatmentCentreModel:
                     id_attribute = i+1)
                 )
 
-    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD):
+    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+            warm_up=0):
         '''
-        Conduct a single run of the model in its current 
+        Conduct a single run of the model in its current
         configuration
 
 
@@ -1067,7 +1034,35 @@ class TreatmentCentreModel:
         warm_up, float, optional (default=0)
 
             length of initial transient period to truncate
-            from results.
+            from results. The model runs for warm_up +
+            results_collection_period, and patients who arrive
+            during the warm-up are not recorded.
+
+        Returns:
+        --------
+            None
+        '''
+        self.init_processes(results_collection_period, warm_up)
+
+        # run
+        self.env.run(until=warm_up + results_collection_period)
+
+    def init_processes(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                       warm_up=0):
+        '''
+        Register the model processes with the simulation environment
+        and store the results collection period.
+
+        Split out from `run()` so that the environment can instead be
+        advanced in slices (see `single_run_async`).
+
+        Parameters:
+        ----------
+        results_collection_period, float, optional
+            default = DEFAULT_RESULTS_COLLECTION_PERIOD
+
+        warm_up, float, optional (default=0)
+            As for `run()`
 
         Returns:
         --------
@@ -1109,9 +1104,7 @@ class TreatmentCentreModel:
 
         # store rc period
         self.rc_period = results_collection_period
-
-        # run
-        self.env.run(until=results_collection_period)
+        self.warm_up = warm_up
 
         # self.utilisation_audit.append(
 
@@ -1143,6 +1136,11 @@ class TreatmentCentreModel:
         '''
 
         while True:
+            # Wait until the warm-up is over before recording
+            if self.env.now < self.warm_up:
+                yield self.env.timeout(interval)
+                continue
+
             # Record time
             if isinstance(resources, list):
                 for i in range(len(resources)):
@@ -1198,12 +1196,20 @@ class TreatmentCentreModel:
                 while u >= (lambda_t / self.args.lambda_max):
                     interarrival_time += self.args.arrival_dist.sample()
                     u = self.args.thinning_rng.sample()
+                    self.thinning_samples += 1
 
             # iat
             yield self.env.timeout(interarrival_time)
 
             trace(f'patient {patient_count} arrives at: {self.env.now:.3f}')
-            self.full_event_log.append(
+
+            # patients who arrive during the warm-up still use the
+            # resources, but their events and KPIs aren't recorded
+            # (apart from their use of the resources after the warm-up)
+            recorded = self.env.now >= self.warm_up
+            event_log = self.full_event_log if recorded else []
+
+            event_log.append(
                 {'patient': patient_count,
                  'pathway': 'Shared',
                  'event': 'arrival',
@@ -1217,13 +1223,19 @@ class TreatmentCentreModel:
             if trauma:
                 # create and store a trauma patient to update KPIs.
                 new_patient = TraumaPathway(
-                    patient_count, self.env, self.args, self.full_event_log)
-                self.trauma_patients.append(new_patient)
+                    patient_count, self.env, self.args, event_log)
+                if recorded:
+                    self.trauma_patients.append(new_patient)
+                else:
+                    self.warm_up_trauma_patients.append(new_patient)
             else:
                 # create and store a non-trauma patient to update KPIs.
                 new_patient = NonTraumaPathway(patient_count, self.env,
-                                               self.args, self.full_event_log)
-                self.non_trauma_patients.append(new_patient)
+                                               self.args, event_log)
+                if recorded:
+                    self.non_trauma_patients.append(new_patient)
+                else:
+                    self.warm_up_non_trauma_patients.append(new_patient)
 
             # start the pathway process for the patient
             self.env.process(new_patient.execute())
@@ -1270,7 +1282,8 @@ class SimulationSummary:
             # triage utilisation (both types of patient)
             treat_util = self.get_resource_util('treat_duration',
                                                 self.args.n_cubicles_1,
-                                                self.model.patients)
+                                                self.model.warm_up_patients
+                                                + self.model.patients)
 
             mean_total = self.get_mean_metric('total_time', self.model.patients)
 
@@ -1293,7 +1306,8 @@ class SimulationSummary:
             # examination utilisation (non-trauma)
             exam_util = self.get_resource_util('exam_duration',
                                             self.args.n_exam,
-                                            self.model.patients)
+                                            self.model.warm_up_patients
+                                            + self.model.patients)
 
             mean_treat_wait = self.get_mean_metric('wait_treat', self.model.patients)
 
@@ -1304,7 +1318,8 @@ class SimulationSummary:
             # triage utilisation (both types of patient)
             treat_util = self.get_resource_util('treat_duration',
                                                 self.args.n_cubicles_1,
-                                                self.model.patients)
+                                                self.model.warm_up_patients
+                                                + self.model.patients)
 
             mean_total = self.get_mean_metric('total_time', self.model.patients)
 
@@ -1323,13 +1338,19 @@ class SimulationSummary:
         # list of all patients
             patients = self.model.non_trauma_patients + self.model.trauma_patients
 
+            # and those who arrived during the warm-up, for the utilisation
+            # of the resources after it
+            non_trauma_in_use = self.model.warm_up_non_trauma_patients \
+                + self.model.non_trauma_patients
+            trauma_in_use = self.model.warm_up_trauma_patients + self.model.trauma_patients
+
             # mean triage times (both types of patient)
             mean_triage_wait = self.get_mean_metric('wait_triage', patients)
 
             # triage utilisation (both types of patient)
             triage_util = self.get_resource_util('triage_duration',
                                                 self.args.n_triage,
-                                                patients)
+                                                non_trauma_in_use + trauma_in_use)
 
             # mean waiting time for registration (non_trauma)
             mean_reg_wait = self.get_mean_metric('wait_reg',
@@ -1338,7 +1359,7 @@ class SimulationSummary:
             # registration utilisation (trauma)
             reg_util = self.get_resource_util('reg_duration',
                                             self.args.n_reg,
-                                            self.model.non_trauma_patients)
+                                            non_trauma_in_use)
 
             # mean waiting time for examination (non_trauma)
             mean_wait_exam = self.get_mean_metric('wait_exam',
@@ -1347,7 +1368,7 @@ class SimulationSummary:
             # examination utilisation (non-trauma)
             exam_util = self.get_resource_util('exam_duration',
                                             self.args.n_exam,
-                                            self.model.non_trauma_patients)
+                                            non_trauma_in_use)
 
             # mean waiting time for treatment (non-trauma)
             mean_treat_wait = self.get_mean_metric('wait_treat',
@@ -1356,7 +1377,7 @@ class SimulationSummary:
             # treatment utilisation (non_trauma)
             treat_util1 = self.get_resource_util('treat_duration',
                                                 self.args.n_cubicles_1,
-                                                self.model.non_trauma_patients)
+                                                non_trauma_in_use)
 
             # mean total time (non_trauma)
             mean_total = self.get_mean_metric('total_time',
@@ -1369,7 +1390,7 @@ class SimulationSummary:
             # trauma utilisation (trauma)
             trauma_util = self.get_resource_util('trauma_duration',
                                                 self.args.n_trauma,
-                                                self.model.trauma_patients)
+                                                trauma_in_use)
 
             # mean waiting time for treatment (rauma)
             mean_treat_wait2 = self.get_mean_metric('wait_treat',
@@ -1378,7 +1399,7 @@ class SimulationSummary:
             # treatment utilisation (trauma)
             treat_util2 = self.get_resource_util('treat_duration',
                                                 self.args.n_cubicles_2,
-                                                self.model.trauma_patients)
+                                                trauma_in_use)
 
             # mean total time (trauma)
             mean_total2 = self.get_mean_metric('total_time',
@@ -1430,7 +1451,7 @@ class SimulationSummary:
         the select cohort of patients,
 
         Only calculates metrics for patients where it has been 
-        measured.
+        measured. np.nan if it hasn't been measured for any of them.
 
         Params:
         -------
@@ -1444,6 +1465,10 @@ class SimulationSummary:
                          if getattr(p, metric) < target]))
         total = len(np.array([getattr(p, metric) for p in patients
                          if getattr(p, metric) > -np.inf]))
+
+        # (e.g. after a warm-up, none of the patients may have started)
+        if total == 0:
+            return np.nan
         return met/total
 
     def get_resource_util(self, metric, n_resources, patients):
@@ -1451,7 +1476,10 @@ class SimulationSummary:
         Calculate proportion of the results collection period
         where a resource was in use.
 
-        Done by tracking the duration by patient.
+        Done by tracking the duration by patient. After a warm-up, only
+        the part of each patient's use of the resource after the warm-up
+        is counted (use that carries on past the end of the run is
+        counted in full, as it is without a warm-up).
 
         Only calculates metrics for patients where it has been 
         measured.
@@ -1459,13 +1487,24 @@ class SimulationSummary:
         Params:
         -------
         metric: str
-            The name of the metric e.g. 'treatment_duration'
+            The name of the metric e.g. 'treat_duration'
 
         patients: list
-            A list of patients
+            A list of patients, in order of arrival (including those who
+            arrived during the warm-up, who may still be using the resource
+            after it)
         '''
-        total = np.array([getattr(p, metric) for p in patients
-                         if getattr(p, metric) > -np.inf]).sum()
+        # the start of each use of the resource is recorded as '<metric>_start'
+        start_metric = metric[:-len('_duration')] + '_start'
+
+        start = np.array([getattr(p, start_metric) for p in patients
+                          if getattr(p, metric) > -np.inf], dtype=np.float64)
+        duration = np.array([getattr(p, metric) for p in patients
+                             if getattr(p, metric) > -np.inf], dtype=np.float64)
+
+        # (with no warm-up, this is the total of the durations)
+        before_warm_up = np.clip(self.model.warm_up - start, 0, None)
+        total = np.clip(duration - before_warm_up, 0, None).sum()
 
         return total / (self.model.rc_period * n_resources)
 
@@ -1546,7 +1585,11 @@ class SimulationSummary:
 def single_run(scenario, rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
                random_no_set=1,
                utilisation_audit_interval=1,
-               return_detailed_logs=False
+               return_detailed_logs=False,
+               float32_times=False,
+               profiler=None,
+               return_event_stats=False,
+               warm_up=0
                ):
     '''
     Perform a single run of the model and return the results
@@ -1565,45 +1608,283 @@ def single_run(scenario, rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
         model.  Set to different ints to get different results.  Set to None
         for a random set of seeds.
 
+    float32_times: bool, optional (default=False)
+        Only used when return_detailed_logs is True.
+        Store the times in the detailed logs as float32
+        (see `event_log_to_frame`).
+
+    profiler: RunProfiler, optional (default=None)
+        If given, the time spent running the model, summarising the
+        results and converting the logs to DataFrames is recorded
+        (see profiling_classes).
+
+    return_event_stats: bool, optional (default=False)
+        If True, run the model in an InstrumentedEnvironment and also
+        return a dictionary of the counts it recorded (see
+        `InstrumentedEnvironment.summary`) plus 'thinning_samples'
+        (candidate arrival times sampled by the arrivals generator)
+        and 'processes' (the frame from `InstrumentedEnvironment.process_frame`).
+
+    warm_up: float, optional (default=0)
+        Minutes to run the model before collecting results.
+        Patients who arrive during the warm-up are not included in
+        the results or logs (see `TreatmentCentreModel.run`).
+
     Returns:
     --------
         pandas.DataFrame:
         results from single run.
+        or tuple (results, event statistics) if return_event_stats is True
     '''
     # set random number set - this controls sampling for the run.
     scenario.set_random_no_set(random_no_set)
 
     # create an instance of the model
+    model = create_model(scenario,
+                         env=InstrumentedEnvironment() if return_event_stats else None)
+
+    # run the model
+    with profile_stage(profiler, 'simpy_run') as stage:
+        model.run(results_collection_period=rc_period, warm_up=warm_up)
+        stage['rows'] = len(model.full_event_log)
+
+    results = collect_run_results(model, return_detailed_logs, float32_times, profiler)
+
+    if return_event_stats:
+        return results, dict(model.env.summary(),
+                             thinning_samples=model.thinning_samples,
+                             processes=model.env.process_frame())
+
+    return results
+
+
+def create_model(scenario, env=None):
+    '''
+    Create an instance of the model class matching `scenario.model`
+
+    Parameters:
+    -----------
+    scenario: Scenario object
+        The scenario/paramaters to run
+
+    env: simpy.Environment, optional (default=None)
+        The environment to run the model in (e.g. an InstrumentedEnvironment).
+        A new simpy.Environment is created if not given.
+
+    Returns:
+    --------
+        TreatmentCentreModel, TreatmentCentreModelSimpleNurseStepOnly
+        or TreatmentCentreModelSimpleBranchedPathway
+    '''
     if scenario.model == "full":
-        model = TreatmentCentreModel(scenario)
+        model = TreatmentCentreModel(scenario, env)
     if scenario.model == "simplest":
-        model = TreatmentCentreModelSimpleNurseStepOnly(scenario)
+        model = TreatmentCentreModelSimpleNurseStepOnly(scenario, env)
     if scenario.model == "simple_with_branch":
-        model = TreatmentCentreModelSimpleBranchedPathway(scenario)
+        model = TreatmentCentreModelSimpleBranchedPathway(scenario, env)
 
-    # run the model
-    model.run(results_collection_period=rc_period)
+    return model
+
+
+def collect_run_results(model, return_detailed_logs=False, float32_times=False,
+                        profiler=None):
+    '''
+    Summarise a model that has finished running
+
+    Parameters:
+    -----------
+    model: TreatmentCentreModel (or one of the simplified model classes)
+        A model whose environment has been run to the end of its
+        results collection period
 
+    return_detailed_logs: bool, optional (default=False)
+        If True, return a dictionary of the event log, patient log,
+        utilisation audit and summary frame rather than just the
+        summary frame.
+
+    float32_times: bool, optional (default=False)
+        Only used when return_detailed_logs is True.
+        If True, times in the event log and utilisation audit are
+        stored as float32 rather than float64.
+
+    profiler: RunProfiler, optional (default=None)
+        If given, the time spent summarising the results and converting
+        the logs to DataFrames is recorded.
+
+    Returns:
+    --------
+        pandas.DataFrame or dict
+    '''
     # run results
     summary = SimulationSummary(model)
 
+    # (the logs are converted before the results are summarised, so the
+    # patient log is recorded before process_run_results fills it in)
     if return_detailed_logs:
-        return {
-            'full_event_log': pd.DataFrame(model.full_event_log),
-            'patient_log':  pd.DataFrame(summary.patient_log),
-            'utilisation_audit': pd.DataFrame(model.utilisation_audit),
-            'summary_df': summary.summary_frame()
-        }
+        with profile_stage(profiler, 'dataframe_conversion') as stage:
+            detailed_logs = {
+                'full_event_log': event_log_to_frame(model.full_event_log,
+                                                     model.args.model,
+                                                     float32_times=float32_times),
+                'patient_log':  pd.DataFrame(summary.patient_log),
+                'utilisation_audit': utilisation_audit_to_frame(model.utilisation_audit,
+                                                                float32_times=float32_times)
+            }
+            stage['rows'] = sum(len(df) for df in detailed_logs.values())
+
+    with profile_stage(profiler, 'simulation_summary', rows=len(model.full_event_log)):
+        summary_df = summary.summary_frame()
 
-    summary_df = summary.summary_frame()
+    if return_detailed_logs:
+        return dict(detailed_logs, summary_df=summary_df)
 
     return summary_df
 
 
+def categorical_column(values, categories):
+    '''
+    Convert a list of labels to a categorical with a fixed set of
+    categories.
+
+    Any label that is not in `categories` is added to the end of the
+    categories rather than being silently replaced with NaN.
+
+    Parameters:
+    -----------
+    values: list
+        Labels to convert
+
+    categories: list
+        The expected labels, in the order the categories should take
+
+    Returns:
+    --------
+        pandas.Categorical
+    '''
+    column = pd.Categorical(values, categories=categories)
+
+    if column.isna().any():
+        extra = sorted(set(value for value in values
+                           if value is not None and value not in categories))
+        if extra:
+            column = pd.Categorical(values, categories=list(categories) + extra)
+
+    return column
+
+
+def event_log_to_frame(event_log, model_name='full', float32_times=False):
+    '''
+    Convert the event log recorded by a model into a compact DataFrame.
+
+    pathway, event_type and event are returned as categoricals using the
+    fixed vocabularies for the model (see EVENT_CATEGORIES),
+    patient as int32, resource_id as a nullable Int8 (missing for events
+    that don't use a resource) and time as float64, or float32 if requested.
+    The columns are always returned in the order given by EVENT_LOG_COLUMNS.
+
+    Parameters:
+    -----------
+    event_log: list of dict
+        The model's full_event_log
+
+    model_name: str, optional (default='full')
+        The name of the model that produced the log
+        ('full', 'simplest' or 'simple_with_branch')
+
+    float32_times: bool, optional (default=False)
+        Store the event times with single precision.
+
+    Returns:
+    --------
+        pandas.DataFrame
+    '''
+    def column(name):
+        return [event.get(name) for event in event_log]
+
+    return pd.DataFrame({
+        'patient': np.array(column('patient'), dtype=np.int32),
+        'pathway': categorical_column(column('pathway'),
+                                      PATHWAY_CATEGORIES[model_name]),
+        'event_type': categorical_column(column('event_type'),
+                                         EVENT_TYPE_CATEGORIES),
+        'event': categorical_column(column('event'),
+                                    EVENT_CATEGORIES[model_name]),
+        'time': np.array(column('time'),
+                         dtype=np.float32 if float32_times else np.float64),
+        'resource_id': pd.array(column('resource_id'), dtype='Int8')
+    }, columns=EVENT_LOG_COLUMNS)
+
+
+def utilisation_audit_to_frame(utilisation_audit, float32_times=False):
+    '''
+    Convert the utilisation audit recorded by a model into a compact DataFrame.
+
+    Only the full model records an audit; an empty frame is returned
+    for the other models.
+
+    Parameters:
+    -----------
+    utilisation_audit: list of dict
+        The model's utilisation_audit
+
+    float32_times: bool, optional (default=False)
+        Store the simulation times with single precision.
+
+    Returns:
+    --------
+        pandas.DataFrame
+    '''
+    if len(utilisation_audit) == 0:
+        return pd.DataFrame()
+
+    def column(name):
+        return [audit[name] for audit in utilisation_audit]
+
+    return pd.DataFrame({
+        'resource_name': categorical_column(column('resource_name'),
+                                            UTILISATION_AUDIT_CATEGORIES),
+        'simulation_time': np.array(column('simulation_time'),
+                                    dtype=np.float32 if float32_times else None),
+        'number_utilised': np.array(column('number_utilised'), dtype=np.int16),
+        'number_available': np.array(column('number_available'), dtype=np.float32)
+    })
+
+
+def replication_seeds(random_number_set, n_reps):
+    '''
+    The random number set used by each replication in
+    `multiple_replications`.
+
+    `single_run` updates the scenario's random number set, and each
+    replication then adds its own index to the updated value, so the
+    seeds grow as a running total (s, s+1, s+3, s+6...). This is
+    reproduced here so that the other ways of running replications
+    give identical results.
+
+    Parameters:
+    -----------
+    random_number_set: int
+        The random number set of the scenario before any runs
+
+    n_reps: int
+        Number of replications
+
+    Returns:
+    --------
+    list of int
+    '''
+    return [random_number_set + (rep * (rep + 1)) // 2
+            for rep in range(n_reps)]
+
+
 def multiple_replications(scenario,
                           rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
                           n_reps=5,
-                          return_detailed_logs=False):
+                          return_detailed_logs=False,
+                          long_format=False,
+                          float32_times=False,
+                          profiler=None,
+                          warm_up=0):
     '''
     Perform multiple replications of the model.
 
@@ -1619,47 +1900,46 @@ def multiple_replications(scenario,
     n_reps: int, optional (default=DEFAULT_N_REPS)
         Number of independent replications to run.
 
+    return_detailed_logs: bool, optional (default=False)
+        If True, return the detailed logs of every replication
+        rather than just a frame of summary results.
+
+    long_format: bool, optional (default=False)
+        Only used when return_detailed_logs is True.
+        If False, a list with one dictionary of logs per replication
+        is returned.
+        If True, the logs of all replications are combined into a
+        single frame per log type with a 'rep' column
+        (see `collate_replications`).
+
+    float32_times: bool, optional (default=False)
+        As for `single_run`
+
+    profiler: RunProfiler, optional (default=None)
+        As for `single_run`. Collating the replications is also recorded.
+
+    warm_up: float, optional (default=0)
+        As for `single_run`
+
     Returns:
     --------
-    pandas.DataFrame
+    pandas.DataFrame, list or dict
     '''
+    replications = iter_replications(scenario,
+                                     rc_period=rc_period,
+                                     warm_up=warm_up,
+                                     n_reps=n_reps,
+                                     return_detailed_logs=return_detailed_logs,
+                                     float32_times=float32_times,
+                                     profiler=profiler)
 
-    # if return_full_log:
-    #     results = [single_run(scenario,
-    #                           rc_period,
-    #                           random_no_set=(scenario.random_number_set)+rep,
-    #                           return_full_log=True,
-    #                           return_event_log=False)
-    #                for rep in range(n_reps)]
+    if return_detailed_logs and long_format:
+        return collate_replications(replications, profiler)
 
-    # format and return results in a dataframe
-    # df_results = pd.concat(reesults)
-    # df_results.index = np.arange(1, len(df_results)+1)
-    # df_results.index.name = 'rep'
-    # return df_results
-    # return results
+    results = list(replications)
 
     if return_detailed_logs:
-        results = [{'rep': rep+1,
-                    'results': single_run(scenario,
-                                          rc_period,
-                                          random_no_set=(scenario.random_number_set)+rep,
-                                          return_detailed_logs=True)}
-                   #   .assign(Rep=rep+1)
-                   for rep in range(n_reps)]
-
-        # format and return results in a dataframe
-
         return results
-    # {
-        # {df_results = [pd.concat(result) for result in results] }
-        # }
-        # return results
-
-    results = [single_run(scenario,
-                          rc_period,
-                          random_no_set=(scenario.random_number_set)+rep)
-               for rep in range(n_reps)]
 
     # format and return results in a dataframe
     df_results = pd.concat(results)
@@ -1668,11 +1948,433 @@ def multiple_replications(scenario,
     return df_results
 
 
-# ## Scenario Analysis
-
-def get_scenarios():
+def collate_replications(replications, profiler=None):
     '''
-    Creates a dictionary object containing
+    Combine the detailed logs of a set of replications into a single
+    long frame per log type.
+
+    The replication number is added to each replication's frames as they
+    are collected (as a 'rep' column) and each log type is then
+    concatenated once, rather than building a copy of every frame with
+    `.assign(rep=...)` before concatenating.
+
+    Params:
+    ------
+    replications: iterable
+        Dictionaries in the format {'rep': rep_number, 'results': detailed_logs},
+        as yielded by `iter_replications(..., return_detailed_logs=True)`
+
+    profiler: RunProfiler, optional (default=None)
+        If given, the time spent concatenating the logs is recorded.
+
+    Returns:
+    --------
+    dict
+        With the keys 'full_event_log', 'patient_log' and 'utilisation_audit'
+        (long frames with a 'rep' column) and 'summary_df'
+        (one row per replication, indexed by rep)
+    '''
+    collected = {}
+
+    for replication in replications:
+        for log_type, df in replication['results'].items():
+            df['rep'] = np.int16(replication['rep'])
+            collected.setdefault(log_type, []).append(df)
+
+    with profile_stage(profiler, 'collate_replications') as stage:
+        long_format_results = {
+            log_type: pd.concat(frames, ignore_index=True)
+            for log_type, frames in collected.items()
+        }
+        stage['rows'] = sum(len(df) for df in long_format_results.values())
+
+    long_format_results['summary_df'] = long_format_results['summary_df'].set_index('rep')
+
+    return long_format_results
+
+
+def iter_replications(scenario,
+                      rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                      n_reps=5,
+                      return_detailed_logs=False,
+                      n_jobs=None,
+                      ordered=True,
+                      float32_times=False,
+                      profiler=None,
+                      warm_up=0):
+    '''
+    Generator that runs replications of the model and yields the results
+    of each one as soon as it is available.
+
+    Only the replication currently being handed over is held in memory by
+    the generator, so callers that summarise or plot each replication and
+    then discard its logs never hold the logs of every run at once.
+
+    As `single_run` does, the scenario's random number set is updated to
+    the seed of the latest replication yielded (the seed of the last
+    replication, once they have all been yielded). This is the same
+    whether the replications are run in this process or in worker
+    processes (which only change copies of the scenario).
+
+    Params:
+    ------
+    scenario: Scenario
+        Parameters/arguments to configurethe model
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.
+        the number of minutes to run the model to collect results
+
+    n_reps: int, optional (default=DEFAULT_N_REPS)
+        Number of independent replications to run.
+
+    return_detailed_logs: bool, optional (default=False)
+        If False, each replication is yielded as a single row summary
+        frame indexed by its rep number.
+        If True, each replication is yielded as a dictionary in the format
+        {'rep': rep_number, 'results': detailed_logs} (the same format as
+        the items in the list returned by `multiple_replications`).
+
+    n_jobs: int or None, optional (default=None)
+        Number of worker processes to spread the replications over.
+        None or 1 runs the replications one after another in this process,
+        which is the only option when running in the browser (pyodide).
+
+    ordered: bool, optional (default=True)
+        Only used when n_jobs > 1. If True, replications are yielded in
+        rep order. If False, they are yielded in the order they finish.
+
+    float32_times: bool, optional (default=False)
+        As for `single_run`
+
+    profiler: RunProfiler, optional (default=None)
+        As for `single_run`. Only used when the replications are run in
+        this process (n_jobs is None or 1).
+
+    warm_up: float, optional (default=0)
+        As for `single_run`
+
+    Yields:
+    --------
+    pandas.DataFrame or dict
+    '''
+    seeds = replication_seeds(scenario.random_number_set, n_reps)
+
+    def label(rep, results):
+        if return_detailed_logs:
+            return {'rep': rep+1, 'results': results}
+        results.index = [rep+1]
+        results.index.name = 'rep'
+        return results
+
+    if n_jobs is None or n_jobs <= 1:
+        for rep, seed in enumerate(seeds):
+            yield label(rep, single_run(scenario,
+                                        rc_period,
+                                        warm_up=warm_up,
+                                        random_no_set=seed,
+                                        return_detailed_logs=return_detailed_logs,
+                                        float32_times=float32_times,
+                                        profiler=profiler))
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {pool.submit(single_run,
+                               scenario,
+                               rc_period,
+                               warm_up=warm_up,
+                               random_no_set=seed,
+                               return_detailed_logs=return_detailed_logs,
+                               float32_times=float32_times): rep
+                   for rep, seed in enumerate(seeds)}
+
+        completed = futures if ordered else as_completed(futures)
+
+        latest = 0
+        for future in completed:
+            rep = futures[future]
+            results = future.result()
+
+            # leave the scenario as single_run would in this process
+            latest = max(latest, rep)
+            scenario.set_random_no_set(seeds[latest])
+
+            yield label(rep, results)
+
+
+# ## Executing a model without blocking the event loop
+
+async def single_run_async(scenario, rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                           random_no_set=1,
+                           return_detailed_logs=False,
+                           float32_times=False,
+                           slice_length=DEFAULT_SLICE_LENGTH,
+                           progress_callback=None,
+                           cancel_event=None,
+                           profiler=None,
+                           warm_up=0
+                           ):
+    '''
+    Perform a single run of the model, advancing the simulation clock
+    in slices and handing control back to the event loop between each one.
+
+    Gives identical results to `single_run`, but allows the browser
+    (stlite/pyodide) to stay responsive and progress to be reported
+    while the model runs.
+
+    Parameters:
+    -----------
+    scenario: Scenario object
+        The scenario/paramaters to run
+
+    rc_period: int
+        The length of the simulation run that collects results
+
+    random_no_set: int or None, optional (default=DEFAULT_RNG_SET)
+        Controls the set of random seeds used by the stochastic parts of the
+        model.
+
+    return_detailed_logs: bool, optional (default=False)
+        As for `single_run`
+
+    float32_times: bool, optional (default=False)
+        As for `single_run`
+
+    slice_length: float, optional (default=DEFAULT_SLICE_LENGTH)
+        Simulated minutes to run before yielding to the event loop.
+        The default is one simulated day.
+
+    progress_callback: callable, optional (default=None)
+        Called after each slice with the simulation time reached
+        (including the warm-up).
+
+    cancel_event: asyncio.Event, optional (default=None)
+        If this is set while the model is running, the run is abandoned
+        and asyncio.CancelledError is raised.
+
+    profiler: RunProfiler, optional (default=None)
+        As for `single_run`. The time recorded for running the model
+        excludes the time handed back to the event loop between slices.
+
+    warm_up: float, optional (default=0)
+        As for `single_run`
+
+    Returns:
+    --------
+        pandas.DataFrame or dict
+        results from single run.
+    '''
+    # set random number set - this controls sampling for the run.
+    scenario.set_random_no_set(random_no_set)
+
+    model = create_model(scenario)
+    model.init_processes(results_collection_period=rc_period, warm_up=warm_up)
+
+    # env.run(until=...) can be called repeatedly, with each call
+    # picking up where the previous slice stopped
+    run_length = warm_up + rc_period
+    slice_end = 0
+    while slice_end < run_length:
+        if cancel_event is not None and cancel_event.is_set():
+            raise asyncio.CancelledError('Simulation run cancelled')
+
+        slice_end = min(slice_end + slice_length, run_length)
+        with profile_stage(profiler, 'simpy_run') as stage:
+            events_before = len(model.full_event_log)
+            model.env.run(until=slice_end)
+            stage['rows'] = len(model.full_event_log) - events_before
+
+        if progress_callback is not None:
+            progress_callback(slice_end)
+
+        # hand control back to the event loop
+        await asyncio.sleep(0)
+
+    return collect_run_results(model, return_detailed_logs, float32_times, profiler)
+
+
+async def multiple_replications_async(scenario,
+                                      rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                                      n_reps=5,
+                                      return_detailed_logs=False,
+                                      long_format=False,
+                                      float32_times=False,
+                                      slice_length=DEFAULT_SLICE_LENGTH,
+                                      progress_callback=None,
+                                      cancel_event=None,
+                                      profiler=None,
+                                      warm_up=0):
+    '''
+    Perform multiple replications of the model without blocking the
+    event loop.
+
+    Returns the same results as `multiple_replications`.
+
+    Params:
+    ------
+    scenario: Scenario
+        Parameters/arguments to configurethe model
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.
+        the number of minutes to run the model to collect results
+
+    n_reps: int, optional (default=DEFAULT_N_REPS)
+        Number of independent replications to run.
+
+    return_detailed_logs: bool, optional (default=False)
+        As for `multiple_replications`
+
+    long_format: bool, optional (default=False)
+        As for `multiple_replications`
+
+    float32_times: bool, optional (default=False)
+        As for `single_run`
+
+    slice_length: float, optional (default=DEFAULT_SLICE_LENGTH)
+        Simulated minutes to run before yielding to the event loop.
+
+    progress_callback: callable, optional (default=None)
+        Called after every slice of every replication with a dictionary
+        containing the keys
+        'rep' (the replication being run, starting at 1), 'n_reps',
+        'day' (simulated days completed in this replication), 'n_days'
+        and 'fraction' (proportion of the whole experiment completed).
+
+    cancel_event: asyncio.Event, optional (default=None)
+        Set this to abandon the experiment. asyncio.CancelledError
+        is raised before the next slice is run.
+
+    profiler: RunProfiler, optional (default=None)
+        As for `multiple_replications`
+
+    warm_up: float, optional (default=0)
+        As for `single_run`
+
+    Returns:
+    --------
+    pandas.DataFrame, list or dict
+    '''
+    results = [rep_results async for rep_results in aiter_replications(
+        scenario,
+        rc_period=rc_period,
+        warm_up=warm_up,
+        n_reps=n_reps,
+        return_detailed_logs=return_detailed_logs,
+        float32_times=float32_times,
+        slice_length=slice_length,
+        progress_callback=progress_callback,
+        cancel_event=cancel_event,
+        profiler=profiler
+    )]
+
+    if return_detailed_logs and long_format:
+        return collate_replications(results, profiler)
+
+    if return_detailed_logs:
+        return results
+
+    # format and return results in a dataframe
+    df_results = pd.concat(results)
+    df_results.index = np.arange(1, len(df_results)+1)
+    df_results.index.name = 'rep'
+    return df_results
+
+
+async def aiter_replications(scenario,
+                             rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                             n_reps=5,
+                             return_detailed_logs=False,
+                             float32_times=False,
+                             slice_length=DEFAULT_SLICE_LENGTH,
+                             progress_callback=None,
+                             cancel_event=None,
+                             profiler=None,
+                             warm_up=0):
+    '''
+    Asynchronous version of `iter_replications`.
+
+    Replications are run one after another using `single_run_async`, so
+    control is handed back to the event loop between simulated days and
+    each replication is yielded as soon as it finishes.
+
+    Params:
+    ------
+    scenario: Scenario
+        Parameters/arguments to configurethe model
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+        results collection period.
+        the number of minutes to run the model to collect results
+
+    n_reps: int, optional (default=DEFAULT_N_REPS)
+        Number of independent replications to run.
+
+    return_detailed_logs: bool, optional (default=False)
+        As for `iter_replications`
+
+    float32_times: bool, optional (default=False)
+        As for `single_run`
+
+    slice_length: float, optional (default=DEFAULT_SLICE_LENGTH)
+        Simulated minutes to run before yielding to the event loop.
+
+    progress_callback: callable, optional (default=None)
+        As for `multiple_replications_async`
+
+    cancel_event: asyncio.Event, optional (default=None)
+        As for `multiple_replications_async`
+
+    profiler: RunProfiler, optional (default=None)
+        As for `single_run_async`
+
+    warm_up: float, optional (default=0)
+        As for `single_run`
+
+    Yields:
+    --------
+    pandas.DataFrame or dict
+    '''
+    # progress is reported over the whole run, including the warm-up
+    run_length = warm_up + rc_period
+    n_days = run_length / (60 * 24)
+
+    for rep, seed in enumerate(replication_seeds(scenario.random_number_set, n_reps)):
+
+        def report_progress(sim_time, rep=rep):
+            if progress_callback is not None:
+                progress_callback({
+                    'rep': rep + 1,
+                    'n_reps': n_reps,
+                    'day': sim_time / (60 * 24),
+                    'n_days': n_days,
+                    'fraction': (rep + (sim_time / run_length)) / n_reps
+                })
+
+        rep_results = await single_run_async(scenario,
+                                             rc_period,
+                                             warm_up=warm_up,
+                                             random_no_set=seed,
+                                             return_detailed_logs=return_detailed_logs,
+                                             float32_times=float32_times,
+                                             slice_length=slice_length,
+                                             progress_callback=report_progress,
+                                             cancel_event=cancel_event,
+                                             profiler=profiler)
+
+        if return_detailed_logs:
+            yield {'rep': rep+1, 'results': rep_results}
+        else:
+            rep_results.index = [rep+1]
+            rep_results.index.name = 'rep'
+            yield rep_results
+
+
+# ## Scenario Analysis
+
+def get_scenarios():
+    '''
+    Creates a dictionary object containing
     objects of type `Scenario` to run.
 
     Returns:
@@ -1781,19 +2483,27 @@ class TreatmentCentreModelSimpleNurseStepOnly:
 
     '''
 
-    def __init__(self, args):
-        self.env = simpy.Environment()
+    def __init__(self, args, env=None):
+        self.env = simpy.Environment() if env is None else env
         self.args = args
         self.init_resources()
 
         self.patients = []
 
+        # patients who arrived during the warm-up (only used to count
+        # the time they use the resources after it)
+        self.warm_up_patients = []
+
         self.rc_period = None
+        self.warm_up = 0
         self.results = None
 
         self.full_event_log = []
         self.utilisation_audit = []
 
+        # number of candidate arrival times sampled by the thinning algorithm
+        self.thinning_samples = 0
+
     def init_resources(self):
         '''
         Init the number of resources
@@ -1819,7 +2529,8 @@ class TreatmentCentreModelSimpleNurseStepOnly:
 
 
 
-    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD):
+    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+            warm_up=0):
         '''
         Conduct a single run of the model in its current
         configuration
@@ -1833,7 +2544,35 @@ class TreatmentCentreModelSimpleNurseStepOnly:
         warm_up, float, optional (default=0)
 
             length of initial transient period to truncate
-            from results.
+            from results. The model runs for warm_up +
+            results_collection_period, and patients who arrive
+            during the warm-up are not recorded.
+
+        Returns:
+        --------
+            None
+        '''
+        self.init_processes(results_collection_period, warm_up)
+
+        # run
+        self.env.run(until=warm_up + results_collection_period)
+
+    def init_processes(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                       warm_up=0):
+        '''
+        Register the model processes with the simulation environment
+        and store the results collection period.
+
+        Split out from `run()` so that the environment can instead be
+        advanced in slices (see `single_run_async`).
+
+        Parameters:
+        ----------
+        results_collection_period, float, optional
+            default = DEFAULT_RESULTS_COLLECTION_PERIOD
+
+        warm_up, float, optional (default=0)
+            As for `run()`
 
         Returns:
         --------
@@ -1856,9 +2595,7 @@ class TreatmentCentreModelSimpleNurseStepOnly:
 
         # store rc perio
         self.rc_period = results_collection_period
-
-        # run
-        self.env.run(until=results_collection_period)
+        self.warm_up = warm_up
 
     def interval_audit_utilisation(self, resources, interval=1):
         '''
@@ -1880,6 +2617,11 @@ class TreatmentCentreModelSimpleNurseStepOnly:
         '''
 
         while True:
+            # Wait until the warm-up is over before recording
+            if self.env.now < self.warm_up:
+                yield self.env.timeout(interval)
+                continue
+
             # Record time
             if isinstance(resources, list):
                 for i in range(len(resources)):
@@ -1933,6 +2675,7 @@ class TreatmentCentreModelSimpleNurseStepOnly:
                 while u >= (lambda_t / self.args.lambda_max):
                     interarrival_time += self.args.arrival_dist.sample()
                     u = self.args.thinning_rng.sample()
+                    self.thinning_samples += 1
 
             # iat
             yield self.env.timeout(interarrival_time)
@@ -1946,132 +2689,19 @@ class TreatmentCentreModelSimpleNurseStepOnly:
             #      'time': self.env.now}
             # )
 
-            # Generate the patient
-            new_patient = SimplePathway(patient_count, self.env, self.args, self.full_event_log)
-            self.patients.append(new_patient)
+            # Generate the patient. Patients who arrive during the warm-up
+            # still use the resources, but their events and KPIs aren't recorded
+            # (apart from their use of the resources after the warm-up).
+            if self.env.now >= self.warm_up:
+                new_patient = SimplePathway(patient_count, self.env, self.args, self.full_event_log)
+                self.patients.append(new_patient)
+            else:
+                new_patient = SimplePathway(patient_count, self.env, self.args, [])
+                self.warm_up_patients.append(new_patient)
             # start the pathway process for the patient
             self.env.process(new_patient.execute())
 
 
-# UNFINISHED
-
-class SimplePathway(object):
-    '''
-    Encapsulates the process for a patient with minor injuries and illness.
-
-    These patients are arrived, then seen and treated by a nurse as soon as one is available.
-    No place-based resources are considered in this pathway.
-
-    Following treatment they are discharged.
-    '''
-
-    def __init__(self, identifier, env, args, full_event_log):
-        '''
-        Constructor method
-
-        Params:
-        -----
-        identifier: int
-            a numeric identifier for the patient.
-
-        env: simpy.Environment
-            the simulation environment
-
-        args: Scenario
-            Container class for the simulation parameters
-
-        '''
-        self.identifier = identifier
-        self.env = env
-        self.args = args
-        self.full_event_log = full_event_log
-
-        # metrics
-        self.arrival = -np.inf
-        self.wait_treat = -np.inf
-        self.total_time = -np.inf
-
-        self.treat_duration = -np.inf
-
-    def execute(self):
-        '''
-        simulates the simplest minor treatment process for a patient
-
-        1. Arrive
-        2. Examined/treated by nurse when one available
-        3. Discharged
-        '''
-        # record the time of arrival and entered the triage queue
-        self.arrival = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Simplest',
-             'event_type': 'arrival_departure',
-             'event': 'arrival',
-             'time': self.env.now}
-        )
-
-        # request examination resource
-        start_wait = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'Simplest',
-             'event': 'treatment_wait_begins',
-             'event_type': 'queue',
-             'time': self.env.now}
-        )
-
-        # Seize a treatment resource when available
-        treatment_resource = yield self.args.treatment.get()
-            
-        # record the waiting time for registration
-        self.wait_treat = self.env.now - start_wait
-        trace(f'treatment of patient {self.identifier} begins '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Simplest',
-                'event': 'treatment_begins',
-                'event_type': 'resource_use',
-                'time': self.env.now,
-                'resource_id': treatment_resource.id_attribute
-                }
-        )
-
-        # sample examination duration.
-        self.treat_duration = self.args.treat_dist.sample()
-        yield self.env.timeout(self.treat_duration)
-
-        trace(f'patient {self.identifier} nurse exam/treatment complete '
-                f'at {self.env.now:.3f};'
-                f'waiting time was {self.wait_treat:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'Simplest',
-                'event': 'treatment_complete',
-                'event_type': 'resource_use_end',
-                'time': self.env.now,
-                'resource_id': treatment_resource.id_attribute}
-        )
-    
-        # Resource is no longer in use, so put it back in
-        self.args.treatment.put(treatment_resource) 
-
-        # total time in system
-        self.total_time = self.env.now - self.arrival
-        self.full_event_log.append(
-            {'patient': self.identifier,
-            'pathway': 'Simplest',
-            'event': 'depart',
-            'event_type': 'arrival_departure',
-            'time': self.env.now}
-        )
-
-
-
-
-
-
 #####################################################################
 # Classes for 'adding an optional step' page
 #####################################################################
@@ -2089,19 +2719,27 @@ class TreatmentCentreModelSimpleBranchedPathway:
 
     '''
 
-    def __init__(self, args):
-        self.env = simpy.Environment()
+    def __init__(self, args, env=None):
+        self.env = simpy.Environment() if env is None else env
         self.args = args
         self.init_resources()
 
         self.patients = []
 
+        # patients who arrived during the warm-up (only used to count
+        # the time they use the resources after it)
+        self.warm_up_patients = []
+
         self.rc_period = None
+        self.warm_up = 0
         self.results = None
 
         self.full_event_log = []
         self.utilisation_audit = []
 
+        # number of candidate arrival times sampled by the thinning algorithm
+        self.thinning_samples = 0
+
     def init_resources(self):
         '''
         Init the number of resources
@@ -2138,7 +2776,8 @@ class TreatmentCentreModelSimpleBranchedPathway:
                 )
 
 
-    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD):
+    def run(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+            warm_up=0):
         '''
         Conduct a single run of the model in its current
         configuration
@@ -2152,7 +2791,35 @@ class TreatmentCentreModelSimpleBranchedPathway:
         warm_up, float, optional (default=0)
 
             length of initial transient period to truncate
-            from results.
+            from results. The model runs for warm_up +
+            results_collection_period, and patients who arrive
+            during the warm-up are not recorded.
+
+        Returns:
+        --------
+            None
+        '''
+        self.init_processes(results_collection_period, warm_up)
+
+        # run
+        self.env.run(until=warm_up + results_collection_period)
+
+    def init_processes(self, results_collection_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                       warm_up=0):
+        '''
+        Register the model processes with the simulation environment
+        and store the results collection period.
+
+        Split out from `run()` so that the environment can instead be
+        advanced in slices (see `single_run_async`).
+
+        Parameters:
+        ----------
+        results_collection_period, float, optional
+            default = DEFAULT_RESULTS_COLLECTION_PERIOD
+
+        warm_up, float, optional (default=0)
+            As for `run()`
 
         Returns:
         --------
@@ -2163,9 +2830,7 @@ class TreatmentCentreModelSimpleBranchedPathway:
 
         # store rc perio
         self.rc_period = results_collection_period
-
-        # run
-        self.env.run(until=results_collection_period)
+        self.warm_up = warm_up
 
 
     def arrivals_generator(self):
@@ -2195,6 +2860,7 @@ class TreatmentCentreModelSimpleBranchedPathway:
                 while u >= (lambda_t / self.args.lambda_max):
                     interarrival_time += self.args.arrival_dist.sample()
                     u = self.args.thinning_rng.sample()
+                    self.thinning_samples += 1
 
             # iat
             yield self.env.timeout(interarrival_time)
@@ -2208,209 +2874,14 @@ class TreatmentCentreModelSimpleBranchedPathway:
             #      'time': self.env.now}
             # )
 
-            # Generate the patient
-            new_patient = SimpleBranchedPathway(patient_count, self.env, self.args, self.full_event_log)
-            self.patients.append(new_patient)
+            # Generate the patient. Patients who arrive during the warm-up
+            # still use the resources, but their events and KPIs aren't recorded
+            # (apart from their use of the resources after the warm-up).
+            if self.env.now >= self.warm_up:
+                new_patient = SimpleBranchedPathway(patient_count, self.env, self.args, self.full_event_log)
+                self.patients.append(new_patient)
+            else:
+                new_patient = SimpleBranchedPathway(patient_count, self.env, self.args, [])
+                self.warm_up_patients.append(new_patient)
             # start the pathway process for the patient
             self.env.process(new_patient.execute())
-
-
-# UNFINISHED
-
-
-class SimpleBranchedPathway(object):
-    '''
-    Encapsulates the process a patient with minor injuries and illness.
-
-    These patients are arrived, then seen and treated by a nurse as soon as one is available.
-    Some patients may then require treatment.
-
-    Following treatment they are discharged.
-    '''
-
-    def __init__(self, identifier, env, args, full_event_log):
-        '''
-        Constructor method
-
-        Params:
-        -----
-        identifier: int
-            a numeric identifier for the patient.
-
-        env: simpy.Environment
-            the simulation environment
-
-        args: Scenario
-            Container class for the simulation parameters
-
-        '''
-        self.identifier = identifier
-        self.env = env
-        self.args = args
-        self.full_event_log = full_event_log
-
-        # metrics
-        self.arrival = -np.inf
-        self.wait_exam = -np.inf
-        self.wait_treat = -np.inf
-        self.total_time = -np.inf
-
-        self.exam_duration = -np.inf
-        self.treat_duration = -np.inf
-
-    def execute(self):
-        '''
-        simulates the simplest minor treatment process for a patient
-
-        1. Arrive
-        2. Examined/treated by nurse when one available
-        3. Sample to see whether treatment is required
-        4. Treated if required
-        5. Discharged either after examination or after treatment depending on outcome of 3
-        '''
-        # record the time of arrival and entered the triage queue
-        self.arrival = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'simple_with_branch',
-             'event_type': 'arrival_departure',
-             'event': 'arrival',
-             'time': self.env.now}
-        )
-
-        # request examination resource
-        start_wait = self.env.now
-        self.full_event_log.append(
-            {'patient': self.identifier,
-             'pathway': 'simple_with_branch',
-             'event': 'examination_wait_begins',
-             'event_type': 'queue',
-             'time': self.env.now}
-        )
-
-        #########################################################
-        # All arrivals require examination
-        examination_resource = yield self.args.exam.get()
-
-        # record the waiting time for registration
-        self.wait_exam = self.env.now - start_wait
-        trace(f'treatment of patient {self.identifier} begins '
-                f'{self.env.now:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'simple_with_branch',
-                'event': 'examination_begins',
-                'event_type': 'resource_use',
-                'time': self.env.now,
-                'resource_id': examination_resource.id_attribute
-                }
-        )
-
-        # sample examination duration.
-        self.exam_duration = self.args.exam_dist.sample()
-        yield self.env.timeout(self.exam_duration)
-
-        trace(f'patient {self.identifier} nurse exam/treatment complete '
-                f'at {self.env.now:.3f};'
-                f'waiting time was {self.wait_treat:.3f}')
-        self.full_event_log.append(
-            {'patient': self.identifier,
-                'pathway': 'simple_with_branch',
-                'event': 'examination_complete',
-                'event_type': 'resource_use_end',
-                'time': self.env.now,
-                'resource_id': examination_resource.id_attribute}
-        )
-
-        # Resource is no longer in use, so put it back in the store
-        self.args.exam.put(examination_resource) 
-        #########################################################
-
-        # sample if patient requires treatment?
-        self.require_treat = self.args.nt_p_treat_dist.sample()  #pylint: disable=attribute-defined-outside-init
-
-        if self.require_treat:
-
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                 'pathway': 'simple_with_branch',
-                 'event': 'requires_treatment',
-                 'event_type': 'attribute_assigned',
-                 'time': self.env.now}
-            )
-
-            # record the time that entered the treatment queue
-            start_wait = self.env.now
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                 'pathway': 'simple_with_branch',
-                 'event': 'treatment_wait_begins',
-                 'event_type': 'queue',
-                 'time': self.env.now}
-            )
-            ###################################################
-            # request treatment cubicle
-
-            non_trauma_treatment_resource = yield self.args.treatment.get()
-
-            # record the waiting time for treatment
-            self.wait_treat = self.env.now - start_wait
-            trace(f'treatment of patient {self.identifier} begins '
-                    f'{self.env.now:.3f}')
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                    'pathway': 'simple_with_branch',
-                    'event': 'treatment_begins',
-                    'event_type': 'resource_use',
-                    'time': self.env.now,
-                    'resource_id': non_trauma_treatment_resource.id_attribute
-                }
-            )
-
-            # sample treatment duration.
-            self.treat_duration = self.args.nt_treat_dist.sample()
-            yield self.env.timeout(self.treat_duration)
-
-            trace(f'patient {self.identifier} treatment complete '
-                    f'at {self.env.now:.3f};'
-                    f'waiting time was {self.wait_treat:.3f}')
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                    'pathway': 'simple_with_branch',
-                    'event': 'treatment_ends',
-                    'event_type': 'resource_use_end',
-                    'time': self.env.now,
-                    'resource_id': non_trauma_treatment_resource.id_attribute}
-            )
-
-            # Resource is no longer in use, so put it back in the store
-            self.args.treatment.put(non_trauma_treatment_resource)
-
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                'pathway': 'simple_with_branch',
-                'event': 'depart',
-                'event_type': 'arrival_departure',
-                'time': self.env.now}
-            )
-        ##########################################################################
-        else:
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                 'pathway': 'simple_with_branch',
-                 'event': 'does_not_require_treatment',
-                 'event_type': 'attribute_assigned',
-                 'time': self.env.now}
-            )
-            self.full_event_log.append(
-                {'patient': self.identifier,
-                'pathway': 'simple_with_branch',
-                'event': 'depart',
-                'event_type': 'arrival_departure',
-                'time': self.env.now}
-            )
-        # total time in system
-        self.total_time = self.env.now - self.arrival
-
-
-
@@ -0,0 +1,586 @@
+'''
+Output analysis functions
+
+Estimates of the summary results of a model, with confidence intervals.
+
+`multiple_replications` estimates the results from independent runs of the
+model, each of which starts from an empty department and includes the
+time it takes to fill up. For questions about how the department behaves
+once it has settled down (its "steady state"), `batch_means` instead runs
+the model once for a long time, discards the start of the run (the
+warm-up), and splits the rest into batches of equal length. The results
+of each batch are treated like the results of a replication.
+
+Batches that follow each other are not truly independent (a busy batch is
+likely to be followed by another), so the lag-1 autocorrelation of the
+batch results is reported alongside each interval. If it is large the
+batches are too short: use fewer, longer batches or a longer run.
+
+The arrival rate follows a cycle (one hourly rate per row of
+scenario.arrivals, repeated), so each batch covers a whole number of
+cycles. Otherwise batches would start at different points of the cycle,
+and busier and quieter batches would alternate.
+
+How long a warm-up to discard can be chosen with `find_warm_up`, which
+applies the MSER-5 rule to the waiting times of a few trial replications.
+The warm-up can then be passed to `multiple_replications` (or
+`single_run`) as `warm_up`, or to `batch_means` as `warmup_days`.
+'''
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from model_classes import single_run, multiple_replications
+
+# Confidence level of the intervals
+CONFIDENCE_LEVEL = 0.95
+
+DEFAULT_N_BATCHES = 20
+DEFAULT_WARMUP_DAYS = 2
+
+# Waiting time target (minutes) of the 'wait_target_met' results
+WAIT_TARGET = 120
+
+# Number of observations averaged into each batch by the MSER rule
+# (MSER-5)
+MSER_BATCH_SIZE = 5
+
+# Length of the trial replications and interval (minutes) the waiting
+# times are averaged over by find_warm_up
+DEFAULT_WARM_UP_TRIAL_DAYS = 20
+DEFAULT_WARM_UP_INTERVAL = 60
+
+# How each summary result of each model is worked out from the events
+# of a batch:
+# ('arrivals',) / ('throughput',): patients arriving / departing
+# ('wait', stage): mean wait of patients starting the stage
+# ('wait_target_met', stage): proportion of them who waited less than WAIT_TARGET
+# ('util', stage, resource count): proportion of the time the resources were in use
+# ('total_time', pathway): mean time in the model of patients departing
+#     (of the given pathway, or all patients if None)
+BATCH_RESULTS = {
+    'full': {
+        '00_arrivals': ('arrivals',),
+        '01a_triage_wait': ('wait', 'triage'),
+        '01b_triage_util': ('util', 'triage', 'n_triage'),
+        '02a_registration_wait': ('wait', 'MINORS_registration'),
+        '02b_registration_util': ('util', 'MINORS_registration', 'n_reg'),
+        '03a_examination_wait': ('wait', 'MINORS_examination'),
+        '03b_examination_util': ('util', 'MINORS_examination', 'n_exam'),
+        '04a_treatment_wait(non_trauma)': ('wait', 'MINORS_treatment'),
+        '04b_treatment_util(non_trauma)': ('util', 'MINORS_treatment', 'n_cubicles_1'),
+        '05_total_time(non-trauma)': ('total_time', 'Non-Trauma'),
+        '06a_trauma_wait': ('wait', 'TRAUMA_stabilisation'),
+        '06b_trauma_util': ('util', 'TRAUMA_stabilisation', 'n_trauma'),
+        '07a_treatment_wait(trauma)': ('wait', 'TRAUMA_treatment'),
+        '07b_treatment_util(trauma)': ('util', 'TRAUMA_treatment', 'n_cubicles_2'),
+        '08_total_time(trauma)': ('total_time', 'Trauma'),
+        '09_throughput': ('throughput',)
+    },
+    'simplest': {
+        '00_arrivals': ('arrivals',),
+        '01a_treatment_wait': ('wait', 'treatment'),
+        '01b_treatment_util': ('util', 'treatment', 'n_cubicles_1'),
+        '01c_treatment_wait_target_met': ('wait_target_met', 'treatment'),
+        '08_total_time': ('total_time', None),
+        '09_throughput': ('throughput',)
+    },
+    'simple_with_branch': {
+        '00_arrivals': ('arrivals',),
+        '01a_examination_wait': ('wait', 'examination'),
+        '01b_examination_util': ('util', 'examination', 'n_exam'),
+        '01c_examination_wait_target_met': ('wait_target_met', 'examination'),
+        '02a_treatment_wait': ('wait', 'treatment'),
+        '02b_treatment_util': ('util', 'treatment', 'n_cubicles_1'),
+        '08_total_time': ('total_time', None),
+        '09_throughput': ('throughput',)
+    }
+}
+
+
+def t_cdf(t, df):
+    '''
+    Cumulative distribution function of Student's t distribution with a
+    whole number of degrees of freedom (as scipy.stats.t.cdf), from the
+    finite series for P(|T| < t) in terms of theta = arctan(t / sqrt(df)).
+
+    Params:
+    -------
+    t: float
+
+    df: int
+        Degrees of freedom, at least 1
+
+    Returns:
+    --------
+    float
+    '''
+    theta = math.atan(t / math.sqrt(df))
+    sin, cos = math.sin(theta), math.cos(theta)
+
+    # odd df: 2/pi * (theta + sin cos (1 + 2/3 cos^2 + 2*4/(3*5) cos^4 + ...))
+    # even df: sin (1 + 1/2 cos^2 + 1*3/(2*4) cos^4 + ...)
+    term, total = 1.0, 1.0
+    for k in range(df % 2 + 1, df - 1, 2):
+        term *= cos**2 * k / (k + 1)
+        total += term
+
+    if df % 2 == 1:
+        within = 2 / math.pi * (theta + (sin * cos * total if df > 1 else 0))
+    else:
+        within = sin * total
+
+    return 0.5 + within / 2
+
+
+def t_quantile(p, df):
+    '''
+    Quantile of Student's t distribution (as scipy.stats.t.ppf).
+
+    scipy isn't a requirement of the app. The quantiles for 1 and 2
+    degrees of freedom are worked out exactly. For more, the Cornish-Fisher
+    expansion of the t quantile around the normal quantile (which is out
+    by about 0.004 for 3 degrees of freedom, and less for more) is refined
+    with a few Newton steps on `t_cdf`, to within 1e-10.
+
+    Params:
+    -------
+    p: float
+        Probability, between 0 and 1
+
+    df: int
+        Degrees of freedom
+
+    Returns:
+    --------
+    float
+    '''
+    if df == 1:
+        return float(np.tan(np.pi * (p - 0.5)))
+    if df == 2:
+        return (2*p - 1) / np.sqrt(2 * p * (1 - p))
+
+    z = NormalDist().inv_cdf(p)
+
+    t = (z
+         + (z**3 + z) / (4 * df)
+         + (5*z**5 + 16*z**3 + 3*z) / (96 * df**2)
+         + (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / (384 * df**3)
+         + (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / (92160 * df**4))
+
+    # density of the t distribution at t, up to the factor (1 + t^2/df)^-((df+1)/2)
+    scale = math.exp(math.lgamma((df + 1) / 2) - math.lgamma(df / 2)) / math.sqrt(df * math.pi)
+
+    for _ in range(10):
+        step = (t_cdf(t, df) - p) / (scale * (1 + t**2 / df) ** (-(df + 1) / 2))
+        t -= step
+        if abs(step) < 1e-12:
+            break
+
+    return t
+
+
+def lag1_autocorrelation(values):
+    '''
+    Correlation between each value of a series and the next
+
+    Params:
+    -------
+    values: array-like
+
+    Returns:
+    --------
+    float
+        np.nan if there are fewer than 3 values or they are all the same
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 3:
+        return np.nan
+
+    deviations = values - values.mean()
+    total = (deviations**2).sum()
+    if total == 0:
+        return np.nan
+
+    return float((deviations[:-1] * deviations[1:]).sum() / total)
+
+
+def confidence_intervals(results_df, confidence=CONFIDENCE_LEVEL):
+    '''
+    The mean of each result with a confidence interval, treating each row
+    as an independent sample (e.g. the summary results of each replication
+    returned by `multiple_replications`, or of each batch returned by
+    `batch_results`).
+
+    Params:
+    -------
+    results_df: pandas.DataFrame
+        One row per sample, one column per result
+
+    confidence: float, optional (default=CONFIDENCE_LEVEL)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per result, with the columns 'mean', 'std', 'lower_ci',
+        'upper_ci' and 'half_width' (as a proportion of the mean, the
+        precision of the estimate)
+    '''
+    n = results_df.count()
+    mean = results_df.mean()
+    std = results_df.std()
+
+    half_width = std / np.sqrt(n) * n.map(
+        lambda samples: t_quantile(0.5 + confidence / 2, samples - 1) if samples > 1 else np.nan)
+
+    return pd.DataFrame({'mean': mean,
+                         'std': std,
+                         'lower_ci': mean - half_width,
+                         'upper_ci': mean + half_width,
+                         'half_width': half_width / mean.abs()})
+
+
+def batch_results(full_event_log, scenario, warm_up, batch_length, n_batches):
+    '''
+    The summary results of each batch of a single run of the model.
+
+    Each result is recorded in the batch in which it is observed: a wait
+    when the patient starts the stage, a total time when they depart.
+    Utilisation is the time each resource was in use during the batch.
+    Unlike `SimulationSummary`, the wait target results only count patients
+    who started the stage.
+
+    Params:
+    -------
+    full_event_log: pandas.DataFrame
+        Event log of the run (as returned by `single_run`)
+
+    scenario: Scenario
+        The scenario that was run
+
+    warm_up: float
+        Start of the first batch (minutes)
+
+    batch_length: float
+        Minutes
+
+    n_batches: int
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per batch (indexed from 1), with a column for each of
+        the model's results (see BATCH_RESULTS)
+    '''
+    edges = warm_up + batch_length * np.arange(n_batches + 1)
+    run_end = edges[-1]
+
+    # the time of each event of each patient (one row per patient)
+    times = full_event_log.set_index(['patient', 'event'])['time'].unstack()
+    times.columns = times.columns.astype(str)
+
+    def column(event):
+        if event not in times.columns:
+            return np.full(len(times), np.nan)
+        return times[event].to_numpy(dtype=np.float64)
+
+    def total_by_batch(observed_at, values=None):
+        batch = np.searchsorted(edges, observed_at, side='right') - 1
+        in_run = (batch >= 0) & (batch < n_batches)
+        return np.bincount(batch[in_run],
+                           weights=None if values is None else values[in_run],
+                           minlength=n_batches)
+
+    def mean_by_batch(observed_at, values):
+        with np.errstate(invalid='ignore'):
+            return total_by_batch(observed_at, values) / total_by_batch(observed_at)
+
+    pathway = None
+
+    results = {}
+    for result, (kind, *details) in BATCH_RESULTS[scenario.model].items():
+        if kind == 'arrivals':
+            results[result] = total_by_batch(column('arrival'))
+
+        elif kind == 'throughput':
+            results[result] = total_by_batch(column('depart'))
+
+        elif kind in ('wait', 'wait_target_met'):
+            begins = column(f'{details[0]}_begins')
+            wait = begins - column(f'{details[0]}_wait_begins')
+            results[result] = mean_by_batch(begins, wait if kind == 'wait'
+                                          else (wait < WAIT_TARGET).astype(np.float64))
+
+        elif kind == 'util':
+            stage, n_resources = details
+            begins = column(f'{stage}_begins')
+            ends = np.fmax(column(f'{stage}_complete'), column(f'{stage}_ends'))
+            in_use = ~np.isnan(begins)
+            begins, ends = begins[in_use], np.where(np.isnan(ends[in_use]), run_end,
+                                                     ends[in_use])
+
+            results[result] = np.array([
+                np.clip(np.minimum(ends, end) - np.maximum(begins, start), 0, None).sum()
+                for start, end in zip(edges[:-1], edges[1:])
+            ]) / (batch_length * getattr(scenario, n_resources))
+
+        elif kind == 'total_time':
+            departs = column('depart')
+            if details[0] is not None:
+                if pathway is None:
+                    pathway = full_event_log[full_event_log['pathway'] != 'Shared'] \
+                        .groupby('patient', observed=True)['pathway'].first() \
+                        .reindex(times.index).astype(str).to_numpy()
+                departs = np.where(pathway == details[0], departs, np.nan)
+            results[result] = mean_by_batch(departs, departs - column('arrival'))
+
+    results_df = pd.DataFrame(results).astype(np.float64)
+    results_df.index = np.arange(1, n_batches + 1)
+    results_df.index.name = 'batch'
+    return results_df
+
+
+def arrival_cycle_length(scenario):
+    '''
+    Minutes before the arrival rate of a scenario repeats
+
+    Returns:
+    --------
+    float
+        None if the arrival rate doesn't vary (override_arrival_rate)
+    '''
+    if scenario.override_arrival_rate:
+        return None
+    return 60 * len(scenario.arrivals)
+
+
+def batch_length(scenario, run_days, n_batches):
+    '''
+    Length of each batch of `batch_means`: run_days split into n_batches,
+    rounded to the nearest whole number of cycles of the arrival rate if
+    it varies (and at least one cycle).
+
+    Returns:
+    --------
+    float
+        Minutes
+    '''
+    length = 60 * 24 * run_days / n_batches
+
+    cycle = arrival_cycle_length(scenario)
+    if cycle is not None:
+        length = cycle * max(1, round(length / cycle))
+
+    return length
+
+
+def batch_means(scenario, run_days, n_batches=DEFAULT_N_BATCHES,
+                warmup_days=DEFAULT_WARMUP_DAYS, confidence=CONFIDENCE_LEVEL,
+                return_batches=False):
+    '''
+    Estimate the steady state results of a scenario from a single long run
+    of the model, by the method of batch means.
+
+    The model is run for warmup_days + run_days (with the scenario's
+    random number set). The results of the warm-up are discarded and the
+    rest of the run is split into n_batches batches of equal length.
+    If the arrival rate varies, the length of the batches is rounded to
+    a whole number of cycles of the arrival rate (see batch_length), and
+    the run lengthened or shortened to match.
+
+    Params:
+    -------
+    scenario: Scenario
+
+    run_days: float
+        Length of the run after the warm-up
+
+    n_batches: int, optional (default=DEFAULT_N_BATCHES)
+        At least 2. Each batch should be long enough for the results of
+        one batch to say little about the next (see 'lag1_autocorrelation').
+
+    warmup_days: float or None, optional (default=DEFAULT_WARMUP_DAYS)
+        If None, the warm-up is chosen with `find_warm_up`
+
+    confidence: float, optional (default=CONFIDENCE_LEVEL)
+
+    return_batches: bool, optional (default=False)
+        Also return the results of each batch (see batch_results)
+
+    Returns:
+    --------
+    pandas.DataFrame or tuple
+        As returned by `confidence_intervals`, plus the columns
+        'lag1_autocorrelation' (of the batch results) and 'independent'
+        (whether it is small enough, within the 95% limits of
+        +/- 1.96 / sqrt(n_batches), for the batches to be treated as
+        independent; False if it can't be worked out, e.g. for a result
+        that is the same in every batch). If return_batches is True, a tuple of this and the
+        results of each batch.
+    '''
+    if n_batches < 2:
+        raise ValueError('batch_means needs at least 2 batches')
+
+    if warmup_days is None:
+        warm_up = find_warm_up(scenario)
+    else:
+        warm_up = 60 * 24 * warmup_days
+    length = batch_length(scenario, run_days, n_batches)
+    rc_period = warm_up + length * n_batches
+
+    full_event_log = single_run(scenario,
+                                rc_period=rc_period,
+                                random_no_set=scenario.random_number_set,
+                                return_detailed_logs=True)['full_event_log']
+
+    batches_df = batch_results(full_event_log, scenario, warm_up, length, n_batches)
+
+    intervals_df = confidence_intervals(batches_df, confidence)
+    intervals_df['lag1_autocorrelation'] = batches_df.apply(lag1_autocorrelation)
+    intervals_df['independent'] = (intervals_df['lag1_autocorrelation'].abs()
+                                   <= NormalDist().inv_cdf(0.975) / np.sqrt(n_batches))
+
+    if return_batches:
+        return intervals_df, batches_df
+
+    return intervals_df
+
+
+def mser(values, batch_size=MSER_BATCH_SIZE):
+    '''
+    Number of observations to delete from the start of a series to remove
+    its initial transient, by the MSER rule (the "marginal standard error
+    rule"; MSER-5 with the default batch size).
+
+    The series is averaged in batches of batch_size, and the first d
+    batches are deleted, where d minimises the squared standard error of
+    the mean of the batches that are left, sum((batch - mean)^2) / (n - d)^2.
+    Only the first half of the batches are considered, as a truncation
+    point any later than that is a sign that the series never settles
+    down (or is too short to tell).
+
+    Params:
+    -------
+    values: array-like
+        In the order they were observed
+
+    batch_size: int, optional (default=MSER_BATCH_SIZE)
+
+    Returns:
+    --------
+    int
+        A multiple of batch_size (0 if there are fewer than 2 batches)
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    n_batches = len(values) // batch_size
+    if n_batches < 2:
+        return 0
+
+    batches = values[:n_batches * batch_size].reshape(n_batches, batch_size).mean(axis=1)
+
+    # totals of the batches left after deleting the first d (d = 0, 1, ...)
+    total = np.cumsum(batches[::-1])[::-1]
+    total_squares = np.cumsum((batches**2)[::-1])[::-1]
+    n_left = n_batches - np.arange(n_batches)
+
+    statistic = (total_squares - total**2 / n_left) / n_left**2
+
+    return int(np.argmin(statistic[:(n_batches + 1) // 2])) * batch_size
+
+
+def wait_series(full_event_log, interval=DEFAULT_WARM_UP_INTERVAL):
+    '''
+    The mean waiting time of the patients who start a stage in each
+    interval of the run, across every stage (and every replication of a
+    long format log).
+
+    Each wait is recorded when it ends, so patients still waiting at the
+    end of the run don't contribute a shorter, unfinished wait.
+
+    Params:
+    -------
+    full_event_log: pandas.DataFrame
+        Event log of one run, or of several in long format (with a 'rep'
+        column, see `multiple_replications`)
+
+    interval: float, optional (default=DEFAULT_WARM_UP_INTERVAL)
+        Minutes
+
+    Returns:
+    --------
+    pandas.Series
+        Indexed by the start of each interval in which a wait ended,
+        in time order (intervals with no waits are left out)
+    '''
+    events = full_event_log['event'].astype(str)
+    keys = ['rep', 'patient'] if 'rep' in full_event_log.columns else ['patient']
+
+    waiting = events.str.endswith('_wait_begins')
+    starting = events.str.endswith('_begins') & ~waiting
+
+    wait_begins = full_event_log.loc[waiting, keys + ['time']] \
+        .assign(stage=events[waiting].str[:-len('_wait_begins')].to_numpy())
+    stage_begins = full_event_log.loc[starting, keys + ['time']] \
+        .assign(stage=events[starting].str[:-len('_begins')].to_numpy())
+
+    waits = stage_begins.merge(wait_begins, on=keys + ['stage'], suffixes=('', '_wait'))
+    wait = (waits['time'] - waits['time_wait']).to_numpy(dtype=np.float64)
+    start = (waits['time'].to_numpy(dtype=np.float64) // interval) * interval
+
+    return pd.Series(wait).groupby(start).mean().rename('wait')
+
+
+def find_warm_up(scenario, run_days=DEFAULT_WARM_UP_TRIAL_DAYS, n_reps=5,
+                 interval=DEFAULT_WARM_UP_INTERVAL, batch_size=MSER_BATCH_SIZE):
+    '''
+    The shortest warm-up that removes the initial transient of a scenario
+    (the time the department takes to fill up from empty).
+
+    Runs n_reps trial replications of run_days (without a warm-up),
+    averages the waiting times of all of them in each interval of the run
+    (see wait_series) and applies the MSER rule to that series (see mser).
+    Averaging over the replications and intervals, rather than applying
+    the rule to each patient's wait, smooths out the noise of individual
+    waits and gives the truncation point as a time.
+
+    If the warm-up returned is close to half of run_days, the waits hadn't
+    settled down by the end of the trial: try longer trial runs, or the
+    scenario may never reach a steady state (e.g. if the arrival rate is
+    more than the resources can keep up with).
+
+    Params:
+    -------
+    scenario: Scenario
+
+    run_days: float, optional (default=DEFAULT_WARM_UP_TRIAL_DAYS)
+        Length of each trial replication
+
+    n_reps: int, optional (default=5)
+
+    interval: float, optional (default=DEFAULT_WARM_UP_INTERVAL)
+        Minutes
+
+    batch_size: int, optional (default=MSER_BATCH_SIZE)
+        Number of intervals in each batch of the MSER rule
+
+    Returns:
+    --------
+    float
+        The warm-up (minutes), to pass as `warm_up` to `multiple_replications`
+    '''
+    full_event_log = multiple_replications(scenario,
+                                           rc_period=60 * 24 * run_days,
+                                           n_reps=n_reps,
+                                           return_detailed_logs=True,
+                                           long_format=True)['full_event_log']
+
+    series = wait_series(full_event_log, interval)
+
+    truncate = mser(series.to_numpy(), batch_size)
+    if truncate == 0:
+        return 0.0
+
+    return float(series.index[truncate])
@@ -1,67 +1,227 @@
+import base64
+from collections.abc import Mapping
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 import datetime as dt
 
-def reshape_for_animations(full_event_log, every_x_minutes=10):
+from accelerated_functions import numba_enabled, running_totals_kernel
+
+# Event types that move a patient into a new state (where they are shown
+# in the animated log)
+STATE_EVENT_TYPES = ['queue', 'resource_use', 'arrival_departure']
+
+# Icons for the people in the animated log (patient n gets icon n % len(ICON_ARRAY))
+# Recommend https://emojipedia.org/ for finding emojis to add to list
+# note that best compatibility across systems can be achieved by using 
+# emojis from v12.0 and below - Windows 10 got no more updates after that point
+ICON_ARRAY = np.array([
+    '🧔🏼', '👨🏿‍🦯', '👨🏻‍🦰', '🧑🏻', '👩🏿‍🦱', 
+    '🤰', '👳🏽', '👩🏼‍🦳', '👨🏿‍🦳', '👩🏼‍🦱', 
+    '🧍🏽‍♀️', '👨🏼‍🔬', '👩🏻‍🦰', '🧕🏿', '👨🏼‍🦽', 
+    '👴🏾', '👨🏼‍🦱', '👷🏾', '👧🏿', '🙎🏼‍♂️',
+    '👩🏻‍🦲', '🧔🏾', '🧕🏻', '👨🏾‍🎓', '👨🏾‍🦲',
+    '👨🏿‍🦰', '🙍🏼‍♂️', '🙋🏾‍♀️', '👩🏻‍🔧', '👨🏿‍🦽', 
+    '👩🏼‍🦳', '👩🏼‍🦼', '🙋🏽‍♂️', '👩🏿‍🎓', '👴🏻', 
+    '🤷🏻‍♀️', '👶🏾', '👨🏻‍✈️', '🙎🏿‍♀️', '👶🏻', 
+    '👴🏿', '👨🏻‍🦳', '👩🏽', '👩🏽‍🦳', '🧍🏼‍♂️', 
+    '👩🏽‍🎓', '👱🏻‍♀️', '👲🏼', '🧕🏾', '👨🏻‍🦯', 
+    '🧔🏿', '👳🏿', '🤦🏻‍♂️', '👩🏽‍🦰', '👨🏼‍✈️', 
+    '👨🏾‍🦲', '🧍🏾‍♂️', '👧🏼', '🤷🏿‍♂️', '👨🏿‍🔧', 
+    '👱🏾‍♂️', '👨🏼‍🎓', '👵🏼', '🤵🏿', '🤦🏾‍♀️',
+    '👳🏻', '🙋🏼‍♂️', '👩🏻‍🎓', '👩🏼‍🌾', '👩🏾‍🔬',
+    '👩🏿‍✈️', '🎅🏼', '👵🏿', '🤵🏻', '🤰'
+], dtype=object)
+
+# Snapshot intervals (in minutes) that can be chosen when reshaping to a
+# target number of frames
+SNAPSHOT_INTERVALS = [1, 2, 5, 10, 15, 20, 30, 60, 120, 180, 240, 360, 720, 1440]
+
+def snapshot_interval(duration, target_frames):
+    """
+    The shortest interval from SNAPSHOT_INTERVALS that gives no more
+    than target_frames snapshots over the duration.
+
+    Args:
+        duration (int): length of the period to animate (minutes)
+
+        target_frames (int): maximum number of snapshots
+
+    Returns:
+        int
+    """
+    for interval in SNAPSHOT_INTERVALS:
+        if np.ceil(duration / interval) <= target_frames:
+            return interval
+
+    return int(np.ceil(duration / target_frames))
+
+
+def reshape_for_animations(full_event_log, every_x_minutes=10,
+                           limit_duration=10*60*24, target_frames=None):
+    """
+    Take a snapshot of where every patient is at regular intervals,
+    for every replication.
+
+    To only reshape the replications that are needed, use
+    ReshapedReplications instead.
+
+    Args:
+        full_event_log (pd.DataFrame): long format event log
+
+        every_x_minutes (int, optional): Defaults to 10.
+            Interval between snapshots. Ignored if target_frames is given.
+
+        limit_duration (int, optional): Defaults to 10 days (in minutes).
+            Snapshots are taken from minute 0 up to this point.
+
+        target_frames (int, optional): Defaults to None.
+            If given, the interval between snapshots is chosen
+            (see snapshot_interval) so that no more than this many snapshots
+            are taken over limit_duration.
+
+    Returns:
+        dict of DataFrames - 'minute_counts_df', 'minute_counts_df_complete'
+        and 'full_patient_df'
+    """
+    reshaped = ReshapedReplications(full_event_log,
+                                    every_x_minutes=every_x_minutes,
+                                    limit_duration=limit_duration,
+                                    target_frames=target_frames)
+
+    minute_counts_df = pd.concat([reshaped[rep]['minute_counts_df'] for rep in reshaped])
+    full_patient_df = pd.concat([reshaped[rep]['full_patient_df'] for rep in reshaped])
+
+    return {
+        "minute_counts_df": minute_counts_df,
+        "minute_counts_df_complete": complete_minute_counts(minute_counts_df),
+        "full_patient_df": full_patient_df.sort_values(["rep", "minute", "event"])
+        
+    }
+
+
+class ReshapedReplications(Mapping):
+    """
+    The snapshots of reshape_for_animations for each replication, as a
+    mapping of rep -> dict of DataFrames.
+
+    Each replication is only reshaped the first time it is looked up, and
+    the result is kept, so e.g. showing replication 3 only costs the work
+    of reshaping replication 3.
+    """
+    def __init__(self, full_event_log, every_x_minutes=10,
+                 limit_duration=10*60*24, target_frames=None):
+        """
+        Args:
+            full_event_log, every_x_minutes, limit_duration, target_frames:
+                As for reshape_for_animations
+        """
+        if target_frames is not None:
+            every_x_minutes = snapshot_interval(limit_duration, target_frames)
+
+        self.full_event_log = full_event_log
+        self.every_x_minutes = every_x_minutes
+        self.limit_duration = limit_duration
+        self.reps = sorted(int(rep) for rep in full_event_log['rep'].unique())
+        self.reshaped = {}
+
+    def __getitem__(self, rep):
+        if rep not in self.reps:
+            raise KeyError(rep)
+
+        if rep not in self.reshaped:
+            self.reshaped[rep] = reshape_replication(
+                self.full_event_log[self.full_event_log['rep'] == rep].drop('rep', axis=1),
+                rep,
+                every_x_minutes=self.every_x_minutes,
+                limit_duration=self.limit_duration
+                )
+
+        return self.reshaped[rep]
+
+    def __iter__(self):
+        return iter(self.reps)
+
+    def __len__(self):
+        return len(self.reps)
+
+
+def reshape_replication(filtered_log_rep, rep, every_x_minutes=10, limit_duration=10*60*24):
+    """
+    Take a snapshot of where every patient is at regular intervals
+    in a single replication.
+
+    Args:
+        filtered_log_rep (pd.DataFrame): long format event log of the
+            replication, without the 'rep' column
+
+        rep (int): the replication, added to the outputs as the 'rep' column
+
+        every_x_minutes, limit_duration: As for reshape_for_animations
+
+    Returns:
+        dict of DataFrames - 'minute_counts_df', 'minute_counts_df_complete'
+        and 'full_patient_df'
+    """
     minute_dfs = list()
     patient_dfs = list()
 
-    for rep in range(1, max(full_event_log['rep'])+1):
-        # print("Rep {}".format(rep))
-        # Start by getting data for a single rep
-        filtered_log_rep = full_event_log[full_event_log['rep'] == rep].drop('rep', axis=1)
-        pivoted_log = filtered_log_rep.pivot_table(values="time", 
-                                            index=["patient","event_type","pathway"], 
-                                            columns="event").reset_index()
-
-        for minute in range(10*60*24):
-            # print(minute)
-            # Get patients who arrived before the current minute and who left the system after the current minute
-            # (or arrived but didn't reach the point of being seen before the model run ended)
-            # When turning this into a function, think we will want user to pass
-            # 'first step' and 'last step' or something similar
-            # and will want to reshape the event log for this so that it has a clear start/end regardless
-            # of pathway (move all the pathway stuff into a separate column?)
-
-            # Think we maybe need a pathway order and pathway precedence column
-            # But what about shared elements of each pathway?
-            if minute % every_x_minutes == 0:
-
-                try:
-                    current_patients_in_moment = pivoted_log[(pivoted_log['arrival'] <= minute) & 
-                                (
-                                    (pivoted_log['depart'] >= minute) |
-                                    (pivoted_log['depart'].isnull() )
-                                )]['patient'].values
-                except KeyError:
-                    current_patients_in_moment = None
+    pivoted_log = filtered_log_rep.pivot_table(values="time", 
+                                        index=["patient","event_type","pathway"], 
+                                        columns="event",
+                                        observed=True).reset_index()
+
+    for minute in range(limit_duration):
+        # print(minute)
+        # Get patients who arrived before the current minute and who left the system after the current minute
+        # (or arrived but didn't reach the point of being seen before the model run ended)
+        # When turning this into a function, think we will want user to pass
+        # 'first step' and 'last step' or something similar
+        # and will want to reshape the event log for this so that it has a clear start/end regardless
+        # of pathway (move all the pathway stuff into a separate column?)
+
+        # Think we maybe need a pathway order and pathway precedence column
+        # But what about shared elements of each pathway?
+        if minute % every_x_minutes == 0:
+
+            try:
+                current_patients_in_moment = pivoted_log[(pivoted_log['arrival'] <= minute) & 
+                            (
+                                (pivoted_log['depart'] >= minute) |
+                                (pivoted_log['depart'].isnull() )
+                            )]['patient'].values
+            except KeyError:
+                current_patients_in_moment = None
+            
+            if current_patients_in_moment is not None:
+                patient_minute_df = filtered_log_rep[filtered_log_rep['patient'].isin(current_patients_in_moment)]
+                # print(len(patient_minute_df))
+                # Grab just those clients from the filtered log (the unpivoted version)
+                # Each person can only be in a single place at once, so filter out any events
+                # that have taken place after the minute
+                # then just take the latest event that has taken place for each client
+                # most_recent_events_minute = patient_minute_df[patient_minute_df['time'] <= minute] \
+                #     .sort_values('time', ascending=True) \
+                #     .groupby(['patient',"event_type","pathway"]) \
+                #     .tail(1)  
+
+                most_recent_events_minute_ungrouped = patient_minute_df[patient_minute_df['time'] <= minute].reset_index() \
+                    .sort_values(['time', 'index'], ascending=True) \
+                    .groupby(['patient']) \
+                    .tail(1) 
+
+                patient_dfs.append(most_recent_events_minute_ungrouped.assign(minute=minute, rep=rep))
+
+                # Now count how many people are in each state
+                # CHECK - I THINK THIS IS PROBABLY DOUBLE COUNTING PEOPLE BECAUSE OF THE PATHWAY AND EVENT TYPE. JUST JOIN PATHWAY/EVENT TYPE BACK IN INSTEAD?
+                # (value_counts includes unused categories with a count of 0 when
+                # the event column is categorical, so these are dropped)
+                state_counts_minute = most_recent_events_minute_ungrouped[['event']].value_counts() \
+                    .loc[lambda counts: counts > 0] \
+                    .rename("count").reset_index().assign(minute=minute, rep=rep)
                 
-                if current_patients_in_moment is not None:
-                    patient_minute_df = filtered_log_rep[filtered_log_rep['patient'].isin(current_patients_in_moment)]
-                    # print(len(patient_minute_df))
-                    # Grab just those clients from the filtered log (the unpivoted version)
-                    # Each person can only be in a single place at once, so filter out any events
-                    # that have taken place after the minute
-                    # then just take the latest event that has taken place for each client
-                    # most_recent_events_minute = patient_minute_df[patient_minute_df['time'] <= minute] \
-                    #     .sort_values('time', ascending=True) \
-                    #     .groupby(['patient',"event_type","pathway"]) \
-                    #     .tail(1)  
-
-                    most_recent_events_minute_ungrouped = patient_minute_df[patient_minute_df['time'] <= minute].reset_index() \
-                        .sort_values(['time', 'index'], ascending=True) \
-                        .groupby(['patient']) \
-                        .tail(1) 
-
-                    patient_dfs.append(most_recent_events_minute_ungrouped.assign(minute=minute, rep=rep))
-
-                    # Now count how many people are in each state
-                    # CHECK - I THINK THIS IS PROBABLY DOUBLE COUNTING PEOPLE BECAUSE OF THE PATHWAY AND EVENT TYPE. JUST JOIN PATHWAY/EVENT TYPE BACK IN INSTEAD?
-                    state_counts_minute = most_recent_events_minute_ungrouped[['event']].value_counts().rename("count").reset_index().assign(minute=minute, rep=rep)
-                    
-                    minute_dfs.append(state_counts_minute)
+                minute_dfs.append(state_counts_minute)
 
 
     minute_counts_df = pd.concat(minute_dfs).merge(filtered_log_rep[['event','event_type', 'pathway']].drop_duplicates().reset_index(drop=True), on="event")
@@ -75,20 +235,201 @@ def reshape_for_animations(full_event_log, every_x_minutes=10):
 
     full_patient_df = full_patient_df.append(final_step)
 
-    minute_counts_df_pivoted = minute_counts_df.pivot_table(values="count", 
-                                            index=["minute", "rep", "event_type", "pathway"], 
-                                            columns="event").reset_index().fillna(0)
-
-    minute_counts_df_complete = minute_counts_df_pivoted.melt(id_vars=["minute", "rep","event_type","pathway"])
-
     return {
         "minute_counts_df": minute_counts_df,
-        "minute_counts_df_complete": minute_counts_df_complete,
+        "minute_counts_df_complete": complete_minute_counts(minute_counts_df),
         "full_patient_df": full_patient_df.sort_values(["rep", "minute", "event"])
-        
     }
 
 
+def complete_minute_counts(minute_counts_df):
+    """
+    The minute_counts_df of reshape_for_animations with a row (with a count
+    of 0 if no-one was there) for every state at every snapshot.
+
+    Args:
+        minute_counts_df (pd.DataFrame)
+
+    Returns:
+        pd.DataFrame
+    """
+    minute_counts_df_pivoted = minute_counts_df.pivot_table(values="count", 
+                                            index=["minute", "rep", "event_type", "pathway"], 
+                                            columns="event",
+                                            observed=True).reset_index().fillna(0)
+
+    return minute_counts_df_pivoted.melt(id_vars=["minute", "rep","event_type","pathway"])
+
+
+def state_occupancy_changes(full_event_log, event_types=STATE_EVENT_TYPES):
+    """
+    The exact number of patients in each state over time, for every replication.
+
+    Each patient is in the state of their most recent event (of one of the
+    event_types) until their next one, as in reshape_for_animations, and
+    leaves the model at their 'depart' event. Every event adds 1 to its state
+    at its time and takes 1 away at the time of the patient's next event, and
+    a running total over the sorted changes (see running_totals) gives the
+    occupancy.
+
+    Args:
+        full_event_log (pd.DataFrame): long format event log
+
+        event_types (list of str, optional): Defaults to STATE_EVENT_TYPES.
+
+    Returns:
+        pd.DataFrame with the columns 'rep', 'event' (the state), 'time' and
+        'count' - the number of patients in the state from that time until
+        the next time listed for the same rep and state
+    """
+    log = full_event_log[full_event_log['event_type'].isin(event_types)]
+
+    # each patient's events in order (events at the same time stay in log order)
+    order = np.lexsort((np.arange(len(log)),
+                        log['time'].to_numpy(),
+                        log['patient'].to_numpy(),
+                        log['rep'].to_numpy()))
+    log = log.iloc[order]
+
+    rep = log['rep'].to_numpy()
+    patient = log['patient'].to_numpy()
+    time = log['time'].to_numpy()
+    event = log['event'].to_numpy()
+
+    # time of each patient's next event (NaN if they're still in the model at the end)
+    has_next = np.r_[(rep[1:] == rep[:-1]) & (patient[1:] == patient[:-1]), False]
+    next_time = np.where(has_next, np.r_[time[1:], np.nan], np.nan)
+
+    enters = event != 'depart'
+    leaves = enters & has_next
+
+    # states as integer codes, in the order the states are sorted in
+    if isinstance(log['event'].dtype, pd.CategoricalDtype):
+        event_codes = log['event'].cat.codes.to_numpy()
+        states = log['event'].cat.categories
+    else:
+        event_codes, states = pd.factorize(event, sort=True)
+
+    rep = np.r_[rep[enters], rep[leaves]]
+    event_codes = np.r_[event_codes[enters], event_codes[leaves]]
+    time = np.r_[time[enters], next_time[leaves]]
+    deltas = np.r_[np.ones(enters.sum(), dtype=np.int32),
+                   -np.ones(leaves.sum(), dtype=np.int32)]
+
+    order = np.lexsort((time, event_codes, rep))
+    rep, event_codes, time, deltas = rep[order], event_codes[order], time[order], deltas[order]
+
+    new_group = np.r_[True, (rep[1:] != rep[:-1]) | (event_codes[1:] != event_codes[:-1])]
+    new_time = new_group | np.r_[True, time[1:] != time[:-1]]
+    rows = np.flatnonzero(new_time)
+
+    if isinstance(log['event'].dtype, pd.CategoricalDtype):
+        events = pd.Categorical.from_codes(event_codes[rows], categories=states)
+    else:
+        events = np.asarray(states)[event_codes[rows]]
+
+    return pd.DataFrame({'rep': rep[rows].astype(np.int64),
+                         'event': events,
+                         'time': time[rows],
+                         'count': running_totals(new_group, new_time, deltas).astype(np.int32)})
+
+
+def running_totals(new_group, new_time, deltas):
+    """
+    The running total of the changes in each group at each distinct time
+    (e.g. the number of patients in a state, from the patients entering and
+    leaving it).
+
+    Uses running_totals_kernel if numba is enabled (see accelerated_functions).
+
+    Args:
+        new_group (np.ndarray of bool): Whether each change starts a new group
+
+        new_time (np.ndarray of bool): Whether each change is at a different
+            time to the change before (or starts a new group)
+
+        deltas (np.ndarray): The changes, sorted by group then time
+
+    Returns:
+        np.ndarray: One total per distinct time in each group
+    """
+    if numba_enabled():
+        return running_totals_kernel(new_group, new_time, deltas)
+
+    if len(deltas) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    totals = np.cumsum(np.add.reduceat(deltas.astype(np.int64), np.flatnonzero(new_time)))
+
+    # take off the total of the groups before
+    group_starts = np.flatnonzero(new_group[new_time])
+    before_group = np.r_[0, totals[:-1]][group_starts]
+    return totals - np.repeat(before_group, np.diff(np.r_[group_starts, len(totals)]))
+
+
+def state_occupancy(full_event_log, every_x_minutes=10, limit_duration=None,
+                    event_types=STATE_EVENT_TYPES):
+    """
+    The number of patients in each state at regular intervals, for every
+    replication, from state_occupancy_changes.
+
+    The result has the same columns as the 'minute_counts_df_complete'
+    returned by reshape_for_animations (without 'pathway'), so can be
+    passed to animate_queue_activity_bar_chart or occupancy_line_chart.
+
+    Args:
+        full_event_log (pd.DataFrame): long format event log
+
+        every_x_minutes (float, optional): Defaults to 10.
+            Interval between snapshots
+
+        limit_duration (float, optional): Defaults to None.
+            Snapshots are taken from minute 0 up to (but not including)
+            this point. If not given, up to the last event in the log.
+
+        event_types (list of str, optional): Defaults to STATE_EVENT_TYPES.
+
+    Returns:
+        pd.DataFrame with the columns 'minute', 'rep', 'event_type',
+        'event' and 'value' (the number of patients in the state), with
+        a row for every snapshot, rep and state
+    """
+    changes = state_occupancy_changes(full_event_log, event_types)
+
+    if limit_duration is None:
+        limit_duration = full_event_log['time'].max() + every_x_minutes
+
+    minutes = np.arange(0, limit_duration, every_x_minutes)
+
+    groups = changes[['rep', 'event']].drop_duplicates().reset_index(drop=True)
+    group_index = changes.groupby(['rep', 'event'], observed=True, sort=True).ngroup().to_numpy()
+
+    # Find the last change at or before each snapshot in every group by searching
+    # the changes sorted by (group, time) with the group spaced out along the time axis
+    spacing = max(changes['time'].max(), minutes[-1]) + 1
+    change_keys = group_index * spacing + changes['time'].to_numpy()
+    snapshot_group = np.repeat(np.arange(len(groups)), len(minutes))
+    snapshot_minute = np.tile(minutes, len(groups))
+
+    last_change = np.searchsorted(change_keys, snapshot_group * spacing + snapshot_minute,
+                                  side='right') - 1
+    in_group = (last_change >= 0) & (group_index[np.maximum(last_change, 0)] == snapshot_group)
+    counts = np.where(in_group, changes['count'].to_numpy()[np.maximum(last_change, 0)], 0)
+
+    event_types_of_events = full_event_log[['event', 'event_type']].drop_duplicates('event') \
+                                                                   .set_index('event')['event_type']
+
+    occupancy = pd.DataFrame({
+        'minute': snapshot_minute,
+        'rep': groups['rep'].to_numpy()[snapshot_group],
+        'event': groups['event'].iloc[snapshot_group].reset_index(drop=True),
+        'value': counts.astype(np.int32)
+    })
+    occupancy.insert(2, 'event_type', occupancy['event'].map(event_types_of_events))
+
+    return occupancy.sort_values(['rep', 'minute', 'event'], kind='stable').reset_index(drop=True)
+
+
 # ['TRAUMA_triage_wait_begins', 'TRAUMA_triage_begins', 'TRAUMA_triage_complete', 
 #                                     'TRAUMA_stabilisation_wait_begins', 'TRAUMA_stabilisation_begins', 'TRAUMA_stabilisation_complete', 
 #                                     'TRAUMA_treatment_wait_begins', 'TRAUMA_treatment_begins', 'TRAUMA_treatment_wait_begins'
@@ -111,9 +452,15 @@ def animate_activity_log(
         override_x_max=None,
         override_y_max=None,
         time_display_units=None,
+        start_datetime=None,
         setup_mode=False,
         frame_duration=400, #milliseconds
-        frame_transition_duration=600 #milliseconds
+        frame_transition_duration=600, #milliseconds
+        drop_unchanged_frames=True,
+        max_frames=None,
+        max_payload_mb=None,
+        max_queue_icons=None,
+        use_plotly_express=False
         ):
     """_summary_
 
@@ -137,6 +484,41 @@ def animate_activity_log(
         
         plotly_height (int, optional): Defaults to 900.
 
+        time_display_units (str, optional): Defaults to None.
+            If "dhm", frames are labelled with a date and time
+            (see clock_labels) instead of the minute of the simulation.
+
+        start_datetime (str or datetime, optional): Defaults to None.
+            The date and time at minute 0 when time_display_units is "dhm".
+            If not given, midnight 165 days from today is used.
+
+        drop_unchanged_frames (bool, optional): Defaults to True.
+            Merge runs of snapshots in which nobody moves (e.g. quiet periods
+            overnight) into the first snapshot of the run.
+
+        max_frames (int, optional): Defaults to None.
+            If more frames than this remain, an evenly spaced
+            selection of them is kept.
+
+        max_payload_mb (float, optional): Defaults to None.
+            As max_frames, but with the number of frames chosen to keep the
+            frame data of the figure to roughly this size.
+
+        max_queue_icons (int, optional): Defaults to None.
+            The most people drawn in any one queue. Anyone further back in
+            the queue is not drawn, and a "+K more" label is shown after the
+            last person instead, so the number of points in a frame doesn't
+            depend on how long the queues get.
+
+        use_plotly_express (bool, optional): Defaults to False.
+            If True, build the animation with px.scatter(animation_frame=...)
+            as in earlier versions of this function. Otherwise the frames are
+            built directly (see animation_frames), which gives a much
+            smaller figure. Kept for comparison in benchmarks/animation_figure.py
+            drop_unchanged_frames, max_frames and max_payload_mb are
+            not used by this option, and the "+K more" labels of
+            max_queue_icons aren't shown.
+
     Returns:
        Plotly fig object
     """        
@@ -149,146 +531,169 @@ def animate_activity_log(
     # Move the step of ensuring there's only a single model run involved to outside
     # of this function as it's not really its job. 
 
-    full_patient_df = full_patient_df[full_patient_df['rep'] == rep].sort_values([
-        'event','minute','time'
-        ])
+    full_patient_df = full_patient_df[full_patient_df['rep'] == rep]
 
     # full_patient_df['count'] = full_patient_df.groupby(['event','minute','rep'])['minute'] \
     #                            .transform('count')
-    
-    # Order patients within event/minute/rep to determine their eventual position in the line
-    full_patient_df['rank'] = full_patient_df.groupby(['event','minute','rep'])['minute'] \
-                              .rank(method='first')
-
-    full_patient_df_plus_pos = full_patient_df.merge(event_position_df, on="event", how='left') \
-                             .sort_values(["rep", "event", "minute", "time"])
-
-    # Determine the position for any resource use steps
-    resource_use = full_patient_df_plus_pos[full_patient_df_plus_pos['event_type'] == "resource_use"].copy()
-    resource_use['y_final'] =  resource_use['y']
-    resource_use['x_final'] = resource_use['x'] - resource_use['resource_id']*10
-
-    # Determine the position for any queuing steps
-    queues = full_patient_df_plus_pos[full_patient_df_plus_pos['event_type']=='queue']
-    queues['y_final'] =  queues['y']
-    queues['x_final'] = queues['x'] - queues['rank']*10
-
-    # If we want people to wrap at a certain queue length, do this here
-    # They'll wrap at the defined point and then the queue will start expanding upwards
-    # from the starting row
-    if wrap_queues_at is not None:
-        queues['row'] = np.floor((queues['rank']) / (wrap_queues_at+1))
-        queues['x_final'] = queues['x_final'] + (wrap_queues_at*queues['row']*10)
-        queues['y_final'] = queues['y_final'] + (queues['row'] * 30)
 
-    full_patient_df_plus_pos = pd.concat([queues, resource_use])
+    # Everything below is worked out in a single pass over numpy arrays,
+    # in order of event, minute and time
+    event_codes = pd.factorize(full_patient_df['event'])[0]
+    order = np.lexsort((full_patient_df['time'].to_numpy(),
+                        full_patient_df['minute'].to_numpy(),
+                        event_codes))
+    full_patient_df = full_patient_df.iloc[order]
+    event_codes = event_codes[order]
+    minute = full_patient_df['minute'].to_numpy()
 
-    # full_patient_df_plus_pos['icon'] = '🙍'
+    # Order patients within event/minute to determine their eventual position in the line
+    new_group = np.r_[True, (event_codes[1:] != event_codes[:-1]) | (minute[1:] != minute[:-1])]
+    group_starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    rank = np.arange(len(full_patient_df)) - group_starts[group] + 1
 
-    individual_patients = full_patient_df['patient'].drop_duplicates().sort_values()
-    
-    # Recommend https://emojipedia.org/ for finding emojis to add to list
-    # note that best compatibility across systems can be achieved by using 
-    # emojis from v12.0 and below - Windows 10 got no more updates after that point
-    icon_list = [
-        '🧔🏼', '👨🏿‍🦯', '👨🏻‍🦰', '🧑🏻', '👩🏿‍🦱', 
-        '🤰', '👳🏽', '👩🏼‍🦳', '👨🏿‍🦳', '👩🏼‍🦱', 
-        '🧍🏽‍♀️', '👨🏼‍🔬', '👩🏻‍🦰', '🧕🏿', '👨🏼‍🦽', 
-        '👴🏾', '👨🏼‍🦱', '👷🏾', '👧🏿', '🙎🏼‍♂️',
-        '👩🏻‍🦲', '🧔🏾', '🧕🏻', '👨🏾‍🎓', '👨🏾‍🦲',
-        '👨🏿‍🦰', '🙍🏼‍♂️', '🙋🏾‍♀️', '👩🏻‍🔧', '👨🏿‍🦽', 
-        '👩🏼‍🦳', '👩🏼‍🦼', '🙋🏽‍♂️', '👩🏿‍🎓', '👴🏻', 
-        '🤷🏻‍♀️', '👶🏾', '👨🏻‍✈️', '🙎🏿‍♀️', '👶🏻', 
-        '👴🏿', '👨🏻‍🦳', '👩🏽', '👩🏽‍🦳', '🧍🏼‍♂️', 
-        '👩🏽‍🎓', '👱🏻‍♀️', '👲🏼', '🧕🏾', '👨🏻‍🦯', 
-        '🧔🏿', '👳🏿', '🤦🏻‍♂️', '👩🏽‍🦰', '👨🏼‍✈️', 
-        '👨🏾‍🦲', '🧍🏾‍♂️', '👧🏼', '🤷🏿‍♂️', '👨🏿‍🔧', 
-        '👱🏾‍♂️', '👨🏼‍🎓', '👵🏼', '🤵🏿', '🤦🏾‍♀️',
-        '👳🏻', '🙋🏼‍♂️', '👩🏻‍🎓', '👩🏼‍🌾', '👩🏾‍🔬',
-        '👩🏿‍✈️', '🎅🏼', '👵🏿', '🤵🏻', '🤰'
-    ]
+    # Position of each event, looked up from its code in event_position_df
+    # (events without a position get the NaN on the end)
+    position_codes = pd.Categorical(full_patient_df['event'],
+                                    categories=event_position_df['event']).codes
+    x = np.append(event_position_df['x'].to_numpy(dtype=float), np.nan)[position_codes]
+    y = np.append(event_position_df['y'].to_numpy(dtype=float), np.nan)[position_codes]
+
+    event_type = full_patient_df['event_type'].to_numpy()
+    is_queue = event_type == 'queue'
+    is_resource_use = event_type == 'resource_use'
 
-    full_icon_list = icon_list * int(np.ceil(len(individual_patients)/len(icon_list)))
+    # Resource use steps are placed by resource, and queuing steps by position in the queue
+    resource_id = full_patient_df['resource_id'].to_numpy(dtype=float, na_value=np.nan)
+    queue_x, queue_y = queue_position(x, y, rank, wrap_queues_at)
+    x_final = np.where(is_queue, queue_x, x - resource_id*10)
+    y_final = np.where(is_queue, queue_y, y)
 
-    full_icon_list = full_icon_list[0:len(individual_patients)]
+    shown = is_queue | is_resource_use
+
+    full_patient_df_plus_pos = full_patient_df.assign(
+        rank=rank,
+        x=x,
+        y=y,
+        x_final=x_final,
+        y_final=y_final,
+        icon=ICON_ARRAY[full_patient_df['patient'].to_numpy() % len(ICON_ARRAY)]
+    )
 
-    full_patient_df_plus_pos = full_patient_df_plus_pos.merge(
-        pd.DataFrame({'patient':list(individual_patients),
-                      'icon':full_icon_list}),
-        on="patient")
+    # If we only want to draw the front of each queue, count the people who won't
+    # be drawn against the last person who is, and work out where their label goes
+    # (the position the next person in the queue would have had)
+    if max_queue_icons is not None:
+        queue_length = np.diff(np.r_[group_starts, len(full_patient_df)])[group]
+        overflow_x, overflow_y = queue_position(x, y, rank + 1, wrap_queues_at)
+        full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
+            queue_overflow=np.where(is_queue & (rank == max_queue_icons),
+                                    queue_length - max_queue_icons, 0),
+            overflow_x=np.where(is_queue, overflow_x, np.nan),
+            overflow_y=np.where(is_queue, overflow_y, np.nan)
+        )
+        shown = is_resource_use | (is_queue & (rank <= max_queue_icons))
+
+    full_patient_df_plus_pos = full_patient_df_plus_pos[shown]
 
     if return_df_only:
         return full_patient_df_plus_pos
 
-    if override_x_max is not None:
-        x_max = override_x_max
-    else:
-        x_max = event_position_df['x'].max()*1.25
-
-    if override_y_max is not None:
-        y_max = override_x_max
-    else:
-        y_max = event_position_df['y'].max()*1.1
+    x_max, y_max = axis_ranges(event_position_df, override_x_max, override_y_max)
 
     # If we're displaying time as a clock instead of as units of whatever time our model
     # is working in, create a minute_display column that will display as a psuedo datetime
     
-    # For now, it starts a few months after the current date, just to give the
-    # idea of simulating some hypothetical future time. It might be nice to allow
-    # the start point to be changed, particular if we're simulating something on
-    # a larger timescale that includes a level of weekly or monthly seasonality.
+    # By default, it starts a few months after the current date, just to give the
+    # idea of simulating some hypothetical future time. The start point can be changed
+    # with start_datetime, e.g. if we're simulating something on a larger
+    # timescale that includes a level of weekly or monthly seasonality.
 
     # We need to keep the original minute column in existance because it's important for sorting
+    full_patient_df_plus_pos = full_patient_df_plus_pos.sort_values('minute', kind='stable')
+
     if time_display_units == "dhm":
-        full_patient_df_plus_pos['minute'] = dt.date.today() + pd.DateOffset(days=165) +  pd.TimedeltaIndex(full_patient_df_plus_pos['minute'], unit='m')
-        # https://strftime.org/
-        full_patient_df_plus_pos['minute_display'] = full_patient_df_plus_pos['minute'].apply(
-            lambda x: dt.datetime.strftime(x, '%d %B %Y\n%H:%M')
-            )
-        full_patient_df_plus_pos['minute'] = full_patient_df_plus_pos['minute'].apply(
-            lambda x: dt.datetime.strftime(x, '%Y-%m-%d %H:%M')
-            )
+        full_patient_df_plus_pos['minute_display'], full_patient_df_plus_pos['minute'] = \
+            clock_labels(full_patient_df_plus_pos['minute'], start_datetime)
     else:
         full_patient_df_plus_pos['minute_display'] = full_patient_df_plus_pos['minute']
 
     # full_patient_df_plus_pos['size'] = 24
 
-    # We are effectively making use of an animated plotly express scatterploy
+    # We are effectively making use of an animated scatterplot
     # to do all of the heavy lifting
     # Because of the way plots animate in this, it deals with all of the difficulty
     # of paths between individual positions - so we just have to tell it where to put
     # people at each defined step of the process, and the scattergraph will move them
 
-    fig = px.scatter(
-            full_patient_df_plus_pos.sort_values('minute'),
-            x="x_final",
-            y="y_final",
-            # Each frame is one step of time, with the gap being determined
-            # in the reshape_for_animation function
-            animation_frame="minute_display",
-            # Important to group by patient here
-            animation_group="patient",
-            text="icon",
-            # Can't have colours because it causes bugs with
-            # lots of points failing to appear
-            #color="event",
-            hover_name="event",
-            hover_data=["patient", "pathway", "time", "minute", "resource_id"],
-            # The approach of putting in the people as symbols didn't work
-            # Went with making emoji text labels instead - this works better!
-            # But leaving in as a reminder that the symbol approach doens't work.
-            #symbol="rep",
-            #symbol_sequence=["⚽"],
-            #symbol_map=dict(rep_choice = "⚽"),
-            range_x=[0, x_max],
-            range_y=[0, y_max],
-            height=plotly_height,
-            width=plotly_width,
+    if use_plotly_express:
+        fig = px.scatter(
+                full_patient_df_plus_pos.sort_values('minute'),
+                x="x_final",
+                y="y_final",
+                # Each frame is one step of time, with the gap being determined
+                # in the reshape_for_animation function
+                animation_frame="minute_display",
+                # Important to group by patient here
+                animation_group="patient",
+                text="icon",
+                # Can't have colours because it causes bugs with
+                # lots of points failing to appear
+                #color="event",
+                hover_name="event",
+                hover_data=["patient", "pathway", "time", "minute", "resource_id"],
+                # The approach of putting in the people as symbols didn't work
+                # Went with making emoji text labels instead - this works better!
+                # But leaving in as a reminder that the symbol approach doens't work.
+                #symbol="rep",
+                #symbol_sequence=["⚽"],
+                #symbol_map=dict(rep_choice = "⚽"),
+                range_x=[0, x_max],
+                range_y=[0, y_max],
+                height=plotly_height,
+                width=plotly_width,
+                # This sets the opacity of the points that sit behind
+                opacity=0
+                #    size="size"
+                )
+    else:
+        # Build the frames directly - each frame only carries the positions
+        # of the people, and everything that is the same in every frame
+        # (icons, hover data) is set once on the base trace
+        base_traces, frames = animation_frames(full_patient_df_plus_pos,
+                                               drop_unchanged_frames=drop_unchanged_frames,
+                                               max_frames=max_frames,
+                                               max_payload_mb=max_payload_mb)
+
+        fig = go.Figure(data=base_traces, frames=frames)
+
+        # the people are the first trace (any queue overflow labels are the second)
+        fig.update_traces(
+            selector=0,
+            mode="markers+text",
             # This sets the opacity of the points that sit behind
-            opacity=0
-            #    size="size"
+            marker=dict(opacity=0),
+            name="",
+            showlegend=False,
+            hovertemplate="patient=%{customdata[0]}<br>pathway=%{customdata[1]}<extra></extra>"
+        )
+
+        updatemenus, sliders = animation_controls(
+            [frame.name for frame in frames],
+            frame_duration=frame_duration,
+            frame_transition_duration=frame_transition_duration
             )
 
+        fig.update_layout(
+            xaxis=dict(range=[0, x_max]),
+            yaxis=dict(range=[0, y_max]),
+            height=plotly_height,
+            width=plotly_width,
+            margin=dict(t=60),
+            updatemenus=updatemenus,
+            sliders=sliders
+        )
+
     # Now add labels identifying each stage (optional - can either be used
     # in conjunction with a background image or as a way to see stage names
     # without the need to create a background image)
@@ -387,9 +792,342 @@ def animate_activity_log(
     return fig
 
 
+def axis_ranges(event_position_df, override_x_max=None, override_y_max=None):
+    """
+    The upper limits of the x and y axes of the animated log.
+
+    Note that when override_y_max is given, the y axis currently runs to
+    override_x_max instead - the layouts and background images of the
+    pages have been drawn against this, so it's kept as it is.
+
+    Args:
+        event_position_df (pd.DataFrame): as for animate_activity_log
+
+        override_x_max, override_y_max (optional): Defaults to None.
+            As for animate_activity_log
+
+    Returns:
+        tuple of (x_max, y_max)
+    """
+    if override_x_max is not None:
+        x_max = override_x_max
+    else:
+        x_max = event_position_df['x'].max()*1.25
+
+    if override_y_max is not None:
+        y_max = override_x_max
+    else:
+        y_max = event_position_df['y'].max()*1.1
+
+    return x_max, y_max
+
+
+def clock_labels(minutes, start_datetime=None):
+    """
+    Date and time labels for minutes of the simulation.
+
+    Each distinct minute is only formatted once - the labels are
+    built for the sorted unique minutes and mapped back to every row
+    as a categorical.
+
+    Args:
+        minutes (pd.Series): minutes since the start of the simulation
+
+        start_datetime (str or datetime, optional): Defaults to None.
+            The date and time at minute 0. If not given, midnight
+            165 days from today is used.
+
+    Returns:
+        tuple of (pd.Series, pd.Series) - the display label
+        (e.g. '01 March 2024\\n08:30') and the sortable datetime
+        (e.g. '2024-03-01 08:30') of each row, both categorical
+    """
+    if start_datetime is None:
+        start_datetime = dt.date.today() + pd.DateOffset(days=165)
+
+    codes, unique_minutes = pd.factorize(minutes, sort=True)
+    times = pd.Timestamp(start_datetime) + pd.to_timedelta(unique_minutes, unit='m')
+
+    # https://strftime.org/
+    def labels(time_format):
+        return pd.Series(pd.Categorical.from_codes(codes, categories=times.strftime(time_format)),
+                         index=minutes.index)
+
+    return labels('%d %B %Y\n%H:%M'), labels('%Y-%m-%d %H:%M')
+
+
+def queue_position(x, y, rank, wrap_queues_at=None):
+    """
+    Where a person at a given position in a queue is drawn.
+
+    Queues extend to the left of the position of the queue. If
+    wrap_queues_at is given, they wrap at that length and then
+    the queue starts expanding upwards from the starting row.
+
+    Args:
+        x, y (pd.Series or np.ndarray): position of the queue
+
+        rank (pd.Series or np.ndarray): position of each person in the queue (from 1)
+
+        wrap_queues_at (int, optional): Defaults to None.
+
+    Returns:
+        tuple of (x, y), of the same type as x and y
+    """
+    x_final = x - rank*10
+    y_final = y
+
+    if wrap_queues_at is not None:
+        row = np.floor(rank / (wrap_queues_at+1))
+        x_final = x_final + (wrap_queues_at*row*10)
+        y_final = y_final + (row * 30)
+
+    return x_final, y_final
+
+
+def animation_frames(full_patient_df_plus_pos, frame_column="minute_display",
+                     drop_unchanged_frames=True, max_frames=None, max_payload_mb=None):
+    """
+    Build the base trace and one plotly frame per snapshot of the
+    positioned patient log.
+
+    Every patient gets a fixed slot in a single scatter trace. Their icon,
+    id and hover data (patient and pathway) don't change, so they are held
+    once on the base trace, and each frame only carries the x and y position
+    of every slot (rounded to whole units, NaN when the patient isn't on
+    screen). The positions are arranged with numpy rather than by plotly express.
+
+    If the log has a 'queue_overflow' column (see max_queue_icons in
+    animate_activity_log), a second trace holds one "+K more" label per
+    queue, and each frame also carries the text of these labels.
+
+    Rows without a position (events that aren't in the event_position_df)
+    are dropped as they can't be displayed.
+
+    Args:
+        full_patient_df_plus_pos (pd.DataFrame):
+            Positioned log, as returned by animate_activity_log(return_df_only=True)
+            plus a frame label column, sorted into frame order
+
+        frame_column (str, optional): Defaults to "minute_display".
+            The column holding the label of each frame
+
+        drop_unchanged_frames, max_frames, max_payload_mb:
+            See animate_activity_log
+
+    Returns:
+        tuple of (list of go.Scatter, list of go.Frame)
+    """
+    df = full_patient_df_plus_pos[full_patient_df_plus_pos['x_final'].notna() &
+                                  full_patient_df_plus_pos['y_final'].notna()]
+
+    labels = df[frame_column].to_numpy()
+
+    # the log is sorted by frame, so each frame is a contiguous block of rows
+    new_frame = np.r_[True, labels[1:] != labels[:-1]]
+    frame_index = np.cumsum(new_frame) - 1
+    frame_labels = labels[new_frame]
+
+    patients, patient_index = np.unique(df['patient'].to_numpy(), return_inverse=True)
+
+    x = np.full((len(frame_labels), len(patients)), np.nan, dtype=np.float32)
+    y = np.full((len(frame_labels), len(patients)), np.nan, dtype=np.float32)
+    x[frame_index, patient_index] = np.round(df['x_final'].to_numpy(dtype=float))
+    y[frame_index, patient_index] = np.round(df['y_final'].to_numpy(dtype=float))
+
+    # number of people not drawn in each capped queue
+    if 'queue_overflow' not in df.columns:
+        df = df.assign(queue_overflow=0, overflow_x=np.nan, overflow_y=np.nan)
+
+    overflow = (df['queue_overflow'] > 0).to_numpy()
+    overflow_df = df[overflow]
+    stages, stage_index = np.unique(overflow_df['event'].astype(str).to_numpy(),
+                                    return_inverse=True)
+
+    overflow_counts = np.zeros((len(frame_labels), len(stages)), dtype=np.int32)
+    overflow_counts[frame_index[overflow], stage_index] = overflow_df['queue_overflow']
+
+    keep = frame_selection(x, y, drop_unchanged_frames, max_frames, max_payload_mb,
+                           counts=overflow_counts)
+    x, y, frame_labels = x[keep], y[keep], frame_labels[keep]
+    overflow_labels = np.where(overflow_counts[keep] > 0,
+                               np.char.add(np.char.add('+', overflow_counts[keep].astype(str)),
+                                           ' more'),
+                               '')
+
+    # static details of each patient - their icon, and the pathway
+    # they spend most of their time on
+    icons = df.groupby('patient')['icon'].first().reindex(patients).to_numpy()
+    pathways = df.groupby(['patient', 'pathway'], observed=True).size() \
+        .sort_values(kind='stable').groupby(level='patient').tail(1) \
+        .reset_index(level='pathway')['pathway'].reindex(patients).astype(str).to_numpy()
+
+    base_trace = go.Scatter(
+        x=x[0],
+        y=y[0],
+        ids=patients,
+        text=icons,
+        customdata=np.column_stack([patients, pathways]).astype(object)
+    )
+
+    if len(stages) == 0:
+        frames = [
+            go.Frame(name=str(label), data=[go.Scatter(x=x[i], y=y[i])])
+            for i, label in enumerate(frame_labels)
+        ]
+
+        return [base_trace], frames
+
+    # each queue's label is always in the same place, so only its text changes
+    label_positions = overflow_df.groupby(stage_index)[['overflow_x', 'overflow_y']].first()
+
+    overflow_trace = go.Scatter(
+        x=label_positions['overflow_x'].to_numpy(),
+        y=label_positions['overflow_y'].to_numpy(),
+        text=overflow_labels[0],
+        mode="text",
+        textposition="middle left",
+        hoverinfo='none'
+    )
+
+    frames = [
+        go.Frame(name=str(label),
+                 data=[go.Scatter(x=x[i], y=y[i]),
+                       go.Scatter(text=overflow_labels[i])])
+        for i, label in enumerate(frame_labels)
+    ]
+
+    return [base_trace, overflow_trace], frames
+
+def frame_selection(x, y, drop_unchanged_frames=True, max_frames=None, max_payload_mb=None,
+                    counts=None):
+    """
+    Choose which frames of an animation to keep.
+
+    Args:
+        x, y (np.ndarray): positions with one row per frame and
+            one column per patient (NaN when not on screen)
+
+        counts (np.ndarray, optional): Defaults to None.
+            Any other values with one row per frame. A frame in which
+            these change is not treated as unchanged.
+
+        drop_unchanged_frames, max_frames, max_payload_mb:
+            See animate_activity_log
+
+    Returns:
+        np.ndarray of the indices of the frames to keep
+    """
+    n_frames, n_slots = x.shape
+
+    keep = np.ones(n_frames, dtype=bool)
+
+    if drop_unchanged_frames and n_frames > 1:
+        # NaN != NaN, so compare positions with NaN replaced
+        x_filled = np.nan_to_num(x, nan=-1)
+        y_filled = np.nan_to_num(y, nan=-1)
+        keep[1:] = ((x_filled[1:] != x_filled[:-1]) |
+                    (y_filled[1:] != y_filled[:-1])).any(axis=1)
+
+        if counts is not None:
+            keep[1:] |= (counts[1:] != counts[:-1]).any(axis=1)
+
+    keep = np.flatnonzero(keep)
+
+    if max_payload_mb is not None:
+        bytes_per_frame = frame_payload_bytes(x[keep], y[keep]).mean()
+        payload_frames = int(max_payload_mb * 1024 ** 2 // bytes_per_frame)
+        max_frames = payload_frames if max_frames is None else min(max_frames, payload_frames)
+
+    if max_frames is not None and len(keep) > max_frames:
+        keep = keep[np.unique(np.linspace(0, len(keep) - 1, max(max_frames, 1)).round().astype(int))]
+
+    return keep
+
+
+def frame_payload_bytes(x, y):
+    """
+    Approximate size of each frame in the figure JSON.
+
+    Plotly sends float32 arrays base64 encoded, with any "/" escaped
+    as "\\u002f" (which NaN values produce a lot of), and each frame
+    also has a step on the slider.
+
+    Args:
+        x, y (np.ndarray): positions with one row per frame
+
+    Returns:
+        np.ndarray of sizes in bytes
+    """
+    sizes = []
+    for x_frame, y_frame in zip(x, y):
+        encoded = base64.b64encode(x_frame.tobytes()) + base64.b64encode(y_frame.tobytes())
+        sizes.append(len(encoded) + 5 * encoded.count(b'/'))
+
+    return np.array(sizes) + 350
+
+
+def animation_controls(frame_names, frame_duration=400, frame_transition_duration=600):
+    """
+    The play/pause buttons and time slider for an animated figure,
+    laid out in the same way as plotly express does.
+
+    Args:
+        frame_names (list of str): names of the frames, in order
+
+        frame_duration (int, optional): Defaults to 400 (milliseconds).
+
+        frame_transition_duration (int, optional): Defaults to 600 (milliseconds).
+
+    Returns:
+        tuple of (updatemenus, sliders) to pass to fig.update_layout
+    """
+    def animate_args(frame, transition):
+        return {'frame': {'duration': frame, 'redraw': False},
+                'mode': 'immediate',
+                'fromcurrent': True,
+                'transition': {'duration': transition, 'easing': 'linear'}}
+
+    updatemenus = [dict(
+        buttons=[
+            dict(args=[None, animate_args(frame_duration, frame_transition_duration)],
+                 label='&#9654;', method='animate'),
+            dict(args=[[None], animate_args(0, 0)],
+                 label='&#9724;', method='animate')
+        ],
+        direction='left', pad={'r': 10, 't': 70}, showactive=False,
+        type='buttons', x=0.1, xanchor='right', y=0, yanchor='top'
+    )]
+
+    sliders = [dict(
+        active=0,
+        currentvalue={'prefix': ''},
+        len=0.9, pad={'b': 10, 't': 60},
+        x=0.1, xanchor='left', y=0, yanchor='top',
+        steps=[dict(args=[[name], animate_args(0, 0)], label=name, method='animate')
+               for name in frame_names]
+    )]
+
+    return updatemenus, sliders
+
+
 def animate_queue_activity_bar_chart(minute_counts_df_complete,
                                      event_order,
                                      rep=1):
+    """
+    Animated bar chart of the number of people in each state.
+
+    Args:
+        minute_counts_df_complete (pd.DataFrame): the 'minute_counts_df_complete'
+            returned by reshape_for_animations, or the output of state_occupancy
+
+        event_order (list of str): the states to show, in order
+
+        rep (int, optional): Defaults to 1.
+
+    Returns:
+       Plotly fig object
+    """
     # Downsample to only include a snapshot every 10 minutes (else it falls over completely)
     # For runs of more days will have to downsample more aggressively - every 10 minutes works for 15 days
     fig = px.bar(minute_counts_df_complete[minute_counts_df_complete["rep"] == int(rep)].sort_values('minute'),
@@ -403,4 +1141,45 @@ def animate_queue_activity_bar_chart(minute_counts_df_complete,
 
     fig["layout"].pop("updatemenus")
 
-    return fig
\ No newline at end of file
+    return fig
+
+
+def occupancy_line_chart(state_occupancy_df, events, event_labels=None, y_title="Patients"):
+    """
+    Line chart of the number of people in each of the given states over time,
+    with a line for each replication.
+
+    Args:
+        state_occupancy_df (pd.DataFrame): output of state_occupancy
+
+        events (list of str): the states to show
+
+        event_labels (dict, optional): Defaults to None.
+            Names to show for the states in the legend, e.g.
+            {'treatment_wait_begins': 'Waiting for treatment'}
+
+        y_title (str, optional): Defaults to "Patients".
+
+    Returns:
+       Plotly fig object
+    """
+    df = state_occupancy_df[state_occupancy_df['event'].isin(events)].copy()
+    df['day'] = df['minute'] / (60 * 24)
+    df['event'] = df['event'].astype(str)
+
+    if event_labels is not None:
+        df['event'] = df['event'].replace(event_labels)
+
+    fig = px.line(df,
+                  x="day",
+                  y="value",
+                  color="event",
+                  line_group="rep",
+                  line_shape="hv",
+                  hover_data=["rep"])
+
+    # lines for each replication overlap, so make them partly transparent
+    fig.update_traces(opacity=0.5)
+    fig.update_layout(xaxis_title="Day", yaxis_title=y_title, legend_title_text="")
+
+    return fig
@@ -4,7 +4,6 @@ A Streamlit application based on Monks and
 Allows users to interact with an increasingly more complex treatment simulation 
 '''
 import time
-import asyncio
 import datetime as dt
 import gc
 import numpy as np
@@ -13,8 +12,9 @@ import pandas as pd
 import streamlit as st
 
 from helper_functions import add_logo, mermaid, center_running
-from model_classes import Scenario, multiple_replications
+from model_classes import Scenario
 from distribution_classes import Exponential
+from caching_functions import run_simulation, simulation_key, show_results
 
 st.set_page_config(
     page_title="Simulating Arrivals",
@@ -242,15 +242,29 @@ with tab1:
                     manual_arrival_rate=60/(mean_arrivals_per_day/24),
                     override_arrival_rate=True)
 
+    run_key = simulation_key(args, n_reps, run_time_days*60*24)
+
     # A user must press a streamlit button to run the model
     button_run_pressed = st.button("Run simulation")
 
-    if button_run_pressed:
+    # Keep showing the results on reruns until an input is changed
+    if show_results('page_1_run', run_key, button_run_pressed):
 
         # add a spinner and then display success box
         with st.spinner('Simulating the minor injuries unit...'):
+            my_bar = st.progress(0, text="Simulating the minor injuries unit...")
+
+            # Updating the bar between simulated days also gives streamlit
+            # the chance to stop the run if the user changes a parameter.
+            def update_progress_bar(progress):
+                my_bar.progress(
+                    int(100 * progress['fraction']),
+                    text="Simulating the minor injuries unit... (run {} of {}, day {:.0f} of {:.0f})".format(
+                        progress['rep'], progress['n_reps'],
+                        progress['day'], progress['n_days'])
+                    )
+
             # if not running_on_st_community:
-            await asyncio.sleep(0.1)
             # run multiple replications of experment
             # results = multiple_replications(
             #     args,
@@ -258,19 +272,18 @@ with tab1:
             #     rc_period=run_time_days*60*24
             # )
 
-            detailed_outputs = multiple_replications(
+            detailed_outputs = await run_simulation(
                 args,
                 n_reps=n_reps,
                 rc_period=run_time_days*60*24,
-                return_detailed_logs=True
-
+                progress_callback=update_progress_bar
             )
 
-            patient_log = pd.concat([detailed_outputs[i]['results']['full_event_log'].assign(Rep= i+1) 
-                            for i in range(n_reps)])
+            my_bar.progress(100, text="Simulation Complete!")
+
+            patient_log = detailed_outputs['full_event_log'].rename(columns={'rep': 'Rep'}, copy=False)
 
-            results = pd.concat([detailed_outputs[i]['results']['summary_df'].assign(rep= i+1)
-                                                for i in range(n_reps)]).set_index('rep')
+            results = detailed_outputs['summary_df']
 
 
             patient_log = patient_log.assign(model_day = (patient_log.time/24/60).pipe(np.floor)+1)
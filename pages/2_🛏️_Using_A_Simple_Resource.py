@@ -3,7 +3,6 @@ A Streamlit application based on Monks and
 
 Allows users to interact with an increasingly more complex treatment simulation 
 '''
-import asyncio
 import gc
 import pandas as pd
 import plotly.express as px
@@ -11,9 +10,11 @@ import plotly.graph_objects as go
 import streamlit as st
 
 from helper_functions import add_logo, mermaid, center_running
-from model_classes import Scenario, multiple_replications
+from model_classes import Scenario
 from distribution_classes import Normal
-from output_animation_functions import reshape_for_animations, animate_activity_log
+from caching_functions import (run_simulation, simulation_key, animation_log,
+                               animated_log_figure, occupancy_log, show_results)
+from output_animation_functions import occupancy_line_chart
 
 # Set page parameters
 st.set_page_config(
@@ -150,7 +151,7 @@ with tab1:
             st.markdown("If you like, you can edit these parameters too!")
             
             n_reps = st.slider("🔁 How many times should the simulation run?",
-                            1, 30,
+                            1, 100,
                             step=1, value=6)
             
             run_time_days = st.slider("🗓️ How many days should we run the simulation for each time?",
@@ -192,55 +193,51 @@ with tab1:
         
         
             
+    args = Scenario(
+        random_number_set=seed,
+        n_cubicles_1=nurses,
+        override_arrival_rate=True,
+        manual_arrival_rate=60/(mean_arrivals_per_day/24),
+        model="simplest",
+        trauma_treat_mean=consult_time,
+        trauma_treat_var=consult_time_sd
+        )
+
+    run_key = simulation_key(args, n_reps, run_time_days*60*24)
+
     # A user must press a streamlit button to run the model
     button_run_pressed = st.button("Run simulation")
+
+    # Keep showing the results on reruns until an input is changed
+    results_available = show_results('page_2_run', run_key, button_run_pressed)
     
-    
-    if button_run_pressed:
+    if results_available:
 
         # add a spinner and then display success box
         with st.spinner('Simulating the minor injuries unit...'):
-            args = Scenario(
-                random_number_set=seed,
-                n_cubicles_1=nurses,
-                override_arrival_rate=True,
-                manual_arrival_rate=60/(mean_arrivals_per_day/24),
-                model="simplest",
-                trauma_treat_mean=consult_time,
-                trauma_treat_var=consult_time_sd
-                )
-            await asyncio.sleep(0.1)
             # run multiple replications of experment
-            detailed_outputs = multiple_replications(
+            detailed_outputs = await run_simulation(
                 args,
                 n_reps=n_reps,
-                rc_period=run_time_days*60*24,
-                return_detailed_logs=True
+                rc_period=run_time_days*60*24
             )
 
-            results = pd.concat([detailed_outputs[i]['results']['summary_df'].assign(rep= i+1)
-                                        for i in range(n_reps)]).set_index('rep')
-            
-            full_event_log = pd.concat([detailed_outputs[i]['results']['full_event_log'].assign(rep= i+1)
-                                        for i in range(n_reps)])
+            results = detailed_outputs['summary_df']
+
+            full_event_log = detailed_outputs['full_event_log']
             
             del detailed_outputs
             gc.collect()
 
-            animation_dfs_log = reshape_for_animations(
-                        full_event_log=full_event_log[
-                            (full_event_log['rep']==1) &
-                            ((full_event_log['event_type']=='queue') | (full_event_log['event_type']=='resource_use')  | (full_event_log['event_type']=='arrival_departure')) &
-                            # Limit to first 5 days
-                            (full_event_log['time'] <= 60*24*5)
-                        ],
-                        every_x_minutes=5
-                )['full_patient_df']
+            animation_dfs_log = animation_log(full_event_log, run_key,
+                                              limit_days=5, every_x_minutes=5)
+
+            occupancy_df = occupancy_log(full_event_log, run_key, every_x_minutes=10)
             
             del full_event_log
             gc.collect()
 
-    if button_run_pressed:
+    if results_available:
         tab1, tab2, tab3 = st.tabs(
                 ["Animated Log", "Simple Graphs", "Advanced Graphs"]
             )  
@@ -279,10 +276,11 @@ with tab1:
     """
                 )
 
-                st.plotly_chart(animate_activity_log(
-                                    full_patient_df=animation_dfs_log[animation_dfs_log["minute"]<=60*24*5],
+                st.plotly_chart(animated_log_figure(
+                                    animation_dfs_log[animation_dfs_log["minute"]<=60*24*5],
+                                    args,
+                                    run_key,
                                     event_position_df = event_position_df,
-                                    scenario=args,
                                     include_play_button=True,
                                     return_df_only=False,
                                     plotly_height=700,
@@ -290,6 +288,7 @@ with tab1:
                                     override_x_max=300,
                                     override_y_max=500,
                                     wrap_queues_at=10,
+                                    max_queue_icons=100,
                                     time_display_units="dhm",
                                     display_stage_labels=False,
                                     add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Simplest%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
@@ -561,8 +560,24 @@ with tab1:
             st.plotly_chart(throughput_box,
                     use_container_width=True
                 )
+
+            st.markdown("""
+                        ### Queue Length
+                        This is the number of people waiting for treatment at each point in the model run, with one line for each replication.
+                        
+                        Does the queue get bigger and smaller at different times, or just keep growing?
+                        """)
+
+            st.plotly_chart(occupancy_line_chart(
+                                occupancy_df,
+                                events=['treatment_wait_begins'],
+                                event_labels={'treatment_wait_begins': 'Waiting for Treatment'},
+                                y_title="People Waiting"
+                            ),
+                    use_container_width=True
+                )
             
-            del results
+            del results, occupancy_df
             gc.collect()
 
             # st.write(full_event_log)
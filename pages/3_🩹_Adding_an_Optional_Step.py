@@ -3,16 +3,16 @@ A Streamlit application based on Monks and
 
 Allows users to interact with an increasingly more complex treatment simulation 
 '''
-import asyncio
 import gc
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 
-from output_animation_functions import reshape_for_animations,animate_activity_log
+from caching_functions import (run_simulation, simulation_key, animation_log,
+                               animated_log_figure, show_results)
 from helper_functions import add_logo, mermaid, center_running
-from model_classes import Scenario, multiple_replications
+from model_classes import Scenario
 
 st.set_page_config(
      page_title="Adding an Optional Step",
@@ -186,11 +186,11 @@ with tab1:
                             step=1, value=42)
             
             n_reps = st.slider("🔁 How many times should the simulation run?",
-                            1, 30,
+                            1, 100,
                             step=1, value=6)
             
             run_time_days = st.slider("🗓️ How many days should we run the simulation for each time?",
-                                    1, 40,
+                                    1, 60,
                                     step=1, value=10)
 
         
@@ -217,46 +217,40 @@ with tab1:
             non_trauma_treat_var=consult_time_sd_treat,
             non_trauma_treat_p=treat_p
             )
+
+    run_key = simulation_key(args, n_reps, run_time_days*60*24)
+
+    # Keep showing the results on reruns until an input is changed
+    results_available = show_results('page_3_run', run_key, button_run_pressed)
     
-    if button_run_pressed:
+    if results_available:
 
         # add a spinner and then display success box
         with st.spinner('Simulating the minor injuries unit...'):
-            await asyncio.sleep(0.1)
             # run multiple replications of experment
-            detailed_outputs = multiple_replications(
+            detailed_outputs = await run_simulation(
                 args,
                 n_reps=n_reps,
-                rc_period=run_time_days*60*24,
-                return_detailed_logs=True
+                rc_period=run_time_days*60*24
             )
 
-            results = pd.concat([detailed_outputs[i]['results']['summary_df'].assign(rep= i+1)
-                                        for i in range(n_reps)]).set_index('rep')
-            
-            full_event_log = pd.concat([detailed_outputs[i]['results']['full_event_log'].assign(rep= i+1)
-                                            for i in range(n_reps)])
+            results = detailed_outputs['summary_df']
+
+            full_event_log = detailed_outputs['full_event_log']
             
             del detailed_outputs
             gc.collect()
 
             attribute_count_df = full_event_log[(full_event_log["event"]=="does_not_require_treatment")|
-                (full_event_log["event"]=="requires_treatment")][['patient','event','rep']].groupby(['rep','event']).count()
-
-            animation_dfs_log = reshape_for_animations(
-                        full_event_log=full_event_log[
-                            (full_event_log['rep']==1) &
-                            ((full_event_log['event_type']=='queue') | (full_event_log['event_type']=='resource_use')  | (full_event_log['event_type']=='arrival_departure')) &
-                            # Limit to first 5 days
-                            (full_event_log['time'] <= 60*24*5)
-                        ],
-                        every_x_minutes=5
-                    )['full_patient_df']
+                (full_event_log["event"]=="requires_treatment")][['patient','event','rep']].groupby(['rep','event'], observed=True).count()
+
+            animation_dfs_log = animation_log(full_event_log, run_key,
+                                              limit_days=5, every_x_minutes=5)
             
             del full_event_log
             gc.collect()
 
-    if button_run_pressed:
+    if results_available:
         tab1, tab2, tab3 = st.tabs(
                 ["Animated Log", "Simple Graphs", "Advanced Graphs"]
             )  
@@ -301,10 +295,11 @@ with tab1:
             with st.spinner('Generating the animated patient log...'):
                 # st.write(animation_dfs_log[animation_dfs_log["minute"]<=60*24*5])
 
-                st.plotly_chart(animate_activity_log(
-                                    full_patient_df=animation_dfs_log[animation_dfs_log["minute"]<=60*24*5],
+                st.plotly_chart(animated_log_figure(
+                                    animation_dfs_log[animation_dfs_log["minute"]<=60*24*5],
+                                    args,
+                                    run_key,
                                     event_position_df = event_position_df,
-                                    scenario=args,
                                     include_play_button=True,
                                     display_stage_labels=False,
                                     return_df_only=False,
@@ -313,6 +308,7 @@ with tab1:
                                     override_x_max=500,
                                     override_y_max=400,
                                     wrap_queues_at=20,
+                                    max_queue_icons=100,
                                     icon_and_text_size=18,
                                     time_display_units="dhm",
                                     add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Branched%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
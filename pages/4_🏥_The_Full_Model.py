@@ -4,15 +4,19 @@ A Streamlit application based on Monks and
 Allows users to interact with an increasingly more complex treatment simulation 
 '''
 import gc
-import asyncio
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
+import streamlit.components.v1 as components
 
 from helper_functions import add_logo, mermaid, center_running
-from model_classes import Scenario, multiple_replications
-from output_animation_functions import reshape_for_animations, animate_activity_log
+from model_classes import Scenario
+from caching_functions import (run_simulation, simulation_key, animation_log,
+                               animated_log_figure, animated_log_player, show_results)
+from animation_player_functions import PLAYER_CONTROLS_HEIGHT
+from session_results_classes import SessionResults
+from profiling_classes import RunProfiler, profile_stage
 
 st.set_page_config(
      page_title="The Full Model",
@@ -22,7 +26,7 @@ st.set_page_config(
 
 # Initialise session state
 if 'session_results' not in st.session_state:
-    st.session_state['session_results'] = []
+    st.session_state['session_results'] = SessionResults()
 
 add_logo()
 
@@ -205,6 +209,11 @@ with tab1:
                         1, 60,
                         step=1, value=5)
 
+            record_performance = st.checkbox(
+                "⏱️ Record how long each stage of the run takes",
+                help="Shows the time and memory used by each stage in a 'Performance' section below the results. Recording the memory used makes the run slower."
+                )
+
     args = Scenario(
         random_number_set=seed,
                  n_triage=n_triage,
@@ -216,77 +225,55 @@ with tab1:
                  non_trauma_treat_p=non_trauma_treat_p,
                  prob_trauma=prob_trauma)
     
+    run_key = simulation_key(args, n_reps, run_time_days*60*24)
+
     # A user must press a streamlit button to run the model
     button_run_pressed = st.button("Run simulation")
-    
-    
-    if button_run_pressed:
+
+    # Keep showing the results on reruns until an input is changed
+    if show_results('page_4_run', run_key, button_run_pressed):
+
+        profiler = RunProfiler() if record_performance else None
 
         # add a spinner and then display success box
         with st.spinner('Simulating the minor injuries unit...'):
-            await asyncio.sleep(0.1)
-
             my_bar = st.progress(0, text="Simulating the minor injuries unit...")
 
+            # The simulation stage takes up the first 40% of the progress bar.
+            # Updating the bar between simulated days also gives streamlit
+            # the chance to stop the run if the user changes a parameter.
+            def update_progress_bar(progress):
+                my_bar.progress(
+                    int(40 * progress['fraction']),
+                    text="Simulating the minor injuries unit... (run {} of {}, day {:.0f} of {:.0f})".format(
+                        progress['rep'], progress['n_reps'],
+                        progress['day'], progress['n_days'])
+                    )
+
             # run multiple replications of experment
-            detailed_outputs = multiple_replications(
+            detailed_outputs = await run_simulation(
                 args,
                 n_reps=n_reps,
                 rc_period=run_time_days*60*24,
-                return_detailed_logs=True
+                progress_callback=update_progress_bar,
+                profiler=profiler
             )
 
             my_bar.progress(40, text="Collating Simulation Outputs...")
 
+            results = detailed_outputs['summary_df']
+
+            full_event_log = detailed_outputs['full_event_log']
 
-            results = pd.concat([detailed_outputs[i]['results']['summary_df'].assign(rep= i+1)
-                                        for i in range(n_reps)]).set_index('rep')
-            
-            full_event_log = pd.concat([detailed_outputs[i]['results']['full_event_log'].assign(rep= i+1)
-                                        for i in range(n_reps)])
-            
             del detailed_outputs
             gc.collect()
             
             my_bar.progress(60, text="Logging Results...")
 
-            # print(len(st.session_state['session_results']))
-            # results_for_state = pd.DataFrame(results.median()).T.drop(['Rep'], axis=1)
-            results_for_state = results
-            original_cols = results_for_state.columns.values
-            results_for_state['Triage\nCubicles'] = args.n_triage
-            results_for_state['Registration\nClerks'] = args.n_reg
-            results_for_state['Examination\nRooms'] = args.n_exam
-            results_for_state['Non-Trauma\nTreatment Cubicles'] = args.n_cubicles_1
-            results_for_state['Trauma\nStabilisation Bays'] = args.n_trauma
-            results_for_state['Trauma\nTreatment Cubicles'] = args.n_cubicles_2
-            results_for_state['Probability patient\nis a trauma patient'] = args.prob_trauma
-            results_for_state['Probability non-trauma patients\nrequire treatment'] = args.non_trauma_treat_p
-            results_for_state['Model Run'] = len(st.session_state['session_results']) + 1
-            results_for_state['Random Seed'] = seed
-
-            # Reorder columns
-            column_order = ['Model Run', 'Triage\nCubicles', 'Registration\nClerks', 'Examination\nRooms',
-                            'Non-Trauma\nTreatment Cubicles', 'Trauma\nStabilisation Bays', 
-                            'Trauma\nTreatment Cubicles', 'Probability patient\nis a trauma patient',
-                            'Probability non-trauma patients\nrequire treatment', 'Random Seed'
-                            ] + list(original_cols)
-
-            results_for_state = results_for_state[column_order]
-
-            current_state = st.session_state['session_results']
-
-            current_state.append(results_for_state)
-            
-            del results_for_state
-            gc.collect()
-
-            st.session_state['session_results'] = current_state
-
-            del current_state
-            gc.collect()
-
-            # print(len(st.session_state['session_results']))
+            # Only the most recent runs are kept for comparison.
+            # Later reruns of the page show the same run, so don't add it again.
+            if button_run_pressed:
+                st.session_state['session_results'].add_run(args, results, random_seed=seed)
 
             # UTILISATION AUDIT - BRING BACK WHEN NEEDED
             # full_utilisation_audit = pd.concat([detailed_outputs[i]['results']['utilisation_audit'].assign(Rep= i+1)
@@ -301,15 +288,10 @@ with tab1:
 
             my_bar.progress(80, text="Creating Animations...")
 
-            animation_dfs_log = reshape_for_animations(
-                full_event_log=full_event_log[
-                    (full_event_log['rep']==1) &
-                    ((full_event_log['event_type']=='queue') | (full_event_log['event_type']=='resource_use')  | (full_event_log['event_type']=='arrival_departure')) &
-                     # Limit to first 5 days
-                    (full_event_log['time'] <= 60*24*5)
-                ],
-                every_x_minutes=5
-            )['full_patient_df']
+            with profile_stage(profiler, 'animation_snapshots') as stage:
+                animation_dfs_log = animation_log(full_event_log, run_key,
+                                                  limit_days=5, every_x_minutes=5)
+                stage['rows'] = len(animation_dfs_log)
 
         del full_event_log
         gc.collect()
@@ -390,46 +372,95 @@ with tab1:
     Clicking on the bar below the plot and dragging your cursor to the left or right allows you to rapidly jump through to a different time in the simulation. 
 
     Only the first replication of the simulation is shown. 
+
+    If the animation is slow to load, try the lightweight player instead. This moves everyone around in your browser rather than sending their position at every snapshot, but doesn't show the details of each person when you hover over them.
     """
                 )
 
-            animated_plot = animate_activity_log(
-                    full_patient_df=animation_dfs_log[animation_dfs_log["minute"]<=60*24*5],
-                    event_position_df = event_position_df,
-                    scenario=args,
-                    include_play_button=True,
-                    return_df_only=False,
-                    plotly_height=900,
-                    plotly_width=1600,
-                    override_x_max=700,
-                    override_y_max=675,
-                    icon_and_text_size=24,
-                    display_stage_labels=False,
-                    wrap_queues_at=10,
-                    time_display_units="dhm",
-                    # show_animated_clock=True,
-                    # animated_clock_coordinates = [100, 50],
-                    add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Full%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
-            )
+            use_animation_player = st.checkbox("Use the lightweight animation player")
+
+            with profile_stage(profiler, 'filter_animation_log') as stage:
+                animation_dfs_log = animation_dfs_log[animation_dfs_log["minute"]<=60*24*5]
+                stage['rows'] = len(animation_dfs_log)
+
+            if use_animation_player:
+                with profile_stage(profiler, 'animation_player', rows=len(animation_dfs_log)):
+                    animation_player = animated_log_player(
+                            animation_dfs_log,
+                            args,
+                            run_key,
+                            event_position_df = event_position_df,
+                            player_width=1600,
+                            player_height=900,
+                            override_x_max=700,
+                            override_y_max=675,
+                            icon_and_text_size=24,
+                            display_stage_labels=False,
+                            wrap_queues_at=10,
+                            max_queue_icons=50,
+                            time_display_units="dhm",
+                            add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Full%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
+                    )
 
-            del animation_dfs_log
-            gc.collect()
+                del animation_dfs_log
+                gc.collect()
 
-            st.plotly_chart(animated_plot,
-                            use_container_width=False,
-                            config = {'displayModeBar': False})
+                components.html(animation_player,
+                                width=1600,
+                                height=900 + PLAYER_CONTROLS_HEIGHT)
 
-            # st.markdown(
-            #     f'<a href="data:text/html;base64,{base64.b64encode(animated_plot.to_html(full_html=False, include_plotlyjs="cdn").encode()).decode()}" download="plot.html">Download Plot</a>',
-            #     unsafe_allow_html=True
-            # )
+                st.download_button(
+                    label="Download Animation as HTML",
+                    data=animation_player,
+                    file_name="animation.html",
+                    mime="text/html"
+                )
 
-            st.download_button(
-                label="Download Plot as HTML",
-                data=animated_plot.to_html(full_html=False, include_plotlyjs="cdn"),
-                file_name="plot.html",
-                mime="text/html"
-            )
+            else:
+                with profile_stage(profiler, 'figure_building', rows=len(animation_dfs_log)):
+                    animated_plot = animated_log_figure(
+                            animation_dfs_log,
+                            args,
+                            run_key,
+                            event_position_df = event_position_df,
+                            include_play_button=True,
+                            return_df_only=False,
+                            plotly_height=900,
+                            plotly_width=1600,
+                            override_x_max=700,
+                            override_y_max=675,
+                            icon_and_text_size=24,
+                            display_stage_labels=False,
+                            wrap_queues_at=10,
+                            max_queue_icons=50,
+                            time_display_units="dhm",
+                            # show_animated_clock=True,
+                            # animated_clock_coordinates = [100, 50],
+                            add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Full%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
+                    )
+
+                del animation_dfs_log
+                gc.collect()
+
+                with profile_stage(profiler, 'figure_display'):
+                    st.plotly_chart(animated_plot,
+                                    use_container_width=False,
+                                    config = {'displayModeBar': False})
+
+                # st.markdown(
+                #     f'<a href="data:text/html;base64,{base64.b64encode(animated_plot.to_html(full_html=False, include_plotlyjs="cdn").encode()).decode()}" download="plot.html">Download Plot</a>',
+                #     unsafe_allow_html=True
+                # )
+
+                with profile_stage(profiler, 'figure_to_html'):
+                    animated_plot_html = animated_plot.to_html(full_html=False, include_plotlyjs="cdn")
+
+                st.download_button(
+                    label="Download Plot as HTML",
+                    data=animated_plot_html,
+                    file_name="plot.html",
+                    mime="text/html"
+                )
 
 
             # Uncomment if debugging animated event log
@@ -663,7 +694,21 @@ with tab1:
                         .T.rename_axis('Metric', axis=0))
 
 
-        
+
+        if profiler is not None:
+            with st.expander("Performance"):
+                st.markdown(
+                    """
+                    Time and memory used by each stage of this run of the page.
+                    Stages that reused the results of an earlier run take almost no time,
+                    and if the simulation itself was reused its stages aren't listed.
+                    
+                    *wall_s* is the time taken, *cpu_s* the processor time used,
+                    *peak_mb* the most memory allocated at once during the stage
+                    and *rows* the number of events or snapshots it handled.
+                    """
+                )
+                st.dataframe(profiler.summary_frame().round(3))
 
         # with tab_playground_results_4:
         #     st.markdown("Placeholder")
@@ -677,18 +722,17 @@ with tab1:
 with tab3:
     if len(st.session_state['session_results']) > 0:
 
-        all_run_results = pd.concat(st.session_state['session_results'])
+        session_results = st.session_state['session_results']
 
         st.subheader("Look at Average Results Across Replications")
         # col_a, col_b = st.columns(2)
         
 
         # with col_a:
-        parameter_scenario_df = all_run_results.groupby('Model Run').median().T.reset_index(drop=False)
+        parameter_scenario_df = session_results.parameter_table()
         parameter_scenario_df.columns = [f"Scenario {i}" for i in parameter_scenario_df.columns]
-        parameter_scenario_df = parameter_scenario_df[~parameter_scenario_df['Scenario index'].str.contains("\d", regex=True)]
         
-        st.dataframe(parameter_scenario_df.set_index(parameter_scenario_df.columns[0]).rename_axis('Parameter', axis=0),
+        st.dataframe(parameter_scenario_df,
                      hide_index=False,
                      use_container_width=True)
         del parameter_scenario_df
@@ -709,7 +753,7 @@ with tab3:
                 st.subheader("Utilisation")
 
                 all_run_util_bar = px.bar(
-                        all_run_results.groupby('Model Run').median().T.filter(like="util", axis=0).reset_index(drop=False).melt(id_vars="index", var_name="model_run"),              
+                        session_results.long_statistic_table("median", like="util"),
                         x="value",
                         y="index",
                         barmode='group',
@@ -751,7 +795,7 @@ with tab3:
                 st.subheader("Waits")
 
                 all_run_wait_bar = px.bar(
-                        all_run_results.groupby('Model Run').median().T.filter(like="wait", axis=0).reset_index(drop=False).melt(id_vars="index", var_name="model_run"),              
+                        session_results.long_statistic_table("median", like="wait"),
                         x="value",
                         y="index",
                         barmode='group',
@@ -791,7 +835,7 @@ with tab3:
                 st.subheader("Utilisation")
 
                 all_run_util_box = px.box(
-                    all_run_results.reset_index().melt(id_vars=["Model Run", "rep"]).set_index('variable').filter(like="util", axis=0).reset_index(), 
+                    session_results.long_rep_results(like="util"),
                     y="variable", 
                     x="value",
                     color="Model Run",
@@ -837,7 +881,7 @@ with tab3:
                 st.subheader("Waits")
 
                 all_run_wait_box = px.box(
-                    all_run_results.reset_index().melt(id_vars=["Model Run", "rep"]).set_index('variable').filter(like="wait", axis=0).reset_index(), 
+                    session_results.long_rep_results(like="wait"),
                 #                 left_index=True, right_index=True), 
                     y="variable", 
                     x="value",
@@ -877,11 +921,8 @@ with tab3:
                     for a long time.
                     """
                 )
-                all_run_results['perc_throughput'] = all_run_results['09_throughput']/all_run_results['00_arrivals']
-
-
                 all_results_throughput_box = px.box(
-                    all_run_results.reset_index().melt(id_vars=["Model Run", "rep"]).set_index('variable').filter(like="perc_throughput", axis=0).reset_index(),  
+                    session_results.long_rep_results(like="perc_throughput"),
                     y="variable", 
                     x="value",
                     color="Model Run",
@@ -916,8 +957,8 @@ with tab3:
 
             st.markdown("This displays the median value for each metric across all model runs per scenario.")
             import numpy as np
-            output_scenario_df = all_run_results.groupby('Model Run').median().T
-            output_scenario_df = output_scenario_df.reset_index(drop=False).melt(id_vars="index")
+            output_scenario_df = session_results.long_statistic_table("median") \
+                .rename(columns={"model_run": "Model Run"})
             # st.dataframe(output_scenario_df)
 
             output_scenario_df['formatted_value'] =  np.where(
@@ -942,7 +983,7 @@ with tab3:
                         height=700)
             del output_scenario_df
 
-            del all_run_results
+            del session_results
             gc.collect()
     else:
         st.markdown("No scenarios yet run. Go to the 'Playground' tab and click 'Run simulation'.")
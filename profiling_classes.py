@@ -0,0 +1,322 @@
+'''
+Profiling classes
+
+Opt-in measurement of where the time goes when a page runs the model and
+builds its outputs.
+
+A `RunProfiler` is passed to the functions that do the work (or wraps
+calls to them), and records for each named stage
+* wall clock time
+* CPU time of the process
+* the peak memory allocated while the stage ran (using tracemalloc)
+* the number of rows (events, patients, snapshots...) the stage handled
+
+Stages with the same name (e.g. the model run of each replication) are
+added together. Functions take `profiler=None` and use `profile_stage`,
+which does nothing when no profiler is given, so there is no cost unless
+profiling is asked for.
+
+`InstrumentedEnvironment` is a SimPy environment that counts the events
+scheduled and processed while a model runs, and which process each
+processed event belongs to.
+'''
+
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+import simpy
+
+# Label for processed events that no process is waiting for
+# (e.g. releasing a resource, or putting it back in its store)
+UNATTRIBUTED_EVENTS = 'unattributed'
+
+
+class RunProfiler:
+    '''
+    Record of the time, CPU time, memory and rows of each stage of a run.
+
+    Stages are not expected to be nested. If they are, the peak memory of
+    the outer stage only covers the part after the last inner stage started.
+
+    Tracking allocations slows Python code down (often by a factor of
+    two or more), so compare stages with each other rather than with
+    timings made without the profiler.
+    '''
+    def __init__(self, track_allocations=True):
+        '''
+        Constructor
+
+        Params:
+        -------
+        track_allocations: bool, optional (default=True)
+            Measure the peak memory allocated by each stage with tracemalloc.
+        '''
+        self.track_allocations = track_allocations
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        '''
+        Measure the code run inside the `with` block as the stage `name`.
+
+        Yields a dictionary. Set its 'rows' key inside the block to record
+        the number of rows the stage handled if it isn't known beforehand.
+
+        Params:
+        -------
+        name: str
+            Name of the stage
+
+        rows: int, optional (default=None)
+            Number of rows handled by the stage
+        '''
+        record = {'rows': rows}
+
+        started_tracing = False
+        if self.track_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+
+            peak = None
+            if self.track_allocations:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self.add(name, wall, cpu, peak, record['rows'])
+
+    def add(self, name, wall, cpu, peak=None, rows=None):
+        '''
+        Add a measurement to the stage `name`
+        (creating the stage if it hasn't been seen before).
+
+        Params:
+        -------
+        name: str
+
+        wall, cpu: float
+            Seconds
+
+        peak: int, optional (default=None)
+            Peak bytes allocated
+
+        rows: int, optional (default=None)
+        '''
+        totals = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                               'peak_mb': None, 'rows': None})
+        totals['calls'] += 1
+        totals['wall_s'] += wall
+        totals['cpu_s'] += cpu
+
+        if peak is not None:
+            totals['peak_mb'] = max(totals['peak_mb'] or 0, peak / 1024 ** 2)
+        if rows is not None:
+            totals['rows'] = (totals['rows'] or 0) + rows
+
+    def summary_frame(self):
+        '''
+        The measurements of every stage, in the order the stages were first run.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Indexed by stage, with the columns 'calls', 'wall_s', 'cpu_s',
+            'peak_mb' (the largest peak of any call) and 'rows' (the total
+            over all calls)
+        '''
+        df = pd.DataFrame.from_dict(self.stages, orient='index',
+                                    columns=['calls', 'wall_s', 'cpu_s', 'peak_mb', 'rows'])
+        df['rows'] = df['rows'].astype('Int64')
+        df.index.name = 'stage'
+        return df
+
+
+def profile_stage(profiler, name, rows=None):
+    '''
+    `profiler.stage(name, rows)`, or a context that does nothing if
+    profiler is None.
+
+    Either way, the `with` statement gives a dictionary whose 'rows' key
+    can be set.
+
+    Params:
+    -------
+    profiler: RunProfiler or None
+
+    name: str
+
+    rows: int, optional (default=None)
+    '''
+    if profiler is None:
+        return nullcontext({'rows': rows})
+    return profiler.stage(name, rows)
+
+
+class InstrumentedEnvironment(simpy.Environment):
+    '''
+    SimPy environment that keeps count of the work done by a model run.
+
+    Records
+    * the number of events scheduled and processed, and the wall time
+      spent in `run` (so events per second)
+    * the number of processes started and events processed for each type
+      of process (see process_type)
+    * the longest the event queue got and the most processes alive at once
+
+    A processed event is counted against the process waiting for it
+    (or, for the event of a process finishing, that process). Events that
+    no process waits for are counted as UNATTRIBUTED_EVENTS.
+
+    Counting adds a little to the time taken by every event, so don't
+    compare the run time with that of a model run in a plain environment.
+    '''
+    def __init__(self, initial_time=0):
+        '''
+        Constructor
+
+        Params:
+        -------
+        initial_time: float, optional (default=0)
+            As for simpy.Environment
+        '''
+        super().__init__(initial_time)
+        self.scheduled = 0
+        self.processed = 0
+        self.run_seconds = 0.0
+        self.peak_queue_length = 0
+        self.live_processes = 0
+        self.peak_live_processes = 0
+        self.process_types = weakref.WeakKeyDictionary()
+        self.processes_started = Counter()
+        self.events_processed = Counter()
+
+    def schedule(self, event, priority=simpy.core.NORMAL, delay=0):
+        super().schedule(event, priority, delay)
+        self.scheduled += 1
+        self.peak_queue_length = max(self.peak_queue_length, len(self._queue))
+
+    def process(self, generator):
+        process = super().process(generator)
+
+        process_type = self.process_type(generator)
+        self.process_types[process] = process_type
+        self.processes_started[process_type] += 1
+
+        self.live_processes += 1
+        self.peak_live_processes = max(self.peak_live_processes, self.live_processes)
+        process.callbacks.append(self.process_finished)
+
+        return process
+
+    @staticmethod
+    def process_type(generator):
+        '''
+        Name of the type of process a generator runs.
+
+        For a method, this is the class of the object it was called on and
+        the method name (so each patient pathway, which share the method
+        PatientPathway.execute, are counted separately, e.g.
+        'TraumaPathway.execute'). Otherwise it is the qualified name of
+        the generator function.
+
+        Returns:
+        --------
+        str
+        '''
+        frame = getattr(generator, 'gi_frame', None)
+        owner = frame.f_locals.get('self') if frame is not None else None
+
+        if owner is not None:
+            return f'{type(owner).__name__}.{generator.__name__}'
+
+        return getattr(generator, '__qualname__', type(generator).__name__)
+
+    def process_finished(self, process):
+        '''
+        Callback for a process that has finished
+        '''
+        self.live_processes -= 1
+
+    def event_process_type(self, event):
+        '''
+        The type of process an event is counted against
+        (see the class docstring).
+
+        Returns:
+        --------
+        str
+        '''
+        for callback in event.callbacks or []:
+            owner = getattr(callback, '__self__', None)
+            if owner in self.process_types:
+                return self.process_types[owner]
+
+        return self.process_types.get(event, UNATTRIBUTED_EVENTS)
+
+    def step(self):
+        if self._queue:
+            self.processed += 1
+            self.events_processed[self.event_process_type(self._queue[0][3])] += 1
+        super().step()
+
+    def run(self, until=None):
+        start = time.perf_counter()
+        try:
+            return super().run(until)
+        finally:
+            self.run_seconds += time.perf_counter() - start
+
+    def summary(self):
+        '''
+        Totals for the run so far.
+
+        Returns:
+        --------
+        dict
+            'scheduled', 'processed', 'run_seconds', 'scheduled_per_second',
+            'processed_per_second', 'peak_queue_length' and
+            'peak_live_processes'
+        '''
+        return {
+            'scheduled': self.scheduled,
+            'processed': self.processed,
+            'run_seconds': self.run_seconds,
+            'scheduled_per_second': self.scheduled / self.run_seconds if self.run_seconds else None,
+            'processed_per_second': self.processed / self.run_seconds if self.run_seconds else None,
+            'peak_queue_length': self.peak_queue_length,
+            'peak_live_processes': self.peak_live_processes
+        }
+
+    def process_frame(self):
+        '''
+        Processes started and events processed for each type of process,
+        most events first.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Indexed by process type, with the columns 'processes_started',
+            'events_processed' and 'share_of_events'
+        '''
+        df = pd.DataFrame({'processes_started': pd.Series(self.processes_started, dtype='int64'),
+                           'events_processed': pd.Series(self.events_processed, dtype='int64')}) \
+               .fillna(0).astype('int64')
+        df['share_of_events'] = df['events_processed'] / max(self.processed, 1)
+        df.index.name = 'process_type'
+        return df.sort_values('events_processed', ascending=False)
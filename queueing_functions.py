@@ -0,0 +1,1091 @@
+'''
+Queueing functions
+
+Runs replications of the simplest model (patients arrive, wait for a
+nurse, are treated and leave) and of the model with an optional step
+(patients are examined, then some are treated) without SimPy.
+
+With a single first-come-first-served stage, each patient starts treatment
+when they arrive or when the nurse who will next be free finishes,
+whichever is later, so there is no need for an event queue. The optional
+step is a second stage of the same kind: the patients who need treatment
+arrive at it as they finish their examination, so the stages are worked
+out one after the other. All replications are simulated at once ("in
+lockstep"): each step of the loops below handles the next patient of every
+replication with the same numpy operations, so the time taken grows far
+more slowly than the number of replications.
+
+Every replication uses the same random number streams, sampled in the same
+order, as `multiple_replications` does for the SimPy model, so the summary
+results and event logs are identical.
+
+If numba is installed, the arrivals and the stage are instead worked out
+one replication at a time by the compiled loops in accelerated_functions,
+which give the same results.
+'''
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+from model_classes import (DEFAULT_RESULTS_COLLECTION_PERIOD, EVENT_LOG_COLUMNS,
+                           EVENT_TYPE_CATEGORIES, PATHWAY_CATEGORIES, EVENT_CATEGORIES,
+                           replication_seeds)
+from profiling_classes import profile_stage
+from accelerated_functions import numba_enabled, thinning_kernel, fifo_kernel
+
+# Models that can be run by `lockstep_replications`
+LOCKSTEP_MODELS = ['simplest', 'simple_with_branch']
+
+# Number of samples drawn from each replication's random number stream at a time
+DRAW_BLOCK_SIZE = 1024
+
+# Number of candidate arrival times tested at once when thinning
+THINNING_WINDOW = 32
+
+
+class ReplicationDraws:
+    '''
+    Samples from a distribution of each replication, handed out in order.
+
+    The samples are drawn in blocks, so each replication gets the same values
+    (from its own random number stream) as sampling one at a time would give.
+    '''
+    def __init__(self, distributions, block_size=DRAW_BLOCK_SIZE):
+        '''
+        Constructor
+
+        Params:
+        -------
+        distributions: list
+            The distribution of each replication (e.g. Exponential).
+            Must take a `size` argument to `sample`.
+
+        block_size: int, optional (default=DRAW_BLOCK_SIZE)
+            Number of samples drawn from each distribution at first
+        '''
+        self.distributions = distributions
+        self.draws = np.stack([distribution.sample(size=block_size)
+                               for distribution in distributions])
+        self.used = np.zeros(len(distributions), dtype=np.int64)
+
+    def next(self, reps):
+        '''
+        The next sample of each of the replications `reps`
+
+        Params:
+        -------
+        reps: numpy.ndarray
+            Indices of the replications (each at most once)
+
+        Returns:
+        --------
+        numpy.ndarray
+        '''
+        samples = self.window(reps, 1)[:, 0]
+        self.used[reps] += 1
+        return samples
+
+    def window(self, reps, width):
+        '''
+        The next `width` samples of each of the replications `reps`,
+        without using them up (see `advance`)
+
+        Returns:
+        --------
+        numpy.ndarray
+            One row per replication
+        '''
+        while self.used[reps].max() + width > self.draws.shape[1]:
+            self.draw_more()
+
+        return self.draws[reps[:, None], self.used[reps, None] + np.arange(width)]
+
+    def advance(self, reps, counts):
+        '''
+        Use up `counts` samples of each of the replications `reps`
+        '''
+        self.used[reps] += counts
+
+    def draw_more(self):
+        '''
+        Double the number of samples drawn from each distribution
+        '''
+        more = np.stack([distribution.sample(size=self.draws.shape[1])
+                         for distribution in self.distributions])
+        self.draws = np.concatenate([self.draws, more], axis=1)
+
+
+def replication_scenarios(scenario, n_reps):
+    '''
+    A copy of the scenario for each replication, with the random number
+    set that replication uses in `multiple_replications`.
+
+    The scenario passed in isn't changed.
+
+    Params:
+    -------
+    scenario: Scenario
+
+    n_reps: int
+
+    Returns:
+    --------
+    list of Scenario
+    '''
+    scenarios = []
+
+    for seed in replication_seeds(scenario.random_number_set, n_reps):
+        rep_scenario = copy.copy(scenario)
+        rep_scenario.set_random_no_set(seed)
+        scenarios.append(rep_scenario)
+
+    return scenarios
+
+
+def replication_samples(distributions, sizes):
+    '''
+    Sample `sizes[rep]` values from the distribution of each replication.
+
+    Returns:
+    --------
+    numpy.ndarray
+        One row per replication, padded with zeros to the largest size
+    '''
+    samples = np.zeros((len(distributions), max(sizes, default=0)))
+
+    for rep, (distribution, size) in enumerate(zip(distributions, sizes)):
+        samples[rep, :size] = distribution.sample(size=size)
+
+    return samples
+
+
+def nspp_arrival_times(scenarios, rc_period):
+    '''
+    Arrival times of every replication up to the end of the results
+    collection period.
+
+    Works as the arrivals generators of the models do: the gap to the next
+    arrival is sampled by thinning (from the arrival rate of the hour of the
+    previous arrival), or from the manual arrival rate if the scenario
+    overrides the arrival rate.
+
+    Params:
+    -------
+    scenarios: list of Scenario
+        One per replication (see replication_scenarios)
+
+    rc_period: float
+
+    Returns:
+    --------
+    numpy.ndarray
+        One row per replication, padded with np.inf after its last arrival
+    '''
+    n_reps = len(scenarios)
+
+    if numba_enabled():
+        rep_arrivals = [replication_arrival_times(scenario, rc_period) for scenario in scenarios]
+        arrivals = np.full((n_reps, max(len(times) for times in rep_arrivals)), np.inf)
+        for rep, times in enumerate(rep_arrivals):
+            arrivals[rep, :len(times)] = times
+        return arrivals
+
+    inter_arrival = ReplicationDraws([scenario.arrival_dist for scenario in scenarios])
+
+    thresholds = None
+    if not scenarios[0].override_arrival_rate:
+        thinning = ReplicationDraws([scenario.thinning_rng for scenario in scenarios])
+        thresholds = scenarios[0].arrivals['arrival_rate'].to_numpy() / scenarios[0].lambda_max
+
+    now = np.zeros(n_reps)
+    reps = np.arange(n_reps)
+    arrivals = []
+
+    # one step per arrival, for every replication still running
+    while len(reps):
+        if thresholds is None:
+            interarrival_time = inter_arrival.next(reps)
+        else:
+            interarrival_time = thinned_interarrival_times(
+                reps, inter_arrival, thinning,
+                thresholds[(now[reps] // 60).astype(np.int64) % len(thresholds)])
+
+        now[reps] += interarrival_time
+        reps = reps[now[reps] < rc_period]
+
+        arrival = np.full(n_reps, np.inf)
+        arrival[reps] = now[reps]
+        arrivals.append(arrival)
+
+    # (the last step has no arrivals)
+    return np.stack(arrivals[:-1], axis=1) if len(arrivals) > 1 else np.empty((n_reps, 0))
+
+
+def replication_arrival_times(scenario, rc_period, block_size=DRAW_BLOCK_SIZE):
+    '''
+    Arrival times of a single replication, sampled by `thinning_kernel`.
+
+    Params:
+    -------
+    scenario: Scenario
+        The scenario of the replication (see replication_scenarios)
+
+    rc_period: float
+
+    block_size: int, optional (default=DRAW_BLOCK_SIZE)
+        Number of candidate arrivals sampled at a time
+
+    Returns:
+    --------
+    numpy.ndarray
+    '''
+    if scenario.override_arrival_rate:
+        # every candidate is accepted
+        thresholds = np.ones(1)
+        def sample_uniforms(size):
+            return np.zeros(size)
+    else:
+        thresholds = scenario.arrivals['arrival_rate'].to_numpy() / scenario.lambda_max
+        sample_uniforms = scenario.thinning_rng.sample
+
+    gaps = scenario.arrival_dist.sample(size=block_size)
+    uniforms = sample_uniforms(block_size)
+    arrivals = np.empty(block_size)
+    now, n_arrivals = 0.0, 0
+
+    while True:
+        now, n_arrivals, used, finished = thinning_kernel(gaps, uniforms, thresholds, now,
+                                                          rc_period, arrivals, n_arrivals)
+        if finished:
+            return arrivals[:n_arrivals]
+
+        if n_arrivals == len(arrivals):
+            arrivals = np.concatenate([arrivals, np.empty(len(arrivals))])
+
+        gaps = np.concatenate([gaps[used:], scenario.arrival_dist.sample(size=block_size)])
+        uniforms = np.concatenate([uniforms[used:], sample_uniforms(block_size)])
+
+
+def thinned_interarrival_times(reps, inter_arrival, thinning, threshold,
+                               window=THINNING_WINDOW):
+    '''
+    The time to the next arrival of each replication, by thinning: the
+    sampled gaps are added up until a uniform sample is below the threshold
+    (lambda_t / lambda_max) of the replication.
+
+    Rather than testing one candidate of every replication at a time, the
+    next `window` candidates are tested at once. The gaps are added up by
+    a cumulative sum, which adds them one after another, as the arrivals
+    generators do.
+
+    Params:
+    -------
+    reps: numpy.ndarray
+        Indices of the replications
+
+    inter_arrival, thinning: ReplicationDraws
+        Exponential gaps and uniform samples
+
+    threshold: numpy.ndarray
+        Threshold of each replication in `reps`
+
+    window: int, optional (default=THINNING_WINDOW)
+
+    Returns:
+    --------
+    numpy.ndarray
+    '''
+    interarrival_time = np.zeros(len(reps))
+    rejected = np.arange(len(reps))
+
+    while len(rejected):
+        rows = reps[rejected]
+
+        gaps = inter_arrival.window(rows, window)
+        gaps[:, 0] += interarrival_time[rejected]
+        totals = np.cumsum(gaps, axis=1)
+
+        accepted = thinning.window(rows, window) < threshold[rejected, None]
+        found = accepted.any(axis=1)
+        n_samples = np.where(found, accepted.argmax(axis=1) + 1, window)
+
+        interarrival_time[rejected] = totals[np.arange(len(rows)), n_samples - 1]
+        inter_arrival.advance(rows, n_samples)
+        thinning.advance(rows, n_samples)
+
+        rejected = rejected[~found]
+
+    return interarrival_time
+
+
+def fifo_multi_server(arrival_times, durations, n_servers):
+    '''
+    Start and end times of a first-come-first-served stage with
+    `n_servers` identical servers, for every replication.
+
+    Each patient, in order of arrival, takes the server that is free
+    soonest (the one that has been free longest if several are already
+    free, as a simpy.Store of resources hands them out).
+
+    Params:
+    -------
+    arrival_times: numpy.ndarray
+        One row per replication, in order of arrival
+        (np.inf for patients who don't arrive)
+
+    durations: numpy.ndarray
+        The time each patient uses the server, the same shape as arrival_times
+
+    n_servers: int
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (start times, end times, server ids numbered from 1),
+        each the same shape as arrival_times
+    '''
+    n_reps, n_patients = arrival_times.shape
+
+    if numba_enabled():
+        start = np.empty_like(arrival_times)
+        end = np.empty_like(arrival_times)
+        server = np.empty(arrival_times.shape, dtype=np.int64)
+        fifo_kernel(np.ascontiguousarray(arrival_times), np.ascontiguousarray(durations),
+                    n_servers, start, end, server)
+        return start, end, server
+
+    # patients by row, so each step reads and writes contiguous memory
+    arrival_times = np.ascontiguousarray(arrival_times.T)
+    durations = np.ascontiguousarray(durations.T)
+    start = np.empty_like(arrival_times)
+    end = np.empty_like(arrival_times)
+    server = np.empty(arrival_times.shape, dtype=np.int64)
+
+    free_at = np.zeros((n_reps, n_servers))
+    reps = np.arange(n_reps)
+
+    for patient in range(n_patients):
+        server[patient] = free_at.argmin(axis=1)
+        start[patient] = np.maximum(arrival_times[patient], free_at[reps, server[patient]])
+        end[patient] = start[patient] + durations[patient]
+        free_at[reps, server[patient]] = end[patient]
+
+    return start.T, end.T, server.T + 1
+
+
+def event_log_frame(model_name, blocks, float32_times=False):
+    '''
+    An event log in the form returned by `event_log_to_frame`,
+    built from arrays of events rather than a list of dictionaries.
+
+    Events are sorted by time. Events at the same time are sorted in the
+    order of their blocks (which should be the order SimPy would log them
+    in), then by patient.
+
+    If the blocks have a 'rep' array, the log is of several replications
+    in long format (as returned by `collate_replications`): sorted by
+    replication first, with a 'rep' column.
+
+    Params:
+    -------
+    model_name: str
+
+    blocks: list of dict
+        Each with the keys 'pathway', 'event_type', 'event' (str),
+        'patient' and 'time' (arrays), and optionally 'resource_id' and
+        'rep' (arrays)
+
+    float32_times: bool, optional (default=False)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    def codes(block, key, categories):
+        return np.full(len(block['patient']), categories.index(block[key]), dtype=np.int8)
+
+    def resource_ids(block):
+        if 'resource_id' in block:
+            return block['resource_id']
+        return np.zeros(len(block['patient']), dtype=np.int64)
+
+    patient = np.concatenate([block['patient'] for block in blocks]).astype(np.int32)
+    time = np.concatenate([block['time'] for block in blocks])
+    order = np.concatenate([np.full(len(block['patient']), i) for i, block in enumerate(blocks)])
+    long_format = 'rep' in blocks[0]
+
+    if long_format:
+        rep = np.concatenate([block['rep'] for block in blocks]).astype(np.int16)
+        rows = np.lexsort((patient, order, time, rep))
+    else:
+        rows = np.lexsort((patient, order, time))
+
+    def column(values):
+        return np.concatenate(values)[rows]
+
+    event_log = pd.DataFrame({
+        'patient': patient[rows],
+        'pathway': pd.Categorical.from_codes(
+            column([codes(block, 'pathway', PATHWAY_CATEGORIES[model_name])
+                    for block in blocks]),
+            categories=PATHWAY_CATEGORIES[model_name]),
+        'event_type': pd.Categorical.from_codes(
+            column([codes(block, 'event_type', EVENT_TYPE_CATEGORIES) for block in blocks]),
+            categories=EVENT_TYPE_CATEGORIES),
+        'event': pd.Categorical.from_codes(
+            column([codes(block, 'event', EVENT_CATEGORIES[model_name]) for block in blocks]),
+            categories=EVENT_CATEGORIES[model_name]),
+        'time': time[rows].astype(np.float32 if float32_times else np.float64),
+        'resource_id': pd.arrays.IntegerArray(
+            column([resource_ids(block) for block in blocks]).astype(np.int8),
+            column([np.full(len(block['patient']), 'resource_id' not in block)
+                    for block in blocks]))
+    }, columns=EVENT_LOG_COLUMNS)
+
+    if long_format:
+        event_log['rep'] = rep[rows]
+
+    return event_log
+
+
+def busy_time(start, duration, warm_up):
+    '''
+    Total time after the warm-up that resources were in use, as
+    `SimulationSummary.get_resource_util` counts it (with no warm-up,
+    the total of the durations).
+
+    Params:
+    -------
+    start, duration: numpy.ndarray
+        Of each use of the resources that started before the end of the
+        run, in order of arrival
+
+    warm_up: float
+
+    Returns:
+    --------
+    float
+    '''
+    return np.clip(duration - np.clip(warm_up - start, 0, None), 0, None).sum()
+
+
+def wait_target_met(wait, started):
+    '''
+    Proportion of the patients who started a stage who waited less than
+    120 minutes, as `SimulationSummary.get_perc_wait_target_met` works it
+    out (np.nan if none of them started).
+
+    Params:
+    -------
+    wait: numpy.ndarray
+        Waiting time of each patient (-np.inf if they haven't started,
+        which counts as meeting the target)
+
+    started: numpy.ndarray of bool
+
+    Returns:
+    --------
+    float
+    '''
+    n_started = int(np.count_nonzero(started))
+    if n_started == 0:
+        return np.nan
+    return int(np.count_nonzero(wait < 120)) / n_started
+
+
+def simplest_results(arrival, start, end, duration, n_servers, rc_period, warm_up=0):
+    '''
+    The summary results of one replication of the simplest model,
+    worked out as `SimulationSummary.process_run_results` does.
+
+    Params:
+    -------
+    arrival, start, end, duration: numpy.ndarray
+        Times for each patient who arrived, in order of arrival
+
+    n_servers: int
+
+    rc_period: float
+
+    warm_up: float, optional (default=0)
+        The run ends at warm_up + rc_period. Patients who arrived during
+        the warm-up only count towards the utilisation after it.
+
+    Returns:
+    --------
+    dict
+    '''
+    run_end = warm_up + rc_period
+    in_use = start < run_end
+
+    # the utilisation of every patient's time with a nurse after the warm-up
+    util = busy_time(start[in_use], duration[in_use], warm_up) / (rc_period * n_servers)
+
+    recorded = arrival >= warm_up
+    arrival, start, end = arrival[recorded], start[recorded], end[recorded]
+
+    started = start < run_end
+    finished = end < run_end
+
+    wait = np.where(started, start - arrival, -np.inf)
+
+    return {'00_arrivals': len(arrival),
+            '01a_treatment_wait': wait[started].mean(),
+            '01b_treatment_util': util,
+            '01c_treatment_wait_target_met': wait_target_met(wait, started),
+            '08_total_time': (end - arrival)[finished].mean(),
+            '09_throughput': int(np.count_nonzero(finished))}
+
+
+def simplest_event_log(patient, arrival, start, end, server, rc_period, rep=None,
+                       float32_times=False, warm_up=0):
+    '''
+    The event log of the simplest model
+
+    Params:
+    -------
+    patient, arrival, start, end, server: numpy.ndarray
+        For each patient who arrived
+
+    rc_period: float
+
+    rep: numpy.ndarray, optional (default=None)
+        The replication of each patient, to give a log of several
+        replications in long format (see event_log_frame)
+
+    float32_times: bool, optional (default=False)
+
+    warm_up: float, optional (default=0)
+        The patients passed (in order of arrival) are those who arrived after the warm-up, and
+        the run ends at warm_up + rc_period
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    run_end = warm_up + rc_period
+    started = start < run_end
+    finished = end < run_end
+
+    def block(event_type, event, mask, time, resource=False):
+        events = {'pathway': 'Simplest', 'event_type': event_type, 'event': event,
+                  'patient': patient[mask], 'time': time[mask]}
+        if resource:
+            events['resource_id'] = server[mask]
+        if rep is not None:
+            events['rep'] = rep[mask]
+        return events
+
+    everyone = np.ones(len(arrival), dtype=bool)
+
+    # at the time a patient finishes, they leave before the next patient
+    # in the queue starts with their nurse
+    return event_log_frame('simplest', [
+        block('resource_use_end', 'treatment_complete', finished, end, resource=True),
+        block('arrival_departure', 'depart', finished, end),
+        block('arrival_departure', 'arrival', everyone, arrival),
+        block('queue', 'treatment_wait_begins', everyone, arrival),
+        block('resource_use', 'treatment_begins', started, start, resource=True)
+    ], float32_times=float32_times)
+
+
+def branched_results(arrival, exam_start, exam_duration, treat_start, treat_arrival,
+                     treat_duration, depart, n_exam, n_treatment, rc_period, warm_up=0):
+    '''
+    The summary results of one replication of the model with an optional
+    step, worked out as `SimulationSummary.process_run_results` does.
+
+    Params:
+    -------
+    arrival, exam_start, exam_duration: numpy.ndarray
+        Times for each patient who arrived, in order of arrival
+
+    treat_start, treat_arrival, treat_duration: numpy.ndarray
+        Times for each patient who arrived (np.inf for those who don't
+        join the queue for treatment), in order of arrival
+
+    depart: numpy.ndarray
+        The time each patient leaves (np.inf if they don't)
+
+    n_exam, n_treatment: int
+        Number of nurses examining and treating patients
+
+    rc_period: float
+
+    warm_up: float, optional (default=0)
+        The run ends at warm_up + rc_period. Patients who arrived during
+        the warm-up only count towards the utilisation after it.
+
+    Returns:
+    --------
+    dict
+    '''
+    run_end = warm_up + rc_period
+    examined = exam_start < run_end
+    treated = treat_start < run_end
+
+    # the utilisation of every patient's time with a nurse after the warm-up
+    exam_util = busy_time(exam_start[examined], exam_duration[examined],
+                          warm_up) / (rc_period * n_exam)
+    treat_util = busy_time(treat_start[treated], treat_duration[treated],
+                           warm_up) / (rc_period * n_treatment)
+
+    recorded = arrival >= warm_up
+    examined, treated = examined[recorded], treated[recorded]
+    finished = depart[recorded] < run_end
+    arrival, exam_start = arrival[recorded], exam_start[recorded]
+
+    exam_wait = np.where(examined, exam_start - arrival, -np.inf)
+
+    return {'00_arrivals': len(arrival),
+            '01a_examination_wait': exam_wait[examined].mean(),
+            '01b_examination_util': exam_util,
+            '01c_examination_wait_target_met': wait_target_met(exam_wait, examined),
+            '02a_treatment_wait': (treat_start[recorded][treated]
+                                   - treat_arrival[recorded][treated]).mean(),
+            '02b_treatment_util': treat_util,
+            '08_total_time': (depart[recorded] - arrival)[finished].mean(),
+            '09_throughput': int(np.count_nonzero(finished))}
+
+
+def branched_event_log(patient, arrival, exam_start, exam_end, exam_server, requires,
+                       treat_start, treat_end, treat_server, rc_period, rep=None,
+                       float32_times=False, warm_up=0):
+    '''
+    The event log of the model with an optional step
+
+    Params:
+    -------
+    patient, arrival, exam_start, exam_end, exam_server: numpy.ndarray
+        For each patient who arrived
+
+    requires: numpy.ndarray of bool
+        Whether each patient needs treatment (False for those who
+        haven't finished their examination)
+
+    treat_start, treat_end, treat_server: numpy.ndarray
+        For each patient who arrived (np.inf, and a server of 0, for those
+        who don't join the queue for treatment)
+
+    rc_period: float
+
+    rep: numpy.ndarray, optional (default=None)
+        The replication of each patient, to give a log of several
+        replications in long format (see event_log_frame)
+
+    float32_times: bool, optional (default=False)
+
+    warm_up: float, optional (default=0)
+        The patients passed (in order of arrival) are those who arrived after the warm-up, and
+        the run ends at warm_up + rc_period
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    run_end = warm_up + rc_period
+    examined = exam_end < run_end
+    depart = np.where(requires, treat_end, exam_end)
+
+    def block(event_type, event, mask, time, server=None):
+        events = {'pathway': 'simple_with_branch', 'event_type': event_type,
+                  'event': event, 'patient': patient[mask], 'time': time[mask]}
+        if server is not None:
+            events['resource_id'] = server[mask]
+        if rep is not None:
+            events['rep'] = rep[mask]
+        return events
+
+    everyone = np.ones(len(arrival), dtype=bool)
+
+    # A patient finishing a stage logs everything up to joining the next
+    # queue (and starting treatment, if a nurse is free) before the next
+    # patient in the queue they leave starts with their nurse.
+    return event_log_frame('simple_with_branch', [
+        block('resource_use_end', 'treatment_ends', treat_end < run_end, treat_end,
+              treat_server),
+        block('resource_use_end', 'examination_complete', examined, exam_end, exam_server),
+        block('attribute_assigned', 'requires_treatment', examined & requires, exam_end),
+        block('attribute_assigned', 'does_not_require_treatment', examined & ~requires,
+              exam_end),
+        block('arrival_departure', 'depart', depart < run_end, depart),
+        block('arrival_departure', 'arrival', everyone, arrival),
+        block('queue', 'examination_wait_begins', everyone, arrival),
+        block('queue', 'treatment_wait_begins', examined & requires, exam_end),
+        block('resource_use', 'treatment_begins', treat_start < run_end, treat_start,
+              treat_server),
+        block('resource_use', 'examination_begins', exam_start < run_end, exam_start,
+              exam_server)
+    ], float32_times=float32_times)
+
+
+def simplest_stages(scenarios, arrival, n_arrivals):
+    '''
+    Simulate the treatment of the patients of every replication of the
+    simplest model.
+
+    Params:
+    -------
+    scenarios: list of Scenario
+        One per replication (see replication_scenarios)
+
+    arrival: numpy.ndarray
+        As returned by nspp_arrival_times
+
+    n_arrivals: numpy.ndarray
+        The number of patients who arrived in each replication
+
+    Returns:
+    --------
+    dict
+        'start', 'end', 'duration' and 'server', the same shape as `arrival`
+    '''
+    duration = replication_samples([scenario.treat_dist for scenario in scenarios],
+                                   n_arrivals)
+    start, end, server = fifo_multi_server(arrival, duration, scenarios[0].n_cubicles_1)
+
+    return {'start': start, 'end': end, 'duration': duration, 'server': server}
+
+
+def branched_stages(scenarios, arrival, n_arrivals, run_end):
+    '''
+    Simulate the examination and (optional) treatment of the patients of
+    every replication of the model with an optional step.
+
+    The patients who finish their examination each draw whether they need
+    treatment, in the order they finish (as the SimPy model samples them).
+    Those who do arrive at the treatment stage at the time they finish.
+
+    Params:
+    -------
+    scenarios: list of Scenario
+        One per replication (see replication_scenarios)
+
+    arrival: numpy.ndarray
+        As returned by nspp_arrival_times
+
+    n_arrivals: numpy.ndarray
+        The number of patients who arrived in each replication
+
+    run_end: float
+        The end of the run (including any warm-up)
+
+    Returns:
+    --------
+    dict
+        'exam_start', 'exam_end', 'exam_duration', 'exam_server', 'requires',
+        'treat_arrival', 'treat_start', 'treat_end', 'treat_duration' and
+        'treat_server', the same shape as `arrival`, in order of arrival
+    '''
+    exam_duration = replication_samples([scenario.exam_dist for scenario in scenarios],
+                                        n_arrivals)
+    exam_start, exam_end, exam_server = fifo_multi_server(arrival, exam_duration,
+                                                          scenarios[0].n_exam)
+
+    # patients in the order they finish their examination
+    by_exam_end = np.argsort(exam_end, axis=1, kind='stable')
+    n_examined = np.count_nonzero(exam_end < run_end, axis=1)
+    reps, position = np.nonzero(np.arange(arrival.shape[1]) < n_examined[:, None])
+
+    requires = np.zeros(arrival.shape, dtype=bool)
+    requires[reps, by_exam_end[reps, position]] = replication_samples(
+        [scenario.nt_p_treat_dist for scenario in scenarios], n_examined)[reps, position] == 1
+
+    # the queue for treatment, in order of arrival at it
+    queue = np.take_along_axis(
+        by_exam_end,
+        np.argsort(~np.take_along_axis(requires, by_exam_end, axis=1), axis=1, kind='stable'),
+        axis=1)
+    n_queued = np.count_nonzero(requires, axis=1)
+    queue = queue[:, :n_queued.max(initial=0)]
+    reps, position = np.nonzero(np.arange(queue.shape[1]) < n_queued[:, None])
+
+    queue_arrival = np.full(queue.shape, np.inf)
+    queue_arrival[reps, position] = exam_end[reps, queue[reps, position]]
+    queue_duration = replication_samples([scenario.nt_treat_dist for scenario in scenarios],
+                                         n_queued)
+    stage = fifo_multi_server(queue_arrival, queue_duration, scenarios[0].n_cubicles_1)
+
+    # back to the order of arrival at the model
+    simulation = {'exam_start': exam_start, 'exam_end': exam_end,
+                  'exam_duration': exam_duration, 'exam_server': exam_server,
+                  'requires': requires}
+    for name, values, missing in [('treat_arrival', queue_arrival, np.inf),
+                                  ('treat_start', stage[0], np.inf),
+                                  ('treat_end', stage[1], np.inf),
+                                  ('treat_duration', queue_duration, 0.0),
+                                  ('treat_server', stage[2], 0)]:
+        simulation[name] = np.full(arrival.shape, missing, dtype=values.dtype)
+        simulation[name][reps, queue[reps, position]] = values[reps, position]
+
+    return simulation
+
+
+def run_lockstep(scenario, rc_period, n_reps, profiler=None, warm_up=0):
+    '''
+    Simulate every replication of the model at once.
+
+    Params:
+    ------
+    scenario: Scenario
+        Parameters of the model. scenario.model must be one of LOCKSTEP_MODELS.
+
+    rc_period: float
+
+    n_reps: int
+
+    profiler: RunProfiler, optional (default=None)
+        If given, the time taken is recorded as the 'lockstep_run' stage.
+
+    warm_up: float, optional (default=0)
+        As for `single_run`. The patients who arrive during the warm-up
+        are simulated (they hold up those who arrive after them) but
+        aren't recorded.
+
+    Returns:
+    --------
+    dict
+        'model', 'warm_up', 'n_arrivals' (of each replication),
+        'n_warm_up' (the number who arrived during the warm-up), 'arrival'
+        and the results of the model's stages (see simplest_stages and
+        branched_stages), with one row per replication and one column per
+        patient in order of arrival
+    '''
+    if scenario.model not in LOCKSTEP_MODELS:
+        raise ValueError(f'The lockstep engine can only run the models {LOCKSTEP_MODELS}, '
+                         f'not {scenario.model!r}')
+
+    scenarios = replication_scenarios(scenario, n_reps)
+
+    with profile_stage(profiler, 'lockstep_run') as stage:
+        arrival = nspp_arrival_times(scenarios, warm_up + rc_period)
+        n_arrivals = np.isfinite(arrival).sum(axis=1)
+
+        if scenario.model == 'simplest':
+            simulation = simplest_stages(scenarios, arrival, n_arrivals)
+        else:
+            simulation = branched_stages(scenarios, arrival, n_arrivals, warm_up + rc_period)
+
+        stage['rows'] = int(n_arrivals.sum())
+
+    return dict(simulation, model=scenario.model, warm_up=warm_up, n_arrivals=n_arrivals,
+                n_warm_up=np.count_nonzero(arrival < warm_up, axis=1), arrival=arrival)
+
+
+def lockstep_summary_frame(scenario, rc_period, simulation, profiler=None):
+    '''
+    Summary results of every replication, one row per replication
+    indexed by rep (as `multiple_replications` returns them).
+
+    Params:
+    ------
+    scenario: Scenario
+
+    rc_period: float
+
+    simulation: dict
+        As returned by run_lockstep (which records the warm-up)
+
+    profiler: RunProfiler, optional (default=None)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    warm_up = simulation['warm_up']
+
+    with profile_stage(profiler, 'simulation_summary',
+                       rows=int(simulation['n_arrivals'].sum())):
+        if scenario.model == 'simplest':
+            results = [simplest_results(*[simulation[name][rep, :n]
+                                          for name in ['arrival', 'start', 'end', 'duration']],
+                                        scenario.n_cubicles_1, rc_period, warm_up)
+                       for rep, n in enumerate(simulation['n_arrivals'])]
+        else:
+            depart = np.where(simulation['requires'],
+                              simulation['treat_end'], simulation['exam_end'])
+            results = [branched_results(*[simulation[name][rep, :n]
+                                          for name in ['arrival', 'exam_start', 'exam_duration',
+                                                       'treat_start', 'treat_arrival',
+                                                       'treat_duration']],
+                                        depart[rep, :n],
+                                        scenario.n_exam, scenario.n_cubicles_1, rc_period,
+                                        warm_up)
+                       for rep, n in enumerate(simulation['n_arrivals'])]
+
+        summary_df = pd.DataFrame(results).astype(np.float64)
+        summary_df.index = np.arange(1, len(summary_df)+1)
+        summary_df.index.name = 'rep'
+
+    return summary_df
+
+
+def lockstep_event_log(rc_period, simulation, rep=None, float32_times=False):
+    '''
+    The event log of one replication (numbered from 1), or of every
+    replication in long format if rep is None.
+
+    Params:
+    ------
+    rc_period: float
+
+    simulation: dict
+        As returned by run_lockstep
+
+    rep: int, optional (default=None)
+
+    float32_times: bool, optional (default=False)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    '''
+    # the patients who arrived after the warm-up
+    columns = np.arange(simulation['arrival'].shape[1])
+    arrived = ((columns >= simulation['n_warm_up'][:, None])
+               & (columns < simulation['n_arrivals'][:, None]))
+    if rep is not None:
+        arrived[np.arange(len(arrived)) != rep - 1] = False
+
+    reps, patient = np.nonzero(arrived)
+
+    if simulation['model'] == 'simplest':
+        event_log, names = simplest_event_log, ['arrival', 'start', 'end', 'server']
+    else:
+        event_log, names = branched_event_log, ['arrival', 'exam_start', 'exam_end',
+                                                'exam_server', 'requires', 'treat_start',
+                                                'treat_end', 'treat_server']
+
+    return event_log(patient,
+                     *[simulation[name][arrived] for name in names],
+                     rc_period,
+                     rep=reps + 1 if rep is None else None,
+                     float32_times=float32_times,
+                     warm_up=simulation['warm_up'])
+
+
+def iter_lockstep_replications(scenario,
+                               rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                               n_reps=5,
+                               return_detailed_logs=False,
+                               float32_times=False,
+                               profiler=None,
+                               warm_up=0):
+    '''
+    Simulate every replication at once, then yield the results of each
+    in the same form as `iter_replications`.
+
+    Params:
+    ------
+    scenario: Scenario
+        Parameters of the model. scenario.model must be one of LOCKSTEP_MODELS.
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+
+    n_reps: int, optional (default=5)
+
+    return_detailed_logs: bool, optional (default=False)
+
+    float32_times: bool, optional (default=False)
+
+    profiler: RunProfiler, optional (default=None)
+        If given, the time spent simulating (the 'lockstep_run' stage),
+        building the logs and summarising the replications is recorded.
+
+    warm_up: float, optional (default=0)
+
+    Yields:
+    --------
+    pandas.DataFrame or dict
+    '''
+    simulation = run_lockstep(scenario, rc_period, n_reps, profiler, warm_up)
+    summary_df = lockstep_summary_frame(scenario, rc_period, simulation, profiler)
+
+    for rep in summary_df.index:
+        if not return_detailed_logs:
+            yield summary_df.loc[[rep]]
+            continue
+
+        with profile_stage(profiler, 'dataframe_conversion') as stage:
+            detailed_logs = {
+                'full_event_log': lockstep_event_log(rc_period, simulation, rep,
+                                                     float32_times=float32_times),
+                'patient_log': pd.DataFrame(),
+                'utilisation_audit': pd.DataFrame()
+            }
+            stage['rows'] = len(detailed_logs['full_event_log'])
+
+        rep_summary_df = summary_df.loc[[rep]]
+        rep_summary_df.index = ['1']
+        rep_summary_df.index.name = 'rep'
+
+        yield {'rep': rep, 'results': dict(detailed_logs, summary_df=rep_summary_df)}
+
+
+def lockstep_replications(scenario,
+                          rc_period=DEFAULT_RESULTS_COLLECTION_PERIOD,
+                          n_reps=5,
+                          return_detailed_logs=False,
+                          long_format=False,
+                          float32_times=False,
+                          profiler=None,
+                          warm_up=0):
+    '''
+    `multiple_replications` of one of LOCKSTEP_MODELS, with every replication
+    simulated at once with numpy rather than one after another in SimPy.
+
+    Takes the same parameters and gives identical results. The long format
+    logs are built for all the replications at once rather than collated
+    from the log of each.
+
+    Params:
+    ------
+    scenario: Scenario
+        scenario.model must be one of LOCKSTEP_MODELS
+
+    rc_period: float, optional (default=DEFAULT_RESULTS_COLLECTION_PERIOD)
+
+    n_reps: int, optional (default=5)
+
+    return_detailed_logs: bool, optional (default=False)
+
+    long_format: bool, optional (default=False)
+
+    float32_times: bool, optional (default=False)
+
+    profiler: RunProfiler, optional (default=None)
+
+    warm_up: float, optional (default=0)
+
+    Returns:
+    --------
+    pandas.DataFrame, list or dict
+        As for `multiple_replications`
+    '''
+    if not return_detailed_logs or not long_format:
+        results = list(iter_lockstep_replications(scenario,
+                                                  rc_period=rc_period,
+                                                  warm_up=warm_up,
+                                                  n_reps=n_reps,
+                                                  return_detailed_logs=return_detailed_logs,
+                                                  float32_times=float32_times,
+                                                  profiler=profiler))
+        return results if return_detailed_logs else pd.concat(results)
+
+    simulation = run_lockstep(scenario, rc_period, n_reps, profiler, warm_up)
+
+    with profile_stage(profiler, 'dataframe_conversion') as stage:
+        full_event_log = lockstep_event_log(rc_period, simulation,
+                                            float32_times=float32_times)
+        stage['rows'] = len(full_event_log)
+
+    summary_df = lockstep_summary_frame(scenario, rc_period, simulation, profiler)
+    summary_df.index = summary_df.index.astype(np.int16)
+
+    # (neither model records a patient log or utilisation audit)
+    return {'full_event_log': full_event_log,
+            'patient_log': pd.DataFrame({'rep': np.array([], dtype=np.int16)}),
+            'utilisation_audit': pd.DataFrame({'rep': np.array([], dtype=np.int16)}),
+            'summary_df': summary_df}
@@ -0,0 +1,215 @@
+'''
+Session results classes
+
+Storage for the results of every model run a user makes during a session,
+so that runs with different parameters can be compared.
+
+Rather than keeping the full results frame of every run, `SessionResults`
+keeps
+* one row of parameters per model run
+* the per-replication results of each run as float32
+* the median and quartiles of each metric for each run, calculated once
+  when the run is added
+
+Only the most recent `max_runs` runs are kept.
+'''
+
+import numpy as np
+import pandas as pd
+
+# Number of model runs kept for comparison before the oldest is dropped
+DEFAULT_MAX_SESSION_RUNS = 10
+
+# Scenario attributes recorded for each model run, and the labels used
+# when displaying them
+PARAMETER_LABELS = {
+    'n_triage': 'Triage\nCubicles',
+    'n_reg': 'Registration\nClerks',
+    'n_exam': 'Examination\nRooms',
+    'n_cubicles_1': 'Non-Trauma\nTreatment Cubicles',
+    'n_trauma': 'Trauma\nStabilisation Bays',
+    'n_cubicles_2': 'Trauma\nTreatment Cubicles',
+    'prob_trauma': 'Probability patient\nis a trauma patient',
+    'non_trauma_treat_p': 'Probability non-trauma patients\nrequire treatment',
+    'random_seed': 'Random Seed'
+}
+
+# Statistics stored in the aggregate table for each model run
+AGGREGATE_STATISTICS = {
+    'median': 0.5,
+    'lower_quartile': 0.25,
+    'upper_quartile': 0.75
+}
+
+
+class SessionResults:
+    '''
+    Bounded store of the results of each model run in a session.
+
+    Model runs are numbered from 1 in the order they are added. The numbers
+    are not reused when old runs are dropped, so a run keeps the same label
+    in the comparison charts for the whole session.
+    '''
+    def __init__(self, max_runs=DEFAULT_MAX_SESSION_RUNS):
+        '''
+        Constructor
+
+        Params:
+        -------
+        max_runs: int, optional (default=DEFAULT_MAX_SESSION_RUNS)
+            The number of most recent model runs to keep.
+        '''
+        self.max_runs = max_runs
+        self.runs_added = 0
+
+        # one row per model run
+        self.parameters = pd.DataFrame(
+            columns=list(PARAMETER_LABELS.keys()),
+            index=pd.Index([], name='Model Run')
+            )
+
+        # one row per replication, indexed by (Model Run, rep)
+        self.rep_results = pd.DataFrame()
+
+        # one row per statistic per model run, indexed by (Model Run, statistic)
+        self.aggregate = pd.DataFrame()
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def add_run(self, scenario, results, random_seed=None):
+        '''
+        Add the results of a model run, dropping the oldest run
+        if more than `max_runs` runs are now held.
+
+        Params:
+        -------
+        scenario: Scenario
+            The scenario the model was run with
+
+        results: pandas.DataFrame
+            The summary results of each replication, indexed by rep
+            (as returned by `multiple_replications`)
+
+        random_seed: int, optional (default=None)
+            The seed chosen by the user for the run
+
+        Returns:
+        --------
+        int
+            The number given to the model run
+        '''
+        self.runs_added += 1
+        model_run = self.runs_added
+
+        parameters = {name: getattr(scenario, name, None)
+                      for name in PARAMETER_LABELS if name != 'random_seed'}
+        parameters['random_seed'] = random_seed
+        self.parameters.loc[model_run] = parameters
+
+        results = results.copy()
+        results['perc_throughput'] = results['09_throughput'] / results['00_arrivals']
+
+        # aggregate from the full precision values before they are stored
+        aggregate = results.quantile(list(AGGREGATE_STATISTICS.values()))
+        aggregate.index = pd.MultiIndex.from_product(
+            [[model_run], list(AGGREGATE_STATISTICS.keys())],
+            names=['Model Run', 'statistic'])
+
+        results = results.astype(np.float32)
+        results.index = pd.MultiIndex.from_product(
+            [[model_run], results.index], names=['Model Run', 'rep'])
+
+        self.rep_results = pd.concat([self.rep_results, results])
+        self.aggregate = pd.concat([self.aggregate, aggregate])
+
+        while len(self.parameters) > self.max_runs:
+            self.drop_run(self.parameters.index[0])
+
+        return model_run
+
+    def drop_run(self, model_run):
+        '''
+        Remove a model run from the store.
+
+        Params:
+        -------
+        model_run: int
+            The number of the model run to remove
+        '''
+        self.parameters = self.parameters.drop(index=model_run)
+        self.rep_results = self.rep_results.drop(index=model_run, level='Model Run')
+        self.aggregate = self.aggregate.drop(index=model_run, level='Model Run')
+
+    def statistic_table(self, statistic='median', like=None):
+        '''
+        A statistic of each metric for every model run held.
+
+        Params:
+        -------
+        statistic: str, optional (default='median')
+            One of the keys of AGGREGATE_STATISTICS
+
+        like: str, optional (default=None)
+            If given, only metrics with names containing this
+            string are returned.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per metric and one column per model run
+        '''
+        table = self.aggregate.xs(statistic, level='statistic').T
+
+        if like is not None:
+            table = table.filter(like=like, axis=0)
+
+        return table
+
+    def long_statistic_table(self, statistic='median', like=None):
+        '''
+        `statistic_table` in long format, with the columns
+        'index' (the metric), 'model_run' and 'value'.
+
+        Returns:
+        --------
+        pandas.DataFrame
+        '''
+        return self.statistic_table(statistic, like) \
+            .reset_index(drop=False) \
+            .melt(id_vars="index", var_name="model_run")
+
+    def long_rep_results(self, like=None):
+        '''
+        The results of every replication of every model run held in long
+        format, with the columns 'Model Run', 'rep', 'variable' (the metric)
+        and 'value'.
+
+        Params:
+        -------
+        like: str, optional (default=None)
+            If given, only metrics with names containing this
+            string are returned.
+
+        Returns:
+        --------
+        pandas.DataFrame
+        '''
+        rep_results = self.rep_results
+
+        if like is not None:
+            rep_results = rep_results.filter(like=like, axis=1)
+
+        return rep_results.reset_index().melt(id_vars=["Model Run", "rep"])
+
+    def parameter_table(self):
+        '''
+        The parameters of every model run held, with one row per parameter
+        and one column per model run.
+
+        Returns:
+        --------
+        pandas.DataFrame
+        '''
+        return self.parameters.rename(columns=PARAMETER_LABELS).T \
+            .rename_axis('Parameter', axis=0)
@@ -0,0 +1,187 @@
+'''
+Timeline classes
+
+Random access to where every patient is at any point in a model run.
+
+`reshape_for_animations` works out where everyone is at every snapshot of
+the run up front. `StateTimeline` instead indexes the event log of a
+replication once, storing
+* the full state (the latest event of every patient in the model) every
+  `snapshot_every` minutes
+* the events sorted by time, which are the changes between these snapshots
+
+The state at any time is then the nearest earlier snapshot with the events
+since it applied, so only the frames being viewed need to be worked out.
+'''
+
+import numpy as np
+import pandas as pd
+
+from output_animation_functions import STATE_EVENT_TYPES
+
+# Default minutes between stored snapshots of the full state
+DEFAULT_SNAPSHOT_EVERY = 60
+
+
+class StateTimeline:
+    '''
+    Index of the state of every patient over one replication of a model run.
+
+    The state of a patient at time t is their most recent event at or before
+    t, from their arrival until their departure, as in
+    `reshape_for_animations`.
+
+    Looking up the state at time t costs a binary search for the nearest
+    snapshot and for the events since it (O(log n)), plus the work of
+    applying those k events to the stored snapshot.
+    '''
+    def __init__(self, full_event_log, rep=1, snapshot_every=DEFAULT_SNAPSHOT_EVERY,
+                 event_types=STATE_EVENT_TYPES):
+        '''
+        Constructor
+
+        Params:
+        -------
+        full_event_log: pandas.DataFrame
+            Long format event log. If it has a 'rep' column, only the
+            events of `rep` are used.
+
+        rep: int, optional (default=1)
+            The replication to index
+
+        snapshot_every: float, optional (default=DEFAULT_SNAPSHOT_EVERY)
+            Minutes between stored snapshots. Smaller values make lookups
+            quicker at the cost of memory.
+
+        event_types: list, optional (default=STATE_EVENT_TYPES)
+            The types of event that change a patient's state
+        '''
+        self.rep = rep
+        self.snapshot_every = snapshot_every
+
+        log = full_event_log[full_event_log['event_type'].isin(event_types)]
+        if 'rep' in log.columns:
+            log = log[log['rep'] == rep].drop(columns='rep')
+
+        # events in time order (events at the same time stay in log order)
+        order = np.lexsort((np.arange(len(log)), log['time'].to_numpy()))
+        self.events = log.iloc[order].reset_index(drop=True)
+
+        self.times = self.events['time'].to_numpy()
+        self.patients = self.events['patient'].to_numpy()
+        self.departs = (self.events['event'] == 'depart').to_numpy()
+
+        # Snapshots: the row of each patient's latest event at each snapshot time.
+        # Work these out from the events in (patient, time) order, searching for
+        # each patient's last event at or before the snapshot time
+        by_patient = np.lexsort((np.arange(len(self.events)), self.patients))
+        patient_ids, patient_starts = np.unique(self.patients[by_patient], return_index=True)
+        spacing = (self.times.max() if len(self.times) else 0) + 1
+        patient_rank = np.searchsorted(patient_ids, self.patients[by_patient])
+        keys = patient_rank * spacing + self.times[by_patient]
+
+        n_snapshots = int(np.floor((spacing - 1) / snapshot_every)) + 1
+        self.snapshot_times = np.arange(n_snapshots) * snapshot_every
+        self.snapshots = []
+
+        for snapshot_time in self.snapshot_times:
+            last = np.searchsorted(keys, np.arange(len(patient_ids)) * spacing + snapshot_time,
+                                   side='right') - 1
+            started = last >= patient_starts
+            rows = by_patient[last[started]]
+            self.snapshots.append(np.sort(self.current_rows(rows, snapshot_time)))
+
+    def __len__(self):
+        return len(self.events)
+
+    def current_rows(self, rows, time):
+        '''
+        The rows of patients who are still in the model at `time`
+        (everyone apart from those who departed before it).
+        '''
+        return rows[~(self.departs[rows] & (self.times[rows] < time))]
+
+    def state_rows(self, time):
+        '''
+        The rows of self.events holding the state of each patient in the
+        model at `time`, in order of the time the state was entered.
+
+        Params:
+        -------
+        time: float
+
+        Returns:
+        --------
+        numpy.ndarray
+        '''
+        snapshot = int(np.clip(np.searchsorted(self.snapshot_times, time, side='right') - 1,
+                               0, len(self.snapshot_times) - 1))
+
+        start = np.searchsorted(self.times, self.snapshot_times[snapshot], side='right')
+        end = np.searchsorted(self.times, time, side='right')
+
+        # the snapshot plus the events since, keeping each patient's latest
+        rows = np.r_[self.snapshots[snapshot], np.arange(start, end)]
+        rows = rows[np.lexsort((-rows, self.patients[rows]))]
+        latest = np.ones(len(rows), dtype=bool)
+        latest[1:] = self.patients[rows][1:] != self.patients[rows][:-1]
+        rows = rows[latest]
+
+        return np.sort(self.current_rows(rows, time))
+
+    def state_at(self, time):
+        '''
+        Where every patient in the model is at `time`.
+
+        Params:
+        -------
+        time: float
+
+        Returns:
+        --------
+        pandas.DataFrame
+            The latest event of each patient in the model
+        '''
+        return self.events.iloc[self.state_rows(time)]
+
+    def states_between(self, start, end, step, exit_step=True):
+        '''
+        Where every patient in the model is at each of
+        start, start + step, ... up to and including end.
+
+        Params:
+        -------
+        start, end: float
+            First and last snapshot times
+
+        step: float
+            Time between snapshots
+
+        exit_step: bool, optional (default=True)
+            As in `reshape_for_animations`, add an 'exit' row for each patient
+            at the snapshot after the last one they appear in.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            The latest event of each patient in the model at each snapshot,
+            with the snapshot time in the column 'minute' and the replication
+            in the column 'rep', sorted by minute and event. Can be passed to
+            `animate_activity_log` as the full_patient_df.
+        '''
+        minutes = np.arange(start, end + step, step)
+        minutes = minutes[minutes <= end]
+
+        state_rows = [self.state_rows(minute) for minute in minutes]
+
+        states = self.events.iloc[np.concatenate(state_rows)].assign(
+            minute=np.repeat(minutes, [len(rows) for rows in state_rows]),
+            rep=self.rep)
+
+        if exit_step:
+            final_step = states.drop_duplicates('patient', keep='last').copy()
+            final_step['minute'] = final_step['minute'] + step
+            final_step['event'] = 'exit'
+            states = pd.concat([states.astype({'event': str}), final_step])
+
+        return states.sort_values(['minute', 'event'], kind='stable')